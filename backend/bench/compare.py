@@ -0,0 +1,90 @@
+"""
+Compare two benchmark or replay result files.
+
+    python -m bench.compare baseline.json candidate.json --threshold 10
+
+Prints p50/p99 and throughput per scenario side by side with the relative
+change. Exits with status 1 when any scenario's p99 (or error count) regressed
+by more than ``--threshold`` percent, so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+from typing import Optional
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def change_pct(before: float, after: float) -> Optional[float]:
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def fmt_change(pct: Optional[float]) -> str:
+    return "n/a" if pct is None else f"{pct:+.1f}%"
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> dict:
+    rows = {}
+    for key in sorted(set(baseline["results"]) & set(candidate["results"])):
+        before, after = baseline["results"][key], candidate["results"][key]
+        p99_change = change_pct(before["latency_ms"]["p99"], after["latency_ms"]["p99"])
+        rows[key] = {
+            "p50_ms": [before["latency_ms"]["p50"], after["latency_ms"]["p50"]],
+            "p50_change_pct": change_pct(before["latency_ms"]["p50"], after["latency_ms"]["p50"]),
+            "p99_ms": [before["latency_ms"]["p99"], after["latency_ms"]["p99"]],
+            "p99_change_pct": p99_change,
+            "throughput_rps": [before["throughput_rps"], after["throughput_rps"]],
+            "errors": [before["errors"], after["errors"]],
+            "regressed": (p99_change is not None and p99_change > threshold) or after["errors"] > before["errors"],
+        }
+    return {
+        "baseline": baseline["meta"].get("git_commit"),
+        "candidate": candidate["meta"].get("git_commit"),
+        "threshold_pct": threshold,
+        "only_in_baseline": sorted(set(baseline["results"]) - set(candidate["results"])),
+        "only_in_candidate": sorted(set(candidate["results"]) - set(baseline["results"])),
+        "scenarios": rows,
+    }
+
+
+def print_table(report: dict) -> None:
+    print(f"baseline {report['baseline']} -> candidate {report['candidate']}")
+    header = f"{'scenario':<40} {'p50 ms':>17} {'':>8} {'p99 ms':>17} {'':>8} {'rps':>15} {'errors':>9}"
+    print(header)
+    print("-" * len(header))
+    for key, row in report["scenarios"].items():
+        marker = "  <-- regression" if row["regressed"] else ""
+        print(
+            f"{key:<40} "
+            f"{row['p50_ms'][0]:>8.1f}/{row['p50_ms'][1]:<8.1f} {fmt_change(row['p50_change_pct']):>8} "
+            f"{row['p99_ms'][0]:>8.1f}/{row['p99_ms'][1]:<8.1f} {fmt_change(row['p99_change_pct']):>8} "
+            f"{row['throughput_rps'][0]:>7.0f}/{row['throughput_rps'][1]:<7.0f} "
+            f"{row['errors'][0]:>4}/{row['errors'][1]:<4}{marker}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two bench result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed p99 regression in percent")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args()
+
+    report = compare(load(args.baseline), load(args.candidate), args.threshold)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+
+    if any(row["regressed"] for row in report["scenarios"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
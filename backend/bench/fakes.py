@@ -0,0 +1,133 @@
+"""
+Local stand-ins for the third-party services the API calls.
+
+    python -m bench.fakes --port 8900 --latency-ms 40
+
+Then start the API under test pointing at it:
+
+    RESEND_API_KEY=fake RESEND_API_URL=http://localhost:8900 \\
+    GOOGLE_CLIENT_ID=fake GOOGLE_CLIENT_SECRET=fake \\
+    GOOGLE_OAUTH_BASE_URL=http://localhost:8900 GOOGLE_API_BASE_URL=http://localhost:8900 \\
+    DATABASE_NAME=lms_bench uvicorn main:app --port 8000
+
+Endpoints:
+    POST /emails                 Resend: accepts any message, returns an id
+    POST /token                  Google: exchanges any code for an access token
+                                 and an RS256 ID token
+    GET  /oauth2/v2/userinfo     Google: profile for the token's code
+    GET  /oauth2/v3/certs        Google: JWKS with the locally generated key
+
+A Google code ``bench-<n>`` always maps to ``google_bench_<n>@bench.example.com``,
+so replays create each Google user once and log them in afterwards. The
+artificial latency keeps the fakes from flattering the numbers.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import FastAPI, Form, Header, HTTPException, Response
+
+app = FastAPI(title="Zyneth third-party fakes")
+app.state.latency = 0.0
+
+# Generated per process, published through /oauth2/v3/certs
+SIGNING_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+SIGNING_KID = uuid.uuid4().hex
+
+
+async def _delay():
+    if app.state.latency:
+        await asyncio.sleep(app.state.latency)
+
+
+@app.post("/emails")
+async def resend_send_email(payload: dict):
+    await _delay()
+    return {"id": str(uuid.uuid4())}
+
+
+def google_profile(code: str) -> dict:
+    local_part = f"google_{code.replace('-', '_')}"
+    return {
+        "sub": code,
+        "email": f"{local_part}@bench.example.com",
+        "email_verified": True,
+        "name": f"Google {code}",
+        "picture": None,
+    }
+
+
+@app.post("/token")
+async def google_token(
+    code: str = Form(...),
+    client_id: str = Form(None),
+    grant_type: str = Form("authorization_code")
+):
+    await _delay()
+    now = int(time.time())
+    claims = {
+        "iss": "https://accounts.google.com",
+        "aud": client_id,
+        "iat": now,
+        "exp": now + 3600,
+        **google_profile(code),
+    }
+    id_token = jwt.encode(claims, SIGNING_KEY, algorithm="RS256", headers={"kid": SIGNING_KID})
+    return {
+        "access_token": f"fake-access-{code}",
+        "id_token": id_token,
+        "expires_in": 3599,
+        "scope": "openid email profile",
+        "token_type": "Bearer",
+    }
+
+
+@app.get("/oauth2/v3/certs")
+async def google_certs():
+    await _delay()
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(SIGNING_KEY.public_key()))
+    jwk.update({"kid": SIGNING_KID, "alg": "RS256", "use": "sig"})
+    return Response(
+        content=json.dumps({"keys": [jwk]}),
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"},
+    )
+
+
+@app.get("/oauth2/v2/userinfo")
+async def google_userinfo(authorization: str = Header(...)):
+    await _delay()
+    prefix = "Bearer fake-access-"
+    if not authorization.startswith(prefix):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    code = authorization[len(prefix):]
+    profile = google_profile(code)
+    return {
+        "id": code,
+        "sub": code,
+        "email": profile["email"],
+        "verified_email": True,
+        "name": profile["name"],
+        "picture": profile["picture"],
+    }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run local Resend/Google stand-ins")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every response")
+    args = parser.parse_args()
+
+    app.state.latency = args.latency_ms / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Microbenchmark: cost per document of turning MongoDB documents into users.
+
+    python -m bench.hydration --users 10000 --rounds 5
+
+Compares, for a listing of ``--users`` seeded-shape documents:
+
+    validated  User(**doc): full Pydantic validation, EmailStr parsing included
+    trusted    UserCRUD._user_from_db: model_construct, no validation
+
+each alone ("hydrate") and followed by what the listing endpoint does with
+the result, validating into UserOut and serializing to JSON ("+ response").
+The best of ``--rounds`` runs is reported, in microseconds per document.
+"""
+import argparse
+import random
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, List
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from bench.seed import make_user
+from crud.user import UserCRUD
+from models.user import User
+from schemas.user import UserOut
+
+LISTING = TypeAdapter(List[UserOut])
+
+
+def best_of(rounds: int, func: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = perf_counter()
+        func()
+        best = min(best, perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare validated and trusted user hydration")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    docs = [{"_id": ObjectId(), **make_user(i, rng, "$2b$12$" + "x" * 53, now)} for i in range(args.users)]
+    # Only the conversion helpers are used, no database is needed
+    crud = UserCRUD.__new__(UserCRUD)
+
+    def validated():
+        return [User(**crud._convert_objectids_to_strings(doc)) for doc in docs]
+
+    def trusted():
+        return [crud._user_from_db(doc) for doc in docs]
+
+    def respond(hydrate):
+        return lambda: LISTING.dump_json(LISTING.validate_python(hydrate(), from_attributes=True))
+
+    assert LISTING.dump_json(validated()[:100]) == LISTING.dump_json(trusted()[:100])
+
+    print(f"{args.users} documents, best of {args.rounds} (us per document)")
+    results = {}
+    for label, func in (("validated", validated), ("trusted", trusted)):
+        hydrate_us = best_of(args.rounds, func) / args.users * 1e6
+        response_us = best_of(args.rounds, respond(func)) / args.users * 1e6
+        results[label] = hydrate_us
+        print(f"  {label:<10} hydrate {hydrate_us:7.2f}   + response {response_us:7.2f}")
+    print(f"  trusted hydration is {results['validated'] / results['trusted']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
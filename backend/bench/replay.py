@@ -0,0 +1,218 @@
+"""
+Re-drive captured production traffic against a test instance.
+
+Capture on the source instance with ``TRAFFIC_CAPTURE_FILE=capture.jsonl``
+(see ``utils.capture``), then against a seeded test instance started with the
+``bench.fakes`` stand-ins for Resend and Google:
+
+    python -m bench.replay capture.jsonl --speed 1 --output build_a.json
+    python -m bench.replay capture.jsonl --speed 4 --output build_b.json
+    python -m bench.compare build_a.json build_b.json
+
+Requests are re-issued at their captured offsets divided by ``--speed``, so
+bursts and idle gaps are preserved. Captures contain no bodies or identities,
+so each request is rebuilt from its route template using seeded users: every
+distinct capture ``subject`` is bound to its own seeded user's token, which
+keeps per-caller patterns (e.g. a dashboard polling ``/users/me``) intact.
+Routes that would mutate fixtures shared by the run (activate, deactivate,
+admin create) are skipped and counted in the output metadata.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from bench.run import BenchContext, login, prepare
+from bench.seed import BENCH_DATABASE, BENCH_PASSWORD, bench_username
+from bench.stats import run_metadata, summarize, write_results
+
+PLAIN_GET_ROUTES = {"/", "/health", "/auth/google/url", "/auth/test-config"}
+PLAIN_POST_ROUTES = {"/users/logout", "/auth/logout"}
+
+
+def load_capture(path: str, limit: Optional[int]) -> List[dict]:
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    events.sort(key=lambda e: e["t"])
+    return events[:limit] if limit else events
+
+
+class ReplayContext(BenchContext):
+    """BenchContext plus the mapping from capture subjects to seeded users."""
+
+    def __init__(self, db, seeded_users: int, rng: random.Random, google_users: int):
+        super().__init__(db, seeded_users, rng)
+        self.tokens_by_subject: Dict[Optional[str], str] = {}
+        self.google_codes = itertools.cycle(range(google_users))
+
+    def token(self, subject: Optional[str]) -> str:
+        if subject in self.tokens_by_subject:
+            return self.tokens_by_subject[subject]
+        return self.rng.choice(self.user_tokens)
+
+    def query_params(self, keys: List[str]) -> dict:
+        values = {
+            "skip": lambda: self.rng.randrange(0, max(self.seeded_users - 50, 1)),
+            "limit": lambda: 50,
+            "role": lambda: "user",
+            "is_active": lambda: "true",
+            "q": lambda: f"bench_user_{self.rng.randrange(1, 1000)}",
+        }
+        return {key: values[key]() for key in keys if key in values}
+
+
+async def build_request(ctx: ReplayContext, event: dict) -> Optional[dict]:
+    """Rebuild a concrete request for a captured event, or None to skip it."""
+    method, route = event["method"], event["route"]
+    auth = {"Authorization": f"Bearer {ctx.token(event.get('subject'))}"}
+    admin = {"Authorization": f"Bearer {ctx.admin_token}"}
+
+    if method == "GET" and (route in PLAIN_GET_ROUTES or route.startswith("/static/")):
+        return {"method": method, "url": route}
+    if method == "POST" and route in PLAIN_POST_ROUTES:
+        return {"method": method, "url": route}
+
+    if (method, route) == ("POST", "/users/login"):
+        return {"method": method, "url": route, "data": {
+            "username": bench_username(ctx.random_active_user()), "password": BENCH_PASSWORD}}
+    if (method, route) == ("GET", "/users/me"):
+        return {"method": method, "url": route, "headers": auth}
+    if (method, route) == ("PUT", "/users/me"):
+        return {"method": method, "url": route, "headers": auth,
+                "data": {"full_name": f"Replay {ctx.rng.randrange(10_000)}"}}
+    if (method, route) in {("GET", "/users/"), ("GET", "/users/search")}:
+        params = ctx.query_params(event.get("query", []))
+        if route == "/users/search":
+            params.setdefault("q", f"bench_user_{ctx.rng.randrange(1, 1000)}")
+        return {"method": method, "url": route, "headers": admin, "params": params}
+    if (method, route) == ("POST", "/users/signup"):
+        username = f"bench_signup_{ctx.run_id}_{next(ctx.sequence)}"
+        return {"method": method, "url": route, "data": {
+            "full_name": "Replay Signup", "username": username, "email": f"{username}@bench.example.com",
+            "password": BENCH_PASSWORD, "confirm_password": BENCH_PASSWORD}}
+
+    if route in {"/users/send-otp", "/users/resend-otp", "/users/verify-otp", "/users/otp-status/{email}"}:
+        email = ctx.rng.choice(ctx.otp_emails)
+        if route == "/users/otp-status/{email}":
+            return {"method": method, "url": f"/users/otp-status/{email}"}
+        if route == "/users/verify-otp":
+            user = await ctx.db.users.find_one({"email": email}, {"otp_code": 1})
+            code = (user or {}).get("otp_code") or "000000"
+            return {"method": method, "url": route, "data": {"email": email, "otp_code": code}}
+        return {"method": method, "url": route, "data": {"email": email}}
+
+    if (method, route) == ("POST", "/auth/google/exchange"):
+        return {"method": method, "url": route, "json": {"code": f"bench-{next(ctx.google_codes)}"}}
+
+    return None
+
+
+async def replay(args) -> None:
+    events = load_capture(args.capture, args.limit)
+    if not events:
+        raise SystemExit("Capture file is empty")
+
+    mongo = AsyncIOMotorClient(args.mongodb_url)
+    db = mongo[args.database]
+    seeded_users = await db.users.count_documents({"username": {"$regex": "^bench_user_"}})
+    if seeded_users < 2:
+        raise SystemExit("No seeded users found, run `python -m bench.seed` first")
+
+    ctx = ReplayContext(db, seeded_users, random.Random(args.seed), args.google_users)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    skipped: Counter = Counter()
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        await prepare(ctx, client, ["list", "me", "otp"], args.otp_pool)
+        subjects = {e.get("subject") for e in events if e.get("subject")}
+        for subject in list(subjects)[:args.max_subjects]:
+            ctx.tokens_by_subject[subject] = await login(client, bench_username(ctx.random_active_user()))
+
+        async def fire(event: dict):
+            key = f"{event['method']} {event['route']}"
+            request = await build_request(ctx, event)
+            if request is None:
+                skipped[key] += 1
+                return
+            method, url = request.pop("method"), request.pop("url")
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **request)
+                ok = response.status_code < 500
+            except httpx.HTTPError:
+                ok = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if ok:
+                latencies[key].append(elapsed_ms)
+            else:
+                errors[key] += 1
+
+        loop = asyncio.get_running_loop()
+        origin = events[0]["t"]
+        started = loop.time()
+        tasks = []
+        for event in events:
+            delay = started + (event["t"] - origin) / args.speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(event)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - started
+
+    await db.users.delete_many({"username": {"$regex": f"^bench_(signup|otp)_{ctx.run_id}_"}})
+    mongo.close()
+
+    keys = set(latencies) | set(errors)
+    results = {key: summarize(latencies[key], errors[key], elapsed) for key in sorted(keys)}
+    captured = defaultdict(list)
+    for event in events:
+        captured[f"{event['method']} {event['route']}"].append(event["duration_ms"])
+
+    meta = run_metadata(
+        tool="bench.replay",
+        capture=args.capture,
+        events=len(events),
+        speed=args.speed,
+        base_url=args.base_url,
+        seeded_users=seeded_users,
+        skipped=dict(skipped),
+        captured_server_latency_ms={
+            key: summarize(values, 0, 0)["latency_ms"] for key, values in sorted(captured.items())
+        },
+    )
+    write_results(meta, results, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic against a test instance")
+    parser.add_argument("capture", help="JSON lines file written by TRAFFIC_CAPTURE_FILE")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default=BENCH_DATABASE)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 4 = four times faster")
+    parser.add_argument("--limit", type=int, help="replay only the first N events")
+    parser.add_argument("--max-subjects", type=int, default=500, help="distinct callers given their own user")
+    parser.add_argument("--otp-pool", type=int, default=20, help="unverified users shared by OTP requests")
+    parser.add_argument("--google-users", type=int, default=100, help="distinct fake Google accounts")
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    asyncio.run(replay(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
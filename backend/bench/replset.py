@@ -0,0 +1,158 @@
+"""
+Local replica set for exercising secondary reads and change streams.
+
+    python -m bench.replset --dbpath /tmp/zyneth-rs          # start, Ctrl+C stops
+    MONGODB_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" \\
+        uvicorn main:app --port 8000
+
+``--ports 27017`` starts a single-node set, which is all change streams need.
+
+``--check`` runs against an already running set: it writes through a causal
+session and reads the document back with the analytics read preference,
+once per secondary lag setting, and reports whether the read saw the write.
+
+``--check-changes`` runs ``UserChangeWatcher`` against a running set, revokes
+a user's tokens directly in MongoDB (as another instance would) and reports
+how long the change takes to reach the token map.
+Needs ``mongod`` on PATH.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import time
+import uuid
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+from crud.token_versions import TokenVersionCache
+from crud.user_changes import UserChangeWatcher
+from database import ANALYTICS_READ_PREFERENCE
+
+REPLICA_SET = "rs0"
+
+
+def replset_url(ports) -> str:
+    hosts = ",".join(f"localhost:{port}" for port in ports)
+    return f"mongodb://{hosts}/?replicaSet={REPLICA_SET}"
+
+
+def start(dbpath: str, ports) -> list:
+    processes = []
+    for port in ports:
+        path = os.path.join(dbpath, str(port))
+        os.makedirs(path, exist_ok=True)
+        processes.append(subprocess.Popen([
+            "mongod", "--replSet", REPLICA_SET, "--port", str(port),
+            "--dbpath", path, "--bind_ip", "localhost", "--quiet",
+        ], stdout=subprocess.DEVNULL))
+
+    admin = MongoClient(f"mongodb://localhost:{ports[0]}/?directConnection=true", serverSelectionTimeoutMS=30000)
+    try:
+        admin.admin.command("replSetGetStatus")
+    except Exception:
+        admin.admin.command("replSetInitiate", {
+            "_id": REPLICA_SET,
+            "members": [
+                # Only the first member can become primary, so the others stay secondaries
+                {"_id": i, "host": f"localhost:{port}", "priority": 1 if i == 0 else 0}
+                for i, port in enumerate(ports)
+            ],
+        })
+
+    while not admin.admin.command("hello").get("isWritablePrimary"):
+        time.sleep(0.5)
+    admin.close()
+    return processes
+
+
+async def check(url: str, rounds: int) -> None:
+    client = AsyncIOMotorClient(url)
+    users = client["lms_replset_check"].users
+    secondary_users = users.with_options(read_preference=ANALYTICS_READ_PREFERENCE)
+
+    for label, causal in (("causal session", True), ("no session", False)):
+        seen = 0
+        for _ in range(rounds):
+            marker = uuid.uuid4().hex
+            async with await client.start_session(causal_consistency=causal) as session:
+                await users.insert_one({"marker": marker}, session=session)
+                if await secondary_users.find_one({"marker": marker}, session=session if causal else None):
+                    seen += 1
+        print(f"{label}: read own write {seen}/{rounds}")
+
+    await users.drop()
+    client.close()
+
+
+async def check_changes(url: str, rounds: int) -> None:
+    client = AsyncIOMotorClient(url)
+    db = client["lms_replset_check"]
+    cache = TokenVersionCache()
+    watcher = UserChangeWatcher()
+    watcher.subscribe(cache.apply_change)
+    seen = asyncio.Event()
+    watcher.subscribe(lambda change: seen.set())
+
+    async def get_db():
+        return db
+
+    task = asyncio.create_task(watcher.run(get_db))
+    while not watcher.live:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.5)  # the stream is open once the first getMore is out
+
+    user_id = (await db.users.insert_one({"is_active": True, "token_version": 0})).inserted_id
+    await seen.wait()
+    latencies = []
+    for version in range(1, rounds + 1):
+        seen.clear()
+        started = time.perf_counter()
+        await db.users.update_one({"_id": user_id}, {"$inc": {"token_version": 1}})
+        while cache.is_valid(str(user_id), version - 1):
+            await asyncio.wait_for(seen.wait(), timeout=10)
+            seen.clear()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    print(f"token revocation visible after: median {statistics.median(latencies):.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms, max {latencies[-1]:.1f} ms ({rounds} rounds)")
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await db.users.drop()
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run or check a local replica set")
+    parser.add_argument("--dbpath", default="/tmp/zyneth-rs")
+    parser.add_argument("--ports", default="27017,27018,27019")
+    parser.add_argument("--check", action="store_true", help="check causal reads against a running set")
+    parser.add_argument("--check-changes", action="store_true",
+                        help="measure change stream propagation against a running set")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    ports = [int(port) for port in args.ports.split(",")]
+
+    if args.check:
+        asyncio.run(check(replset_url(ports), args.rounds))
+        return
+    if args.check_changes:
+        asyncio.run(check_changes(replset_url(ports), args.rounds))
+        return
+
+    processes = start(args.dbpath, ports)
+    print(f"Replica set ready: MONGODB_URL=\"{replset_url(ports)}\"")
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
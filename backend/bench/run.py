@@ -0,0 +1,280 @@
+"""
+HTTP load benchmark for the user API.
+
+Start the API against the benchmark database, seed it, then run:
+
+    python -m bench.seed --users 10000 --drop
+    DATABASE_NAME=lms_bench uvicorn main:app --port 8000
+    python -m bench.run --concurrency 1,16,64 --requests 2000 --output results.json
+
+Scenarios (``--scenarios``, comma separated, default all):
+    login    POST /users/login as a random active seeded user
+    me       GET /users/me with pre-issued tokens
+    signup   POST /users/signup with fresh usernames (bcrypt + insert + OTP)
+    list     GET /users/ pages as the seeded admin
+    search   GET /users/search as the seeded admin
+    otp      POST /users/resend-otp then /users/verify-otp for unverified users
+             inserted directly into the database (reported as otp_send and
+             otp_verify)
+
+Results are written in the ``bench.stats`` format, keyed "<scenario>@<concurrency>",
+so two runs can be diffed with ``python -m bench.compare``. ``meta.bcrypt``
+holds a bcrypt calibration (chosen cost, target and measured hash times),
+since login and signup latency follow directly from it. It is measured on
+the host running the benchmark, not the server: it only describes the
+server when both run on the same machine, and the server logs its own
+calibration at startup ("Calibrated bcrypt cost").
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from bench.seed import BENCH_DATABASE, BENCH_PASSWORD, bench_username, is_bench_user_active
+from bench.stats import run_metadata, summarize, write_results
+from crud.user import new_user_document
+from utils.security import BCRYPT_ROUNDS, calibrate_bcrypt
+
+ALL_SCENARIOS = ["login", "me", "signup", "list", "search", "otp"]
+
+# (step name, succeeded, latency in ms)
+Sample = Tuple[str, bool, float]
+
+
+class BenchContext:
+    """State shared by all workers of one benchmark run."""
+
+    def __init__(self, db, seeded_users: int, rng: random.Random):
+        self.db = db
+        self.seeded_users = seeded_users
+        self.rng = rng
+        self.run_id = uuid.uuid4().hex[:8]
+        self.admin_token: Optional[str] = None
+        self.user_tokens: List[str] = []
+        self.otp_emails: List[str] = []
+        self.sequence = itertools.count()
+
+    def random_active_user(self) -> int:
+        while True:
+            i = self.rng.randrange(1, self.seeded_users)
+            if is_bench_user_active(i):
+                return i
+
+
+async def timed_request(client: httpx.AsyncClient, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        return False, (time.perf_counter() - start) * 1000, None
+    return response.is_success, (time.perf_counter() - start) * 1000, response
+
+
+async def login(client: httpx.AsyncClient, username: str) -> str:
+    response = await client.post("/users/login", data={"username": username, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+# ========== SCENARIOS ==========
+
+async def scenario_login(ctx: BenchContext, client: httpx.AsyncClient) -> List[Sample]:
+    ok, ms, _ = await timed_request(client, "POST", "/users/login", data={
+        "username": bench_username(ctx.random_active_user()),
+        "password": BENCH_PASSWORD,
+    })
+    return [("login", ok, ms)]
+
+
+async def scenario_me(ctx: BenchContext, client: httpx.AsyncClient) -> List[Sample]:
+    token = ctx.rng.choice(ctx.user_tokens)
+    ok, ms, _ = await timed_request(client, "GET", "/users/me", headers={"Authorization": f"Bearer {token}"})
+    return [("me", ok, ms)]
+
+
+async def scenario_signup(ctx: BenchContext, client: httpx.AsyncClient) -> List[Sample]:
+    n = next(ctx.sequence)
+    username = f"bench_signup_{ctx.run_id}_{n}"
+    ok, ms, _ = await timed_request(client, "POST", "/users/signup", data={
+        "full_name": "Bench Signup",
+        "username": username,
+        "email": f"{username}@bench.example.com",
+        "password": BENCH_PASSWORD,
+        "confirm_password": BENCH_PASSWORD,
+    })
+    return [("signup", ok, ms)]
+
+
+async def scenario_list(ctx: BenchContext, client: httpx.AsyncClient) -> List[Sample]:
+    skip = ctx.rng.randrange(0, max(ctx.seeded_users - 50, 1))
+    ok, ms, _ = await timed_request(
+        client, "GET", "/users/", params={"skip": skip, "limit": 50},
+        headers={"Authorization": f"Bearer {ctx.admin_token}"}
+    )
+    return [("list", ok, ms)]
+
+
+async def scenario_search(ctx: BenchContext, client: httpx.AsyncClient) -> List[Sample]:
+    term = f"bench_user_{ctx.rng.randrange(1, 1000)}"
+    ok, ms, _ = await timed_request(
+        client, "GET", "/users/search", params={"q": term, "limit": 20},
+        headers={"Authorization": f"Bearer {ctx.admin_token}"}
+    )
+    return [("search", ok, ms)]
+
+
+async def scenario_otp(ctx: BenchContext, client: httpx.AsyncClient) -> List[Sample]:
+    email = ctx.otp_emails[next(ctx.sequence) % len(ctx.otp_emails)]
+    send_ok, send_ms, _ = await timed_request(client, "POST", "/users/resend-otp", data={"email": email})
+    samples = [("otp_send", send_ok, send_ms)]
+    if not send_ok:
+        return samples
+
+    user = await ctx.db.users.find_one({"email": email}, {"otp_code": 1})
+    verify_ok, verify_ms, _ = await timed_request(client, "POST", "/users/verify-otp", data={
+        "email": email,
+        "otp_code": (user or {}).get("otp_code") or "000000",
+    })
+    samples.append(("otp_verify", verify_ok, verify_ms))
+
+    # Put the user back in the unverified state so it can be reused
+    await ctx.db.users.update_one({"email": email}, {"$set": {"is_verified": False}})
+    return samples
+
+
+SCENARIO_FUNCS = {
+    "login": scenario_login,
+    "me": scenario_me,
+    "signup": scenario_signup,
+    "list": scenario_list,
+    "search": scenario_search,
+    "otp": scenario_otp,
+}
+
+
+# ========== RUNNER ==========
+
+async def prepare(ctx: BenchContext, client: httpx.AsyncClient, scenarios: List[str], pool_size: int) -> None:
+    """Issue tokens and create fixtures the selected scenarios need."""
+    if {"list", "search"} & set(scenarios):
+        ctx.admin_token = await login(client, bench_username(0))
+
+    if "me" in scenarios:
+        ctx.user_tokens = [await login(client, bench_username(ctx.random_active_user()))
+                           for _ in range(pool_size)]
+
+    if "otp" in scenarios:
+        now = datetime.utcnow()
+        docs = []
+        for i in range(pool_size):
+            username = f"bench_otp_{ctx.run_id}_{i}"
+            docs.append(new_user_document(
+                full_name="Bench OTP",
+                username=username,
+                email=f"{username}@bench.example.com",
+                password_hash=None,
+                role="user",
+                auth_provider="email",
+                now=now,
+            ))
+        await ctx.db.users.insert_many(docs, ordered=False)
+        ctx.otp_emails = [doc["email"] for doc in docs]
+
+
+async def run_scenario(ctx: BenchContext, client: httpx.AsyncClient, name: str,
+                       requests: int, concurrency: int) -> Dict[str, dict]:
+    func = SCENARIO_FUNCS[name]
+    remaining = itertools.count()
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+
+    async def worker():
+        while next(remaining) < requests:
+            for step, ok, ms in await func(ctx, client):
+                if ok:
+                    latencies[step].append(ms)
+                else:
+                    errors[step] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    steps = set(latencies) | set(errors)
+    return {step: summarize(latencies[step], errors[step], elapsed) for step in sorted(steps)}
+
+
+async def run(args) -> None:
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(ALL_SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+
+    mongo = AsyncIOMotorClient(args.mongodb_url)
+    db = mongo[args.database]
+    seeded_users = await db.users.count_documents({"username": {"$regex": "^bench_user_"}})
+    if seeded_users < 2:
+        raise SystemExit("No seeded users found, run `python -m bench.seed` first")
+
+    ctx = BenchContext(db, seeded_users, random.Random(args.seed))
+    limits = httpx.Limits(max_connections=max(concurrency_levels), max_keepalive_connections=max(concurrency_levels))
+    results: Dict[str, dict] = {}
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        await prepare(ctx, client, scenarios, args.pool_size)
+        for concurrency in concurrency_levels:
+            for name in scenarios:
+                if args.warmup:
+                    await run_scenario(ctx, client, name, args.warmup, concurrency)
+                for step, summary in (await run_scenario(ctx, client, name, args.requests, concurrency)).items():
+                    results[f"{step}@{concurrency}"] = summary
+
+    if not args.keep_fixtures:
+        await db.users.delete_many({"username": {"$regex": f"^bench_(signup|otp)_{ctx.run_id}_"}})
+    mongo.close()
+
+    meta = run_metadata(
+        tool="bench.run",
+        base_url=args.base_url,
+        database=args.database,
+        seeded_users=seeded_users,
+        requests_per_scenario=args.requests,
+        concurrency=concurrency_levels,
+        seed=args.seed,
+        bcrypt={
+            **calibrate_bcrypt(),
+            "measured_on": "client",
+            "pinned_rounds": int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS else None,
+        },
+    )
+    write_results(meta, results, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the user API against a local server")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default=BENCH_DATABASE)
+    parser.add_argument("--scenarios", default=",".join(ALL_SCENARIOS))
+    parser.add_argument("--concurrency", default="16", help="comma separated levels, e.g. 1,16,64")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=50, help="unrecorded requests before each scenario")
+    parser.add_argument("--pool-size", type=int, default=200, help="tokens / OTP users prepared up front")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep-fixtures", action="store_true", help="keep users created by the run")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
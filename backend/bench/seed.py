@@ -0,0 +1,113 @@
+"""
+Seed a local MongoDB with synthetic users for benchmarking.
+
+Usage (from backend/):
+    python -m bench.seed --users 10000
+    python -m bench.seed --users 1000000 --drop --batch-size 20000
+
+Documents are built by ``new_user_document``, like the ones ``UserCRUD.create_user`` writes.
+All seeded users are verified, 95% are active, and all share ``BENCH_PASSWORD``
+(hashed once, so seeding a million users does not cost a million bcrypt rounds).
+User ``i`` is ``bench_user_{i}`` / ``bench_user_{i}@bench.example.com``; user 0 is an
+admin. The generator is seeded, so the same ``--seed`` yields the same data.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+from crud.user import new_user_document
+from utils.security import hash_password
+
+BENCH_PASSWORD = "bench-password-123"
+BENCH_DATABASE = os.getenv("BENCH_DATABASE_NAME", "lms_bench")
+
+FIRST_NAMES = ["Ada", "Grace", "Alan", "Linus", "Barbara", "Ken", "Margaret", "Dennis", "Radia", "Edsger",
+               "Frances", "John", "Katherine", "Tim", "Hedy", "Guido", "Sophie", "Niklaus", "Anita", "Donald"]
+LAST_NAMES = ["Lovelace", "Hopper", "Turing", "Torvalds", "Liskov", "Thompson", "Hamilton", "Ritchie",
+              "Perlman", "Dijkstra", "Allen", "McCarthy", "Johnson", "Berners-Lee", "Lamarr", "van Rossum",
+              "Wilson", "Wirth", "Borg", "Knuth"]
+
+
+def bench_username(i: int) -> str:
+    return f"bench_user_{i}"
+
+
+def bench_email(i: int) -> str:
+    return f"bench_user_{i}@bench.example.com"
+
+
+def is_bench_user_active(i: int) -> bool:
+    """Every 20th seeded user is deactivated, so 5% of the table is inactive."""
+    return i % 20 != 19
+
+
+def make_user(i: int, rng: random.Random, password_hash: str, now: datetime) -> dict:
+    created_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+    return new_user_document(
+        full_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        username=bench_username(i),
+        email=bench_email(i),
+        password_hash=password_hash,
+        role="admin" if i == 0 else "user",
+        auth_provider="email",
+        is_verified=True,
+        is_active=is_bench_user_active(i),
+        now=created_at,
+    )
+
+
+def seed(mongodb_url: str, database: str, users: int, batch_size: int, drop: bool, seed_value: int) -> dict:
+    client = MongoClient(mongodb_url)
+    collection = client[database].users
+    if drop:
+        collection.drop()
+
+    # Same unique indexes as database.create_essential_indexes
+    collection.create_index("email", unique=True)
+    collection.create_index("username", unique=True)
+
+    rng = random.Random(seed_value)
+    password_hash = hash_password(BENCH_PASSWORD)
+    now = datetime.utcnow()
+
+    start = time.perf_counter()
+    inserted = 0
+    for batch_start in range(0, users, batch_size):
+        batch = [make_user(i, rng, password_hash, now)
+                 for i in range(batch_start, min(batch_start + batch_size, users))]
+        result = collection.insert_many(batch, ordered=False)
+        inserted += len(result.inserted_ids)
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        "database": database,
+        "inserted": inserted,
+        "total_documents": collection.estimated_document_count(),
+        "seconds": round(elapsed, 2),
+        "docs_per_second": round(inserted / elapsed, 1) if elapsed else None,
+    }
+    client.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic users for benchmarks")
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default=BENCH_DATABASE)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="drop the users collection first")
+    args = parser.parse_args()
+
+    summary = seed(args.mongodb_url, args.database, args.users, args.batch_size, args.drop, args.seed)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
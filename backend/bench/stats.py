@@ -0,0 +1,79 @@
+"""
+Latency summaries shared by the benchmark and replay tools.
+
+Every tool writes results in the same shape so any two result files can be
+compared with ``python -m bench.compare``:
+
+    {
+      "meta": {...},
+      "results": {
+        "<scenario>": {
+          "requests": 2000, "errors": 0, "seconds": 4.1, "throughput_rps": 487.8,
+          "latency_ms": {"mean": 20.3, "p50": 18.9, "p90": 31.0, "p99": 55.2, "max": 80.1}
+        }
+      }
+    }
+"""
+import json
+import math
+import platform
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies_ms: List[float], errors: int, seconds: float) -> dict:
+    """Summarize one scenario's latencies (successful requests only)."""
+    values = sorted(latencies_ms)
+    total = len(values) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(total / seconds, 1) if seconds else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / len(values), 2) if values else 0.0,
+            "p50": round(percentile(values, 50), 2),
+            "p90": round(percentile(values, 90), 2),
+            "p99": round(percentile(values, 99), 2),
+            "max": round(values[-1], 2) if values else 0.0,
+        },
+    }
+
+
+def run_metadata(**extra) -> dict:
+    """Describe the build and host a result file was produced on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    meta = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+    }
+    meta.update(extra)
+    return meta
+
+
+def write_results(meta: dict, results: Dict[str, dict], output: Optional[str]) -> None:
+    """Write a result document to ``output`` (or stdout when not given)."""
+    document = json.dumps({"meta": meta, "results": results}, indent=2, default=str)
+    if output:
+        with open(output, "w") as f:
+            f.write(document + "\n")
+    else:
+        print(document)
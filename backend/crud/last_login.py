@@ -0,0 +1,99 @@
+"""
+Write-behind buffer for ``last_login``.
+
+Logins record the time in memory instead of writing it on the request path.
+The buffer keeps only the latest time per user and is flushed as one
+unordered ``bulk_write`` every ``LAST_LOGIN_FLUSH_SECONDS``, as soon as it
+holds ``LAST_LOGIN_FLUSH_SIZE`` users, and on shutdown. Updates use ``$max``,
+so flushes from several instances, in any order, leave the latest time.
+
+Writes go out at w=1 without waiting for the journal: a lost ``last_login``
+costs nothing, a login round trip costs every user. A failed flush keeps the
+batch for the next one; only a crash loses up to one interval of logins.
+
+Configuration (environment):
+    LAST_LOGIN_FLUSH_SECONDS  default 5
+    LAST_LOGIN_FLUSH_SIZE     default 500
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.write_concern import WriteConcern
+
+from utils.background import start_periodic
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv("LAST_LOGIN_FLUSH_SECONDS", "5"))
+LAST_LOGIN_FLUSH_SIZE = int(os.getenv("LAST_LOGIN_FLUSH_SIZE", "500"))
+
+_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+recorded_total = registry.counter("last_login_recorded_total", "Logins recorded in the last_login buffer")
+flushed_total = registry.counter("last_login_flushed_total", "last_login updates written to MongoDB")
+
+
+class LastLoginBuffer:
+    def __init__(self):
+        # user id -> latest login time not yet written
+        self._pending: Dict[str, datetime] = {}
+        self._get_db: Optional[Callable[[], Awaitable]] = None
+        self._flushing: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self, get_db: Callable[[], Awaitable]) -> asyncio.Task:
+        """Periodic flush task; call ``flush`` once more after stopping it."""
+        self._get_db = get_db
+        return start_periodic("last-login-flush", LAST_LOGIN_FLUSH_SECONDS, self.flush)
+
+    def record(self, user_id: str, when: Optional[datetime] = None) -> None:
+        if not ObjectId.is_valid(user_id):
+            return
+        self._merge({user_id: when or datetime.utcnow()})
+        recorded_total.inc()
+        if len(self._pending) >= LAST_LOGIN_FLUSH_SIZE and self._get_db is not None and self._flushing is None:
+            self._flushing = asyncio.create_task(self.flush())
+            self._flushing.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        self._flushing = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Could not flush last_login updates: %s", task.exception())
+
+    def _merge(self, batch: Dict[str, datetime]) -> None:
+        for user_id, when in batch.items():
+            current = self._pending.get(user_id)
+            if current is None or when > current:
+                self._pending[user_id] = when
+
+    async def flush(self) -> int:
+        """Write everything buffered; on failure the batch is kept for the next flush."""
+        if not self._pending or self._get_db is None:
+            return 0
+
+        batch, self._pending = self._pending, {}
+        try:
+            db = await self._get_db()
+            users = db.users.with_options(write_concern=_WRITE_CONCERN)
+            await users.bulk_write(
+                [UpdateOne({"_id": ObjectId(user_id)}, {"$max": {"last_login": when}})
+                 for user_id, when in batch.items()],
+                ordered=False
+            )
+        except BaseException:
+            # Including cancellation at shutdown, so the final flush still has it
+            self._merge(batch)
+            raise
+        flushed_total.inc(len(batch))
+        return len(batch)
+
+
+last_logins = LastLoginBuffer()
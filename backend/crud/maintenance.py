@@ -0,0 +1,139 @@
+"""
+Scheduled maintenance of the users collection (run by utils.scheduler).
+
+    purge-unverified-users  deletes email signups that never verified and
+                            never logged in, once older than
+                            UNVERIFIED_RETENTION_DAYS; admins, and accounts
+                            an admin created (created_by_admin), are never
+                            purged
+    clear-expired-otp       clears OTP codes past OTP_TTL and lapsed lockouts,
+                            instead of waiting for the user to come back
+    reconcile-user-stats    recounts crud/user_stats.py counters
+
+Both cleanup jobs select through partial indexes that only hold the rows they
+are after (see database.create_essential_indexes), work in batches of
+MAINTENANCE_BATCH_SIZE with a MAINTENANCE_BATCH_PAUSE_SECONDS pause between
+batches so they never saturate the primary, and stop after
+MAINTENANCE_MAX_BATCHES per run; the next run continues.
+
+Configuration (environment):
+    UNVERIFIED_RETENTION_DAYS        age at which unverified signups are purged,
+                                     0 disables the purge (default 7)
+    PURGE_INTERVAL_SECONDS           default 3600
+    OTP_CLEANUP_INTERVAL_SECONDS     default 600
+    MAINTENANCE_BATCH_SIZE           default 500
+    MAINTENANCE_BATCH_PAUSE_SECONDS  default 0.5
+    MAINTENANCE_MAX_BATCHES          default 100
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import List
+
+from crud.user import OTP_TTL
+from crud.user_counts import invalidate_counts
+from crud.user_stats import STATS_FIELDS, STATS_RECONCILE_SECONDS, UserStats, reconcile_user_stats
+from crud.user_suggest import suggest_index
+from utils.scheduler import Job
+
+UNVERIFIED_RETENTION_DAYS = float(os.getenv("UNVERIFIED_RETENTION_DAYS", "7"))
+PURGE_INTERVAL_SECONDS = float(os.getenv("PURGE_INTERVAL_SECONDS", "3600"))
+OTP_CLEANUP_INTERVAL_SECONDS = float(os.getenv("OTP_CLEANUP_INTERVAL_SECONDS", "600"))
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
+MAINTENANCE_BATCH_PAUSE_SECONDS = float(os.getenv("MAINTENANCE_BATCH_PAUSE_SECONDS", "0.5"))
+MAINTENANCE_MAX_BATCHES = int(os.getenv("MAINTENANCE_MAX_BATCHES", "100"))
+
+# Lower bound of the partial OTP indexes; repeated in queries so they can use them
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _unverified_query(cutoff: datetime) -> dict:
+    # is_verified / created_at select through the partial index, the rest is checked per document
+    return {
+        "is_verified": False,
+        "created_at": {"$lt": cutoff},
+        "last_login": None,
+        "role": {"$ne": "admin"},
+        "created_by_admin": {"$ne": True},
+        "auth_provider": {"$in": ["email", None]},
+    }
+
+
+async def purge_unverified_users(db) -> dict:
+    cutoff = datetime.utcnow() - timedelta(days=UNVERIFIED_RETENTION_DAYS)
+    query = _unverified_query(cutoff)
+    stats = UserStats(db)
+    deleted = batches = 0
+
+    while batches < MAINTENANCE_MAX_BATCHES:
+        docs = await db.users.find(query, STATS_FIELDS) \
+            .sort("created_at", 1).limit(MAINTENANCE_BATCH_SIZE).to_list(length=MAINTENANCE_BATCH_SIZE)
+        if not docs:
+            break
+        batches += 1
+
+        ids = [doc["_id"] for doc in docs]
+        # The query is repeated: a user who verified since the find is kept
+        result = await db.users.delete_many({"_id": {"$in": ids}, **query})
+        if result.deleted_count != len(ids):
+            kept = {doc["_id"] async for doc in db.users.find({"_id": {"$in": ids}}, {"_id": 1})}
+            docs = [doc for doc in docs if doc["_id"] not in kept]
+        await stats.apply_many([(doc, None) for doc in docs])
+        for doc in docs:
+            suggest_index.remove(str(doc["_id"]))
+        deleted += len(docs)
+
+        if len(ids) < MAINTENANCE_BATCH_SIZE:
+            break
+        await asyncio.sleep(MAINTENANCE_BATCH_PAUSE_SECONDS)
+
+    if deleted:
+        invalidate_counts()
+    return {"deleted": deleted, "batches": batches}
+
+
+async def clear_expired_otp(db) -> dict:
+    now = datetime.utcnow()
+    query = {
+        "$or": [
+            {"otp_created_at": {"$gt": _EPOCH, "$lt": now - OTP_TTL}},
+            {"otp_locked_until": {"$gt": _EPOCH, "$lt": now}},
+        ],
+        # Never lift a lockout that is still running
+        "$nor": [{"otp_locked_until": {"$gte": now}}],
+    }
+    cleared = batches = 0
+
+    while batches < MAINTENANCE_MAX_BATCHES:
+        ids: List = [doc["_id"] async for doc in db.users.find(query, {"_id": 1}).limit(MAINTENANCE_BATCH_SIZE)]
+        if not ids:
+            break
+        batches += 1
+
+        result = await db.users.update_many(
+            {"_id": {"$in": ids}, **query},
+            {"$set": {
+                "otp_code": None,
+                "otp_created_at": None,
+                "otp_attempts": 0,
+                "otp_locked_until": None,
+                "updated_at": now,
+            }}
+        )
+        cleared += result.modified_count
+
+        if len(ids) < MAINTENANCE_BATCH_SIZE:
+            break
+        await asyncio.sleep(MAINTENANCE_BATCH_PAUSE_SECONDS)
+
+    return {"cleared": cleared, "batches": batches}
+
+
+def maintenance_jobs() -> List[Job]:
+    jobs = [
+        Job("clear-expired-otp", OTP_CLEANUP_INTERVAL_SECONDS, clear_expired_otp),
+        Job("reconcile-user-stats", STATS_RECONCILE_SECONDS, reconcile_user_stats),
+    ]
+    if UNVERIFIED_RETENTION_DAYS > 0:
+        jobs.append(Job("purge-unverified-users", PURGE_INTERVAL_SECONDS, purge_unverified_users))
+    return jobs
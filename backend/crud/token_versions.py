@@ -0,0 +1,133 @@
+"""
+In-memory token revocation map.
+
+Access tokens carry the user's id (``uid``) and ``token_version`` (``ver``).
+Revoking every token of a user means incrementing ``token_version`` on the
+user document (password change, deactivation, role or email change). Each
+instance keeps only the users whose tokens may have been revoked, that is
+``token_version > 0``, deactivated, or deleted, so authorization can be decided
+without reading the user from MongoDB.
+
+Changes made by this instance are applied immediately through ``record``.
+Changes made by other instances arrive through the users change stream
+(``apply_change``, see crud/user_changes.py) within milliseconds; when the
+stream reports missed events, the map is dropped and fully reloaded at once,
+and authorization reads the user from MongoDB until it is. ``refresh``
+is the safety net, and the only path on a standalone server: it runs every
+``TOKEN_STATE_REFRESH_SECONDS`` and reads only the users updated since the
+previous run (``updated_at`` is indexed). Deletions are persisted in
+``token_revocations`` (TTL'd after the token lifetime), because a deleted
+document cannot be found by an ``updated_at`` query.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_STATE_REFRESH_SECONDS = float(os.getenv("TOKEN_STATE_REFRESH_SECONDS", "5"))
+
+# Overlap between refresh windows, absorbs clock skew between instances
+_SYNC_SLACK = timedelta(seconds=30)
+_DELETED = 2 ** 62
+
+
+class TokenVersionCache:
+    def __init__(self):
+        # user id -> (current token_version, is_active)
+        self._entries: Dict[str, Tuple[int, bool]] = {}
+        self._synced_until: Optional[datetime] = None
+        # Bumped by reset, so a refresh that started before it cannot mark the map ready
+        self._generation = 0
+        self._reloading: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """False until the first full load; callers must fall back to the DB."""
+        return self._synced_until is not None
+
+    def record(self, user_id: str, token_version: int, is_active: bool) -> None:
+        current = self._entries.get(user_id)
+        if current is not None and current[0] > token_version:
+            # Never move backwards (a stale refresh racing a local change)
+            return
+        if token_version == 0 and is_active:
+            self._entries.pop(user_id, None)
+        else:
+            self._entries[user_id] = (token_version, is_active)
+
+    def record_deleted(self, user_id: str) -> None:
+        self._entries[user_id] = (_DELETED, False)
+
+    def is_valid(self, user_id: str, token_version: int) -> bool:
+        """
+        Whether a token issued at ``token_version`` may still be used.
+
+        A token newer than what we know about was issued after a change this
+        instance has not seen yet; versions only grow, so it is accepted.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return True
+        version, is_active = entry
+        return is_active and token_version >= version
+
+    def is_deactivated(self, user_id: str) -> bool:
+        entry = self._entries.get(user_id)
+        return entry is not None and not entry[1] and entry[0] != _DELETED
+
+    def reset(self) -> None:
+        """Forget everything; ``ready`` is False until the next (full) refresh."""
+        self._entries = {}
+        self._synced_until = None
+        self._generation += 1
+
+    def apply_change(self, change) -> None:
+        """user_changes subscriber: a user was changed or deleted, possibly elsewhere."""
+        if change.operation == "reset":
+            # Events were missed: reload now rather than at the next poll
+            self.reset()
+            if self._reloading is None or self._reloading.done():
+                self._reloading = asyncio.create_task(self._reload(), name="token-versions-reload")
+        elif change.operation == "delete":
+            self.record_deleted(change.user_id)
+        elif change.document is not None and change.touches("token_version", "is_active"):
+            self.record(change.user_id, change.document.get("token_version", 0),
+                        change.document.get("is_active", True))
+
+    async def _reload(self) -> None:
+        try:
+            await refresh_token_versions()
+        except Exception as e:
+            # The periodic refresh retries the full load
+            logger.warning("Could not reload token versions: %s", e)
+
+    async def refresh(self, db) -> None:
+        started = datetime.utcnow()
+        generation = self._generation
+        if self._synced_until is None:
+            users_query = {"$or": [{"token_version": {"$gt": 0}}, {"is_active": False}]}
+            revocations_query = {}
+        else:
+            since = self._synced_until - _SYNC_SLACK
+            users_query = {"updated_at": {"$gte": since}}
+            revocations_query = {"revoked_at": {"$gte": since}}
+
+        async for doc in db.users.find(users_query, {"token_version": 1, "is_active": 1}):
+            self.record(str(doc["_id"]), doc.get("token_version", 0), doc.get("is_active", True))
+        async for doc in db.token_revocations.find(revocations_query, {"_id": 1}):
+            self.record_deleted(str(doc["_id"]))
+
+        if generation == self._generation:
+            self._synced_until = started
+
+
+token_versions = TokenVersionCache()
+
+
+async def refresh_token_versions() -> None:
+    """Background task body: sync the map with changes from other instances."""
+    from database import get_database
+    await token_versions.refresh(await get_database())
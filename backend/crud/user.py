@@ -1,25 +1,160 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta
+from functools import wraps
+import asyncio
+import inspect
+import logging
 import random
-import string
-
+import re
+
+from crud.last_login import last_logins
+from crud.token_versions import token_versions
+from crud.user_counts import UserCounter, invalidate_counts
+from crud.user_loader import UserLoader
+from crud.user_stats import STATS_FIELDS, UserStats
+from crud.user_suggest import (
+    MAX_PREFIX_LENGTH, SUGGEST_PROJECTION, normalize, ranked, suggest_fields, suggest_index, suggestions_total,
+    to_suggestion
+)
+from database import ANALYTICS_READ_PREFERENCE, mongodb
 from models.user import User, RoleEnum, AuthProviderEnum
 from schemas.user import UserCreate, AdminUserCreate
-from utils.security import hash_password
+from utils.metrics import registry
+from utils.admission import Overloaded
+from utils.security import UNUSABLE_PASSWORD, bcrypt_cost, hash_password_async
+from utils.singleflight import SingleFlight
+from utils.timing import timed
+
+logger = logging.getLogger(__name__)
+
+# Lookups by email in flight in this process, shared by concurrent callers
+# (lookups by id go through the request's UserLoader)
+user_reads = SingleFlight()
+user_reads_total = registry.counter(
+    "mongo_user_reads_total",
+    "User lookups by email, by lookup and result (query: ran a query, shared: joined one in flight)"
+)
+
+password_rehashes_total = registry.counter(
+    "password_rehashes_total", "Passwords re-hashed on login to the current bcrypt cost, by old and new cost"
+)
+
+
+def new_user_document(full_name: str, username: str, email: str, password_hash: Optional[str], role,
+                      auth_provider, avatar_url: Optional[str] = None, is_verified: bool = False,
+                      is_active: bool = True, now: Optional[datetime] = None,
+                      last_login: Optional[datetime] = None) -> dict:
+    """The document stored for a new user, with its OTP and suggestion fields."""
+    now = now or datetime.utcnow()
+    return {
+        "full_name": full_name,
+        "username": username,
+        "email": email.lower(),
+        "password_hash": password_hash,
+        "role": role,
+        "auth_provider": auth_provider,
+        "avatar_url": avatar_url,
+        "created_at": now,
+        "updated_at": now,
+        "last_login": last_login,
+        "is_active": is_active,
+        "token_version": 0,
+        # OTP fields
+        "otp_code": None,
+        "otp_created_at": None,
+        "is_verified": is_verified,
+        "otp_attempts": 0,
+        "otp_locked_until": None,
+        **suggest_fields(username, full_name)
+    }
+
+
+def _writes_users(func):
+    """
+    Mark a UserCRUD write: once it is done, lookups of the users it wrote
+    start new queries rather than joining one that began before the write,
+    and this request's loader results, which may miss it, are dropped. The
+    method's ``email`` argument is taken as written; methods that find the
+    user by id record its email with ``self._wrote``.
+    """
+    signature = inspect.signature(func)
+    takes_email = "email" in signature.parameters
+
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        if takes_email:
+            self._wrote(signature.bind(self, *args, **kwargs).arguments["email"])
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            while self._written:
+                user_reads.forget(("email", self._written.pop()))
+            self.loader.clear()
+    return wrapper
+
+# Changing any of these invalidates the claims in already issued tokens
+TOKEN_CLAIM_FIELDS = ("email", "role", "is_active")
+# How long an OTP code stays valid
+OTP_TTL = timedelta(minutes=10)
 
 class UserCRUD:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    # Set once any user is known to exist (see _is_first_user)
+    _has_users = False
+
+    def __init__(self, db: AsyncIOMotorDatabase, session=None):
+        """
+        ``session`` (see database.causal_session) is used for admin writes and
+        analytics reads, so a caller reads its own writes back from secondaries.
+        """
         self.db = db
+        self.session = session
+        # Admin listing, search and counts; auth lookups stay on the primary
+        self.analytics_users = db.users.with_options(read_preference=ANALYTICS_READ_PREFERENCE)
+        self.stats = UserStats(db, session=session)
+        self.counter = UserCounter(self.analytics_users, stats=self.stats, session=session)
+        # A UserCRUD lives for one request, so its loader batches and memoizes
+        # per request; it resolves auth lookups too, so it reads the primary
+        self.loader = UserLoader(db.users, session=session)
+        # Emails of users written by the current write, see _writes_users
+        self._written = set()
+
+    def _wrote(self, *emails: Optional[str]) -> None:
+        self._written.update(email.lower() for email in emails if email)
 
     async def _is_connected(self):
-        try:
-            await self.db.command('ping')
-            return True
-        except Exception as e:
-            print(f"❌ MongoDB connection failed: {e}")
-            return False
+        """
+        No round trip: get_database already refused a request while MongoDB is
+        known to be down, and the driver's topology monitoring (see
+        database._PrimaryMonitor) marks it down as soon as the primary is lost.
+        """
+        return mongodb.is_connected
+
+    def _projection(self, fields: Optional[Sequence[str]]) -> Optional[dict]:
+        """Mongo projection for a sparse fieldset; ETag inputs are always kept."""
+        if not fields:
+            return None
+        projection = {field: 1 for field in fields if field != "id"}
+        projection.update(updated_at=1, last_login=1)
+        return projection
+
+    def _hydrate(self, user_data: dict, fields: Optional[Sequence[str]]) -> Union[User, dict]:
+        """User for full documents, a plain dict (with ``id``) for projected ones."""
+        if fields:
+            return self._convert_objectids_to_strings(user_data)
+        return self._user_from_db(user_data)
+
+    def _user_from_db(self, user_data: dict) -> User:
+        """
+        Trusted hydration for documents read from MongoDB. They were validated
+        when written, so ``model_construct`` skips validating them again
+        (EmailStr parsing included), which dominates the cost of listings.
+        Use ``User(**data)`` for anything built from request input.
+        """
+        return User.model_construct(**self._convert_objectids_to_strings(user_data))
 
     def _convert_objectids_to_strings(self, data: dict) -> dict:
         if not data:
@@ -33,20 +168,31 @@ class UserCRUD:
         
         return converted
 
-    async def get_user_by_email(self, email: str) -> Optional[User]:
+    async def _find_user(self, query: dict, lookup: str) -> Optional[User]:
         if not await self._is_connected():
             return None
-            
+
         try:
-            user_data = await self.db.users.find_one({"email": email.lower()})
+            user_data = await self.db.users.find_one(query)
             if user_data:
-                user_data = self._convert_objectids_to_strings(user_data)
-                return User(**user_data)
+                return self._user_from_db(user_data)
             return None
         except Exception as e:
-            print(f"❌ Error getting user by email: {e}")
+            logger.error("Error getting user by %s: %s", lookup, e)
             return None
 
+    async def _shared_read(self, lookup: str, value: str, query: dict) -> Optional[User]:
+        """Identical concurrent lookups share one query; each caller gets its own copy."""
+        user, shared = await user_reads.do((lookup, value), lambda: self._find_user(query, lookup))
+        user_reads_total.inc(lookup=lookup, result="shared" if shared else "query")
+        return user.model_copy() if shared and user is not None else user
+
+    @timed("mongo")
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        email = email.lower()
+        return await self._shared_read("email", email, {"email": email})
+
+    @timed("mongo")
     async def get_user_by_username(self, username: str) -> Optional[User]:
         if not await self._is_connected():
             return None
@@ -54,33 +200,33 @@ class UserCRUD:
         try:
             user_data = await self.db.users.find_one({"username": username})
             if user_data:
-                user_data = self._convert_objectids_to_strings(user_data)
-                return User(**user_data)
+                return self._user_from_db(user_data)
             return None
         except Exception as e:
-            print(f"❌ Error getting user by username: {e}")
+            logger.error("Error getting user by username: %s", e)
             return None
 
+    @timed("mongo")
     async def get_user_by_identifier(self, identifier: str) -> Optional[User]:
         user = await self.get_user_by_email(identifier)
         if not user:
             user = await self.get_user_by_username(identifier)
         return user
 
+    @timed("mongo")
     async def get_user_by_id(self, user_id: str) -> Optional[User]:
-        if not await self._is_connected():
+        """Through ``self.loader``: lookups of one request share its batch and memo."""
+        if not ObjectId.is_valid(user_id) or not await self._is_connected():
             return None
-            
         try:
-            user_data = await self.db.users.find_one({"_id": ObjectId(user_id)})
-            if user_data:
-                user_data = self._convert_objectids_to_strings(user_data)
-                return User(**user_data)
-            return None
+            user_data = await self.loader.load("_id", user_id)
         except Exception as e:
-            print(f"❌ Error getting user by ID: {e}")
+            logger.error("Error getting user by id: %s", e)
             return None
+        return self._user_from_db(user_data) if user_data else None
 
+    @timed("mongo")
+    @_writes_users
     async def create_user(
         self, 
         user_data: UserCreate, 
@@ -106,126 +252,189 @@ class UserCRUD:
                 return None
 
             # Determine role (first user becomes admin)
-            user_count = await self.db.users.count_documents({})
-            role = RoleEnum.admin if user_count == 0 else user_data.role
+            role = RoleEnum.admin if await self._is_first_user() else user_data.role
 
             # Prepare user document with OTP fields
-            user_dict = {
-                "full_name": user_data.full_name,
-                "username": user_data.username,
-                "email": user_data.email.lower(),
-                "password_hash": hash_password(user_data.password) if user_data.password else None,
-                "role": role,
-                "auth_provider": auth_provider,  # NEW: Store auth provider
-                "avatar_url": avatar_url,
-                "created_at": datetime.utcnow(),
-                "last_login": None,
-                "is_active": True,
-                # OTP fields
-                "otp_code": None,
-                "otp_created_at": None,
-                "is_verified": is_verified,  # Google users are pre-verified
-                "otp_attempts": 0,
-                "otp_locked_until": None
-            }
+            user_dict = new_user_document(
+                full_name=user_data.full_name,
+                username=user_data.username,
+                email=user_data.email,
+                password_hash=await hash_password_async(user_data.password) if user_data.password else None,
+                role=role,
+                auth_provider=auth_provider,
+                avatar_url=avatar_url,
+                is_verified=is_verified,  # Google users are pre-verified
+            )
 
             # Add is_active for AdminUserCreate
             if isinstance(user_data, AdminUserCreate):
                 user_dict["is_active"] = user_data.is_active
+                # Still verified by OTP, but never purged as a stale signup
+                user_dict["created_by_admin"] = True
 
-            result = await self.db.users.insert_one(user_dict)
+            result = await self.db.users.insert_one(user_dict, session=self.session)
+            self._wrote(user_dict["email"])
+            invalidate_counts()
+            await self.stats.apply(None, user_dict)
+            suggest_index.put(str(result.inserted_id), user_dict)
             
-            created_user = await self.db.users.find_one({"_id": result.inserted_id})
+            created_user = await self.db.users.find_one({"_id": result.inserted_id}, session=self.session)
             
             if created_user:
-                created_user = self._convert_objectids_to_strings(created_user)
-                return User(**created_user)
+                return self._user_from_db(created_user)
             
             return None
-            
+
+        except Overloaded:
+            # Surfaces as 503 + Retry-After
+            raise
         except Exception as e:
-            print(f"❌ Error creating user: {e}")
+            logger.error("Error creating user: %s", e)
             return None
 
-    async def create_google_user(
+    async def _is_first_user(self) -> bool:
+        """
+        Whether the collection is still empty. Users are never all deleted in
+        practice, so once one has been seen the answer is cached for the process.
+        """
+        if UserCRUD._has_users:
+            return False
+        UserCRUD._has_users = await self.db.users.find_one({}, {"_id": 1}) is not None
+        return not UserCRUD._has_users
+
+    async def _free_username(self, base: str) -> str:
+        """
+        Return ``base`` or the first ``base<N>`` not taken yet.
+
+        One anchored prefix query (served by the username index) fetches every
+        candidate instead of probing one username per round trip.
+        """
+        cursor = self.db.users.find(
+            {"username": {"$regex": f"^{re.escape(base)}\\d*$"}},
+            {"username": 1, "_id": 0}
+        )
+        taken = {doc["username"] async for doc in cursor}
+        if base not in taken:
+            return base
+
+        counter = 1
+        while f"{base}{counter}" in taken:
+            counter += 1
+        return f"{base}{counter}"
+
+    @timed("mongo")
+    @_writes_users
+    async def upsert_google_user(
         self,
         email: str,
         full_name: str,
         picture: str = None,
         google_id: str = None
-    ) -> Optional[User]:
+    ) -> Tuple[Optional[User], bool]:
         """
-        Create a new user from Google OAuth.
+        Get or create the account for a Google sign-in.
+        Returns (user, created).
+
+        Existing accounts are updated in a single round trip. New accounts are
+        inserted with one upsert keyed on the email, so concurrent first logins
+        cannot create duplicates. The username derived from the email is tried
+        as is; only when it is taken does a prefix query pick a free one.
+        Whether the account is the first one (and so the admin) cannot be part
+        of the upsert, which only sees the document it matches; it costs a
+        read until this process has seen a user exist (``_has_users``).
+        Google-only accounts store UNUSABLE_PASSWORD instead of hashing a
+        random password nobody will ever type.
         """
         if not await self._is_connected():
-            return None
-            
+            return None, False
+
+        email = email.lower()
+
         try:
-            # Check if user already exists
-            existing_user = await self.get_user_by_email(email)
-            if existing_user:
-                # Update user with Google info if needed
-                update_data = {
-                    "last_login": datetime.utcnow(),
-                    "auth_provider": AuthProviderEnum.google,
-                    "is_verified": True
+            # Existing user: mark verified and Google-linked, fill in the
+            # avatar if missing. The document before the update is returned so
+            # the stats see verification / provider changes; the update itself
+            # is replayed below. last_login is buffered, off this write.
+            now = datetime.utcnow()
+            existing = await self.db.users.find_one_and_update(
+                {"email": email},
+                [{"$set": {
+                    "is_verified": True,
+                    "auth_provider": AuthProviderEnum.google.value,
+                    "updated_at": now,
+                    # $literal: a URL starting with "$" must not be read as a field path
+                    "avatar_url": {"$ifNull": ["$avatar_url", {"$literal": picture}]},
+                }}],
+                return_document=ReturnDocument.BEFORE
+            )
+            if existing:
+                UserCRUD._has_users = True
+                last_logins.record(str(existing["_id"]), now)
+                updated = {
+                    **existing,
+                    "last_login": now,
+                    "is_verified": True,
+                    "auth_provider": AuthProviderEnum.google.value,
+                    "updated_at": now,
+                    "avatar_url": existing["avatar_url"] if existing.get("avatar_url") is not None else picture,
                 }
-                if picture and not existing_user.avatar_url:
-                    update_data["avatar_url"] = picture
-                
-                return await self.update_user(existing_user.id, update_data)
+                await self.stats.apply(existing, updated)
+                suggest_index.put(str(existing["_id"]), updated)
+                return self._user_from_db(updated), False
 
-            # Generate username from email (prefix before @)
-            username_base = email.split("@")[0].replace('.', '_').lower()
+            username_base = re.sub(r"[^a-z0-9_]", "_", email.split("@")[0].lower())
             username = username_base
-            
-            # Ensure username is unique
-            counter = 1
-            while await self.get_user_by_username(username):
-                username = f"{username_base}{counter}"
-                counter += 1
 
-            # Determine role (first user becomes admin)
-            user_count = await self.db.users.count_documents({})
-            role = RoleEnum.admin if user_count == 0 else RoleEnum.user
-
-            # Generate a random password (won't be used for Google auth users)
-            random_password = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
-
-            # Create user document for Google user
-            user_dict = {
-                "full_name": full_name,
-                "username": username,
-                "email": email.lower(),
-                "password_hash": hash_password(random_password),
-                "role": role,
-                "auth_provider": AuthProviderEnum.google,
-                "avatar_url": picture,
-                "created_at": datetime.utcnow(),
-                "last_login": datetime.utcnow(),
-                "is_active": True,
-                # OTP fields
-                "otp_code": None,
-                "otp_created_at": None,
-                "is_verified": True,  # Google emails are already verified
-                "otp_attempts": 0,
-                "otp_locked_until": None
-            }
+            for _ in range(3):
+                # Determine role (first user becomes admin)
+                is_first_user = await self._is_first_user()
+                now = datetime.utcnow()
+                user_dict = new_user_document(
+                    full_name=full_name,
+                    username=username,
+                    email=email,
+                    password_hash=UNUSABLE_PASSWORD,
+                    role=RoleEnum.admin if is_first_user else RoleEnum.user,
+                    auth_provider=AuthProviderEnum.google,
+                    avatar_url=picture,
+                    is_verified=True,  # Google emails are already verified
+                    now=now,
+                    last_login=now,
+                )
+
+                try:
+                    result = await self.db.users.update_one(
+                        {"email": email},
+                        {"$setOnInsert": user_dict},
+                        upsert=True
+                    )
+                except DuplicateKeyError as e:
+                    if "username" in (e.details or {}).get("keyPattern", {}):
+                        # Taken: one prefix query finds a free one
+                        username = await self._free_username(username_base)
+                    # Otherwise a concurrent upsert inserted the email; the retry matches it
+                    continue
+
+                if result.upserted_id is None:
+                    # Created concurrently by another request
+                    created = await self.db.users.find_one({"email": email})
+                    return self._user_from_db(created), False
+
+                invalidate_counts()
+                await self.stats.apply(None, user_dict)
+                suggest_index.put(str(result.upserted_id), user_dict)
+                user_dict["id"] = str(result.upserted_id)
+                return User(**user_dict), True
+
+            logger.error("Could not find a free username for Google user", extra={"email": email})
+            return None, False
 
-            result = await self.db.users.insert_one(user_dict)
-            
-            created_user = await self.db.users.find_one({"_id": result.inserted_id})
-            
-            if created_user:
-                created_user = self._convert_objectids_to_strings(created_user)
-                return User(**created_user)
-            
-            return None
-            
         except Exception as e:
-            print(f"❌ Error creating Google user: {e}")
-            return None
+            logger.error("Error creating Google user: %s", e)
+            return None, False
 
+    @timed("mongo")
+    @_writes_users
     async def update_user(self, user_id: str, update_data: dict) -> Optional[User]:
         if not await self._is_connected():
             return None
@@ -244,38 +453,51 @@ class UserCRUD:
                     return None
 
             update_data["updated_at"] = datetime.utcnow()
-            
-            result = await self.db.users.find_one_and_update(
+            update = {"$set": {
+                **update_data,
+                **suggest_fields(update_data.get("username"), update_data.get("full_name"))
+            }}
+            revokes_tokens = any(field in update_data for field in TOKEN_CLAIM_FIELDS)
+            if revokes_tokens:
+                update["$inc"] = {"token_version": 1}
+            
+            before = await self.db.users.find_one_and_update(
                 {"_id": ObjectId(user_id)},
-                {"$set": update_data},
-                return_document=True
+                update,
+                return_document=ReturnDocument.BEFORE,
+                session=self.session
             )
-            
-            if result:
-                result = self._convert_objectids_to_strings(result)
-                return User(**result)
-            return None
+            if before is None:
+                return None
+            self._wrote(before.get("email"), update_data.get("email"))
+
+            result = {**before, **update_data}
+            if revokes_tokens:
+                result["token_version"] = before.get("token_version", 0) + 1
+                invalidate_counts()
+                token_versions.record(user_id, result["token_version"], result.get("is_active", True))
+            await self.stats.apply(before, result)
+            if any(field in update_data for field in ("username", "full_name", "avatar_url", "is_active")):
+                suggest_index.put(user_id, result)
+            return User(**self._convert_objectids_to_strings(result))
         except Exception as e:
-            print(f"❌ Error updating user: {e}")
+            logger.error("Error updating user: %s", e)
             return None
 
     async def update_last_login(self, user_id: str) -> bool:
-        if not await self._is_connected():
-            return False
-            
-        try:
-            result = await self.db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": {"last_login": datetime.utcnow()}}
-            )
-            return result.modified_count > 0
-        except Exception as e:
-            print(f"❌ Error updating last login: {e}")
-            return False
+        """Buffered (crud/last_login.py): written within seconds, off the login path."""
+        last_logins.record(user_id)
+        return True
 
+    @timed("mongo")
     async def get_users(self, skip: int = 0, limit: int = 100, 
                        role: Optional[RoleEnum] = None,
-                       is_active: Optional[bool] = None) -> List[User]:
+                       is_active: Optional[bool] = None,
+                       fields: Optional[Sequence[str]] = None) -> List[Union[User, dict]]:
+        """
+        List users. With ``fields`` only those are read from MongoDB and the
+        users are returned as dicts.
+        """
         if not await self._is_connected():
             return []
             
@@ -286,19 +508,50 @@ class UserCRUD:
             if is_active is not None:
                 query["is_active"] = is_active
             
-            cursor = self.db.users.find(query).skip(skip).limit(limit)
+            cursor = self.analytics_users.find(query, self._projection(fields), session=self.session) \
+                .skip(skip).limit(limit)
             users_data = await cursor.to_list(length=limit)
             
-            users = []
-            for user_data in users_data:
-                user_data = self._convert_objectids_to_strings(user_data)
-                users.append(User(**user_data))
+            users = [self._hydrate(user_data, fields) for user_data in users_data]
             
             return users
         except Exception as e:
-            print(f"❌ Error getting users: {e}")
+            logger.error("Error getting users: %s", e)
             return []
 
+    @timed("mongo")
+    async def get_users_batch(self, ids: Sequence[str] = (), emails: Sequence[str] = (),
+                              usernames: Sequence[str] = ()) -> Optional[Tuple[List[User], Dict[str, List[str]]]]:
+        """
+        Resolve many users in one query through ``self.loader``. Returns the
+        users in request order (ids, then emails, then usernames) without
+        duplicates, and the identifiers that matched no user.
+        """
+        if not await self._is_connected():
+            return None
+
+        requested = {"ids": ("_id", ids), "emails": ("email", emails), "usernames": ("username", usernames)}
+        try:
+            results = await asyncio.gather(
+                *(self.loader.load_many(key, values) for key, values in requested.values())
+            )
+        except Exception as e:
+            logger.error("Error getting users batch: %s", e)
+            return None
+
+        users, seen = [], set()
+        missing = {name: [] for name in requested}
+        for (name, (_, values)), docs in zip(requested.items(), results):
+            for value, doc in zip(values, docs):
+                if doc is None:
+                    if value not in missing[name]:
+                        missing[name].append(value)
+                elif doc["_id"] not in seen:
+                    seen.add(doc["_id"])
+                    users.append(self._hydrate(doc, None))
+        return users, missing
+
+    @timed("mongo")
     async def count_users(self, role: Optional[RoleEnum] = None, 
                          is_active: Optional[bool] = None) -> int:
         if not await self._is_connected():
@@ -311,67 +564,199 @@ class UserCRUD:
             if is_active is not None:
                 query["is_active"] = is_active
             
-            return await self.db.users.count_documents(query)
+            return await self.analytics_users.count_documents(query, session=self.session)
         except Exception as e:
-            print(f"❌ Error counting users: {e}")
+            logger.error("Error counting users: %s", e)
             return 0
 
+    @_writes_users
+    async def _update_auth_state(self, user_id: str, fields: dict, revoke_tokens: bool) -> bool:
+        """
+        Set ``fields`` and optionally bump token_version, then update the
+        local revocation map so this instance rejects old tokens right away.
+        """
+        update = {"$set": {**fields, "updated_at": datetime.utcnow()}}
+        if revoke_tokens:
+            update["$inc"] = {"token_version": 1}
+
+        before = await self.db.users.find_one_and_update(
+            {"_id": ObjectId(user_id)},
+            update,
+            projection={"token_version": 1, "email": 1, **STATS_FIELDS, **SUGGEST_PROJECTION},
+            return_document=ReturnDocument.BEFORE,
+            session=self.session
+        )
+        if before is None:
+            return False
+        self._wrote(before.get("email"))
+
+        after = {**before, **fields}
+        after["token_version"] = before.get("token_version", 0) + (1 if revoke_tokens else 0)
+        invalidate_counts()
+        token_versions.record(user_id, after["token_version"], after.get("is_active", True))
+        await self.stats.apply(before, after)
+        if "is_active" in fields:
+            suggest_index.put(user_id, after)
+        return True
+
+    @timed("mongo")
+    async def get_users_page(self, page: int = 1, per_page: int = 50,
+                             role: Optional[RoleEnum] = None,
+                             is_active: Optional[bool] = None,
+                             exact: bool = False) -> Tuple[List[User], int, str]:
+        """
+        One page of users plus the total from the count strategy layer
+        (crud/user_counts.py). Returns (users, total, total_source).
+        """
+        if not await self._is_connected():
+            return [], 0, "exact"
+
+        try:
+            query = {}
+            if role:
+                query["role"] = role
+            if is_active is not None:
+                query["is_active"] = is_active
+
+            cursor = self.analytics_users.find(query, session=self.session) \
+                .sort("_id", 1).skip((page - 1) * per_page).limit(per_page)
+            users = [self._user_from_db(user_data) async for user_data in cursor]
+            total, source = await self.counter.total(query, exact=exact)
+            return users, total, source
+        except Exception as e:
+            logger.error("Error getting users page: %s", e)
+            return [], 0, "exact"
+
+    @timed("mongo")
+    async def get_stats(self, days: int = 30) -> Optional[dict]:
+        """
+        Dashboard statistics from the maintained counters (crud/user_stats.py).
+        The counters are built on first use if the reconciler has not run yet.
+        """
+        if not await self._is_connected():
+            return None
+
+        try:
+            totals = await self.stats.get_totals()
+            if totals is None:
+                # Writes racing every recount still leave counters to read
+                totals = await self.stats.reconcile() or await self.stats.get_totals() or {}
+            status = totals.get("status", {})
+            verification = totals.get("verification", {})
+            return {
+                "total": totals.get("total", 0),
+                "by_role": totals.get("role", {}),
+                "active": status.get("active", 0),
+                "inactive": status.get("inactive", 0),
+                "verified": verification.get("verified", 0),
+                "unverified": verification.get("unverified", 0),
+                "by_provider": totals.get("provider", {}),
+                "signups_per_day": await self.stats.get_signups(days),
+                "reconciled_at": totals.get("reconciled_at"),
+            }
+        except Exception as e:
+            logger.error("Error getting user stats: %s", e)
+            return None
+
+    @timed("mongo")
     async def deactivate_user(self, user_id: str) -> bool:
         if not await self._is_connected():
             return False
             
         try:
-            result = await self.db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
-            )
-            return result.modified_count > 0
+            return await self._update_auth_state(user_id, {"is_active": False}, revoke_tokens=True)
         except Exception as e:
-            print(f"❌ Error deactivating user: {e}")
+            logger.error("Error deactivating user: %s", e)
             return False
 
+    @timed("mongo")
     async def activate_user(self, user_id: str) -> bool:
         if not await self._is_connected():
             return False
             
         try:
-            result = await self.db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": {"is_active": True, "updated_at": datetime.utcnow()}}
-            )
-            return result.modified_count > 0
+            # Tokens revoked by the deactivation stay revoked, the user logs in again
+            return await self._update_auth_state(user_id, {"is_active": True}, revoke_tokens=False)
         except Exception as e:
-            print(f"❌ Error activating user: {e}")
+            logger.error("Error activating user: %s", e)
             return False
 
+    @timed("mongo")
+    @_writes_users
     async def delete_user(self, user_id: str) -> bool:
         if not await self._is_connected():
             return False
             
         try:
-            result = await self.db.users.delete_one({"_id": ObjectId(user_id)})
-            return result.deleted_count > 0
+            deleted = await self.db.users.find_one_and_delete(
+                {"_id": ObjectId(user_id)},
+                projection={"email": 1, **STATS_FIELDS},
+                session=self.session
+            )
+            if deleted is None:
+                return False
+            self._wrote(deleted.get("email"))
+            invalidate_counts()
+            await self.stats.apply(deleted, None)
+            # Other instances learn about the deletion from this collection
+            await self.db.token_revocations.update_one(
+                {"_id": ObjectId(user_id)},
+                {"$set": {"revoked_at": datetime.utcnow()}},
+                upsert=True,
+                session=self.session
+            )
+            token_versions.record_deleted(user_id)
+            suggest_index.remove(user_id)
+            return True
         except Exception as e:
-            print(f"❌ Error deleting user: {e}")
+            logger.error("Error deleting user: %s", e)
             return False
 
+    @timed("mongo")
     async def change_password(self, user_id: str, new_password_hash: str) -> bool:
         if not await self._is_connected():
             return False
             
         try:
-            result = await self.db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": {"password_hash": new_password_hash, "updated_at": datetime.utcnow()}}
+            return await self._update_auth_state(
+                user_id, {"password_hash": new_password_hash}, revoke_tokens=True
             )
-            return result.modified_count > 0
         except Exception as e:
-            print(f"❌ Error changing password: {e}")
+            logger.error("Error changing password: %s", e)
             return False
 
-    async def search_users(self, search_term: str, skip: int = 0, limit: int = 50) -> List[User]:
+    @_writes_users
+    async def rehash_password(self, user_id: str, password: str, old_hash: str) -> bool:
+        """
+        Re-hash a just verified password at the current bcrypt cost. Not a
+        password change: token_version is left alone, so no token is revoked,
+        and the hash is only replaced if it is still ``old_hash``.
+        """
+        try:
+            new_hash = await hash_password_async(password)
+            before = await self.db.users.find_one_and_update(
+                {"_id": ObjectId(user_id), "password_hash": old_hash},
+                {"$set": {"password_hash": new_hash, "updated_at": datetime.utcnow()}},
+                projection={"email": 1}
+            )
+            if before is None:
+                return False
+            self._wrote(before.get("email"))
+            password_rehashes_total.inc(from_cost=bcrypt_cost(old_hash), to_cost=bcrypt_cost(new_hash))
+            return True
+        except Overloaded:
+            # Optional work: the next login tries again
+            return False
+        except Exception as e:
+            logger.error("Error rehashing password: %s", e)
+            return False
+
+    @timed("mongo")
+    async def search_users(self, search_term: str, skip: int = 0, limit: int = 50,
+                           fields: Optional[Sequence[str]] = None) -> List[Union[User, dict]]:
         """
         Search users by full_name, username, or email
+        With ``fields`` the users are projected and returned as dicts.
         """
         if not await self._is_connected():
             return []
@@ -385,21 +770,58 @@ class UserCRUD:
                 ]
             }
             
-            cursor = self.db.users.find(query).skip(skip).limit(limit)
+            cursor = self.analytics_users.find(query, self._projection(fields), session=self.session) \
+                .skip(skip).limit(limit)
             users_data = await cursor.to_list(length=limit)
             
-            users = []
-            for user_data in users_data:
-                user_data = self._convert_objectids_to_strings(user_data)
-                users.append(User(**user_data))
+            users = [self._hydrate(user_data, fields) for user_data in users_data]
             
             return users
         except Exception as e:
-            print(f"❌ Error searching users: {e}")
+            logger.error("Error searching users: %s", e)
+            return []
+
+    @timed("mongo")
+    async def suggest_users(self, q: str, limit: int = 10) -> List[dict]:
+        """
+        Type-ahead: active users whose username or a word of whose full name
+        starts with ``q``, ranked (see crud/user_suggest.py). Served from the
+        in-memory index once it is warm, otherwise by two anchored prefix
+        queries on the indexed username_lower / name_terms fields.
+        """
+        prefix = normalize(q)[:MAX_PREFIX_LENGTH]
+        if not prefix:
+            return []
+        if suggest_index.ready:
+            suggestions_total.inc(source="index")
+            return suggest_index.search(prefix, limit)
+
+        if not await self._is_connected():
+            return []
+
+        try:
+            # Anchored and case-sensitive on normalized values, so only the prefix's index range is read
+            pattern = {"$regex": "^" + re.escape(prefix)}
+            candidates = {}
+            for field in ("username_lower", "name_terms"):
+                cursor = self.analytics_users.find(
+                    {field: pattern, "is_active": {"$ne": False}}, SUGGEST_PROJECTION, session=self.session
+                )
+                if field == "username_lower":
+                    # Walks the index in order: an exact match comes first
+                    cursor = cursor.sort(field, 1)
+                async for doc in cursor.limit(limit):
+                    candidates.setdefault(str(doc["_id"]), to_suggestion(str(doc["_id"]), doc))
+            suggestions_total.inc(source="mongo")
+            return ranked(prefix, list(candidates.values()), limit)
+        except Exception as e:
+            logger.error("Error suggesting users: %s", e)
             return []
 
     # ========== OTP METHODS ==========
 
+    @timed("mongo")
+    @_writes_users
     async def generate_and_store_otp(self, email: str) -> Optional[str]:
         """
         Generate a 6-digit OTP and store it for the user.
@@ -431,19 +853,23 @@ class UserCRUD:
                 "updated_at": datetime.utcnow()
             }
             
-            result = await self.db.users.update_one(
+            before = await self.db.users.find_one_and_update(
                 {"email": email},
-                {"$set": update_data}
+                {"$set": update_data},
+                projection=STATS_FIELDS
             )
             
-            if result.modified_count > 0:
+            if before is not None:
+                await self.stats.apply(before, {**before, "is_verified": False})
                 return otp_code
             return None
             
         except Exception as e:
-            print(f"❌ Error generating OTP: {e}")
+            logger.error("Error generating OTP: %s", e)
             return None
 
+    @timed("mongo")
+    @_writes_users
     async def verify_otp(self, email: str, otp_code: str) -> dict:
         """
         Verify OTP for a user.
@@ -474,7 +900,7 @@ class UserCRUD:
                 return {"success": False, "message": "Invalid or expired OTP"}
             
             otp_age = datetime.utcnow() - user.otp_created_at
-            if otp_age > timedelta(minutes=10):
+            if otp_age > OTP_TTL:
                 await self._increment_otp_attempts(email)
                 return {"success": False, "message": "OTP has expired"}
             
@@ -498,19 +924,22 @@ class UserCRUD:
                 "updated_at": datetime.utcnow()
             }
             
-            result = await self.db.users.update_one(
+            before = await self.db.users.find_one_and_update(
                 {"email": email},
-                {"$set": update_data}
+                {"$set": update_data},
+                projection=STATS_FIELDS
             )
             
-            if result.modified_count > 0:
+            if before is not None:
+                await self.stats.apply(before, {**before, "is_verified": True})
                 return {"success": True, "message": "Email verified successfully"}
             return {"success": False, "message": "Verification failed"}
             
         except Exception as e:
-            print(f"❌ Error verifying OTP: {e}")
+            logger.error("Error verifying OTP: %s", e)
             return {"success": False, "message": "Server error"}
 
+    @_writes_users
     async def _increment_otp_attempts(self, email: str):
         """Increment OTP attempts and lock if too many failures."""
         try:
@@ -519,7 +948,7 @@ class UserCRUD:
                 return
             
             new_attempts = user.otp_attempts + 1
-            update_data = {"otp_attempts": new_attempts}
+            update_data = {"otp_attempts": new_attempts, "updated_at": datetime.utcnow()}
             
             # Lock user for 15 minutes after 3 failed attempts
             if new_attempts >= 3:
@@ -531,8 +960,10 @@ class UserCRUD:
             )
             
         except Exception as e:
-            print(f"❌ Error incrementing OTP attempts: {e}")
+            logger.error("Error incrementing OTP attempts: %s", e)
 
+    @timed("mongo")
+    @_writes_users
     async def clear_otp_data(self, email: str) -> bool:
         """Clear OTP data for a user."""
         if not await self._is_connected():
@@ -551,9 +982,10 @@ class UserCRUD:
             )
             return result.modified_count > 0
         except Exception as e:
-            print(f"❌ Error clearing OTP data: {e}")
+            logger.error("Error clearing OTP data: %s", e)
             return False
 
+    @timed("mongo")
     async def resend_otp(self, email: str) -> Optional[str]:
         """
         Resend OTP to a user.
@@ -565,6 +997,7 @@ class UserCRUD:
         # Generate new OTP
         return await self.generate_and_store_otp(email)
 
+    @timed("mongo")
     async def check_otp_status(self, email: str) -> dict:
         """Check OTP status for a user."""
         user = await self.get_user_by_email(email)
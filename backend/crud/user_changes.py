@@ -0,0 +1,163 @@
+"""
+Change-stream fan-out of user changes to in-process caches.
+
+Each instance caches auth state (crud/token_versions.py) and counts
+(crud/user_counts.py). Writes made by this instance update those caches
+directly; ``UserChangeWatcher`` tails a change stream on ``users`` so writes
+made by other instances (or scripts) reach them within milliseconds too,
+instead of after a refresh interval or TTL.
+
+Caches register a callback with ``user_changes.subscribe``. Callbacks are
+synchronous and receive a ``UserChange``; an ``operation`` of ``"reset"``
+means events may have been missed (the resume token fell off the oplog) and
+the cache should drop what it holds.
+
+The stream resumes from the last seen resume token after a network error or
+a primary step-down, so no event is skipped. Change streams need a replica
+set (a single node is enough, see bench/replset.py); on a standalone server
+the watcher logs once and stops, and the caches keep relying on their
+periodic refreshes.
+
+Configuration (environment):
+    USER_CHANGE_STREAM                "false" disables the watcher (default true)
+    USER_CHANGE_STREAM_RETRY_SECONDS  wait before reopening a failed stream (default 5)
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, FrozenSet, List, Optional
+
+from pymongo.errors import OperationFailure
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+USER_CHANGE_STREAM = os.getenv("USER_CHANGE_STREAM", "true").lower() == "true"
+USER_CHANGE_STREAM_RETRY_SECONDS = float(os.getenv("USER_CHANGE_STREAM_RETRY_SECONDS", "5"))
+
+# Server error codes
+_NOT_REPLICA_SET = (40573, 20)  # $changeStream on a standalone server / IllegalOperation
+_RESUME_IMPOSSIBLE = (260, 280, 286)  # InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost
+
+# Only what the caches need: changed field names, never their values (password
+# hashes, OTP codes), and the auth state and suggestion fields of the document
+# after the change
+_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+    {"$project": {
+        "operationType": 1,
+        "documentKey": 1,
+        "fullDocument.token_version": 1,
+        "fullDocument.is_active": 1,
+        "fullDocument.role": 1,
+        "fullDocument.username": 1,
+        "fullDocument.full_name": 1,
+        "fullDocument.avatar_url": 1,
+        "changed": {"$concatArrays": [
+            {"$map": {
+                "input": {"$objectToArray": {"$ifNull": ["$updateDescription.updatedFields", {}]}},
+                "in": "$$this.k",
+            }},
+            {"$ifNull": ["$updateDescription.removedFields", []]},
+        ]},
+    }},
+]
+
+events_total = registry.counter("user_change_events_total", "User change stream events, by operation")
+restarts_total = registry.counter("user_change_stream_restarts_total", "User change stream reopenings, by reason")
+
+
+@dataclass(frozen=True)
+class UserChange:
+    operation: str
+    user_id: Optional[str] = None
+    # Changed top-level fields for updates, None when the whole document changed
+    fields: Optional[FrozenSet[str]] = None
+    # token_version / is_active / role / username / full_name / avatar_url
+    # after the change, None for deletes
+    document: Optional[dict] = None
+
+    def touches(self, *fields: str) -> bool:
+        """Whether the change may affect any of ``fields``."""
+        if self.fields is None:
+            return True
+        return any(field.split(".")[0] in fields for field in self.fields)
+
+
+def _to_change(event: dict) -> UserChange:
+    operation = event["operationType"]
+    fields = None
+    if operation == "update":
+        fields = frozenset(field.split(".")[0] for field in event.get("changed", []))
+    return UserChange(
+        operation=operation,
+        user_id=str(event["documentKey"]["_id"]),
+        fields=fields,
+        document=event.get("fullDocument"),
+    )
+
+
+class UserChangeWatcher:
+    def __init__(self):
+        self._subscribers: List[Callable[[UserChange], None]] = []
+        self.resume_token: Optional[dict] = None
+        self.live = False
+
+    def subscribe(self, callback: Callable[[UserChange], None]) -> None:
+        self._subscribers.append(callback)
+
+    def publish(self, change: UserChange) -> None:
+        events_total.inc(operation=change.operation)
+        for callback in self._subscribers:
+            try:
+                callback(change)
+            except Exception as e:
+                logger.error("User change subscriber %s failed: %s", getattr(callback, "__qualname__", callback), e)
+
+    async def run(self, get_db: Callable[[], Awaitable]) -> None:
+        """Tail the users collection until cancelled, reopening the stream on errors."""
+        while True:
+            try:
+                db = await get_db()
+                async with db.users.watch(
+                    _PIPELINE, full_document="updateLookup", resume_after=self.resume_token
+                ) as stream:
+                    self.live = True
+                    logger.info("Watching user changes", extra={"resumed": self.resume_token is not None})
+                    while stream.alive:
+                        event = await stream.try_next()
+                        # Advances on empty batches too, so a quiet collection does not age the token out
+                        self.resume_token = stream.resume_token
+                        if event is not None:
+                            self.publish(_to_change(event))
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in _NOT_REPLICA_SET:
+                    logger.info("Change streams unavailable (not a replica set), relying on periodic refresh")
+                    self.live = False
+                    return
+                if e.code in _RESUME_IMPOSSIBLE:
+                    logger.warning("Cannot resume user change stream, caches reset: %s", e)
+                    self.resume_token = None
+                    self.publish(UserChange(operation="reset"))
+                    restarts_total.inc(reason="reset")
+                else:
+                    logger.warning("User change stream failed: %s", e)
+                    restarts_total.inc(reason="error")
+            except Exception as e:
+                logger.warning("User change stream failed: %s", e)
+                restarts_total.inc(reason="error")
+            self.live = False
+            await asyncio.sleep(USER_CHANGE_STREAM_RETRY_SECONDS)
+
+
+user_changes = UserChangeWatcher()
+
+
+async def watch_user_changes() -> None:
+    """Background task body for the app lifespan."""
+    from database import get_database
+    await user_changes.run(get_database)
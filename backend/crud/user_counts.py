@@ -0,0 +1,76 @@
+"""
+Total counts for paginated user listings.
+
+``count_documents`` scans every matching index entry, which is too expensive
+to repeat for each page an admin flips through. Totals come from the
+cheapest source that fits the request:
+
+    estimated  no filter: collection metadata (estimated_document_count)
+    counter    role / is_active filters: the maintained counters of
+               crud/user_stats.py
+    cached     role / is_active filters before the counters exist:
+               count_documents, cached for COUNT_CACHE_TTL_SECONDS per
+               filter and dropped when any instance changes users
+               (directly here, through the change stream elsewhere)
+    exact      ``exact=True``: count_documents, always
+"""
+import os
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+COUNT_CACHE_TTL_SECONDS = float(os.getenv("COUNT_CACHE_TTL_SECONDS", "30"))
+
+# filter key -> (expires at, count)
+_cached_counts: Dict[Tuple, Tuple[float, int]] = {}
+
+
+def invalidate_counts() -> None:
+    """Forget cached totals after a create, delete, role or status change."""
+    _cached_counts.clear()
+
+
+def on_user_change(change) -> None:
+    """user_changes subscriber: drop cached totals the change may affect."""
+    if change.operation != "update" or change.touches("role", "is_active"):
+        invalidate_counts()
+
+
+def _counter_value(totals: Dict, query: Dict) -> int:
+    role = getattr(query.get("role"), "value", query.get("role"))
+    status = None
+    if "is_active" in query:
+        status = "active" if query["is_active"] else "inactive"
+
+    if role and status:
+        return totals.get("role_status", {}).get(f"{role}_{status}", 0)
+    if role:
+        return totals.get("role", {}).get(role, 0)
+    return totals.get("status", {}).get(status, 0)
+
+
+class UserCounter:
+    def __init__(self, collection, stats=None, session=None):
+        self.collection = collection
+        self.stats = stats
+        self.session = session
+
+    async def total(self, query: Dict, exact: bool = False) -> Tuple[int, str]:
+        """Return (total, source); source is "estimated", "counter", "cached" or "exact"."""
+        if exact:
+            return await self.collection.count_documents(query, session=self.session), "exact"
+        if not query:
+            return await self.collection.estimated_document_count(), "estimated"
+
+        if self.stats is not None and set(query) <= {"role", "is_active"}:
+            totals = await self.stats.get_totals()
+            if totals is not None:
+                return _counter_value(totals, query), "counter"
+
+        key = tuple(sorted(query.items()))
+        cached: Optional[Tuple[float, int]] = _cached_counts.get(key)
+        if cached and cached[0] > monotonic():
+            return cached[1], "cached"
+
+        count = await self.collection.count_documents(query, session=self.session)
+        _cached_counts[key] = (monotonic() + COUNT_CACHE_TTL_SECONDS, count)
+        return count, "exact"
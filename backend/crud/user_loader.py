@@ -0,0 +1,107 @@
+"""
+Request-scoped batching of user lookups (the DataLoader pattern).
+
+``load`` calls made in the same event loop iteration are collected and sent
+as one query on the next iteration: an ``$in`` per lookup key (``_id``,
+``email``, ``username``), joined with ``$or`` when several keys are used. Repeated keys share one result, and every result is memoized
+for the life of the loader, which is one request (see ``UserCRUD.loader``).
+``clear`` drops the memo; UserCRUD calls it after each of its writes, so a
+lookup made after a write in the same request reads again.
+"""
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+LOOKUP_KEYS = ("_id", "email", "username")
+
+
+class UserLoader:
+    def __init__(self, collection, projection: Optional[dict] = None, session=None):
+        self.collection = collection
+        # The lookup keys are needed to match documents back to requests
+        self.projection = {**projection, **{key: 1 for key in LOOKUP_KEYS}} if projection else None
+        self.session = session
+        # (key, normalized value) -> future resolved with the document or None
+        self._results: Dict[tuple, asyncio.Future] = {}
+        # key -> {normalized value: future}, waiting for the next dispatch
+        self._queue: Dict[str, Dict] = {key: {} for key in LOOKUP_KEYS}
+        self._dispatch_scheduled = False
+        self.queries = 0
+
+    @staticmethod
+    def _normalize(key: str, value):
+        if key == "_id":
+            try:
+                return ObjectId(value)
+            except (InvalidId, TypeError):
+                return None
+        if key == "email":
+            return value.lower()
+        return value
+
+    def load(self, key: str, value) -> "asyncio.Future[Optional[dict]]":
+        """Future for the user whose ``key`` equals ``value`` (None if there is none)."""
+        if key not in LOOKUP_KEYS:
+            raise ValueError(f"Unsupported lookup key: {key}")
+
+        loop = asyncio.get_running_loop()
+        normalized = self._normalize(key, value)
+        cached = self._results.get((key, normalized))
+        if cached is not None:
+            return cached
+
+        future = loop.create_future()
+        self._results[(key, normalized)] = future
+        if normalized is None:
+            future.set_result(None)
+            return future
+
+        self._queue[key][normalized] = future
+        if not self._dispatch_scheduled:
+            self._dispatch_scheduled = True
+            loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return future
+
+    def clear(self) -> None:
+        """Forget memoized results; lookups already queued still resolve."""
+        self._results = {}
+
+    async def load_many(self, key: str, values: Iterable) -> List[Optional[dict]]:
+        """Documents for ``values`` in the same order, None where missing."""
+        return list(await asyncio.gather(*(self.load(key, value) for value in values)))
+
+    async def _dispatch(self) -> None:
+        self._dispatch_scheduled = False
+        batches = {key: pending for key, pending in self._queue.items() if pending}
+        self._queue = {key: {} for key in LOOKUP_KEYS}
+        if not batches:
+            return
+
+        clauses = [{key: {"$in": list(pending)}} for key, pending in batches.items()]
+        query = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+        self.queries += 1
+        try:
+            cursor = self.collection.find(query, self.projection, session=self.session)
+            found = {key: {} for key in batches}
+            async for doc in cursor:
+                for key in batches:
+                    if key in doc:
+                        found[key][doc[key]] = doc
+        except Exception as e:
+            self._settle(batches, lambda future, key, value: future.set_exception(e))
+            # Not memoized: a later load retries
+            for key, pending in batches.items():
+                for value, future in pending.items():
+                    if self._results.get((key, value)) is future:
+                        del self._results[(key, value)]
+            return
+
+        self._settle(batches, lambda future, key, value: future.set_result(found[key].get(value)))
+
+    def _settle(self, batches: Dict[str, Dict], resolve) -> None:
+        for key, pending in batches.items():
+            for value, future in pending.items():
+                if not future.done():
+                    resolve(future, key, value)
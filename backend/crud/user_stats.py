@@ -0,0 +1,233 @@
+"""
+Incrementally maintained user statistics.
+
+The ``user_stats`` collection holds one ``totals`` document and one
+``signups:<YYYY-MM-DD>`` document per day, so the admin dashboard reads a
+handful of small documents however many users there are:
+
+    {"_id": "totals", "total": 120,
+     "role": {"admin": 2, "user": 118},
+     "status": {"active": 110, "inactive": 10},
+     "verification": {"verified": 100, "unverified": 20},
+     "provider": {"email": 90, "google": 30},
+     "role_status": {"admin_active": 2, "user_active": 108, "user_inactive": 10},
+     "reconciled_at": ...}
+
+UserCRUD write paths pass the user document before and after the write to
+``UserStats.apply``, which ``$inc``s the difference. Writes that bypass the
+CRUD (scripts, the bench fixtures, a failed counter update) cause drift, which
+``reconcile`` corrects every ``STATS_RECONCILE_SECONDS``: it recounts on the
+primary with two aggregations and ``$inc``s the difference, so increments
+applied meanwhile are kept.
+
+The user write and its counter update are two separate writes, so a recount
+can never be exact against writes in flight: one whose user document is
+counted but whose ``$inc`` lands after the recount is counted twice. The
+error is bounded by the writes in flight during a recount and is itself
+drift, corrected by the next run. Removing it would take a transaction around
+every user write and its counter update.
+"""
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", "3600"))
+
+TOTALS_ID = "totals"
+SIGNUPS_PREFIX = "signups:"
+# Fields the counters depend on, for projections on write paths
+STATS_FIELDS = {"role": 1, "is_active": 1, "is_verified": 1, "auth_provider": 1, "created_at": 1}
+# Nested counter sections of the totals document
+_SECTIONS = ("role", "status", "verification", "provider", "role_status")
+# Recounts raced by writes before giving up until the next run
+_RECONCILE_ATTEMPTS = 3
+
+
+def _value(field):
+    return getattr(field, "value", field)
+
+
+def user_buckets(user: dict) -> List[str]:
+    """Counter fields (dotted paths in the totals document) a user counts towards."""
+    role = _value(user.get("role")) or "user"
+    status = "active" if user.get("is_active", True) else "inactive"
+    verification = "verified" if user.get("is_verified") else "unverified"
+    provider = _value(user.get("auth_provider")) or "email"
+    return [
+        "total",
+        f"role.{role}",
+        f"status.{status}",
+        f"verification.{verification}",
+        f"provider.{provider}",
+        f"role_status.{role}_{status}",
+    ]
+
+
+def transition(before: Optional[dict], after: Optional[dict]) -> Dict[str, int]:
+    """``$inc`` document turning the counts for ``before`` into those for ``after``."""
+    delta = Counter()
+    if before is not None:
+        delta.subtract(user_buckets(before))
+    if after is not None:
+        delta.update(user_buckets(after))
+    return {field: n for field, n in delta.items() if n}
+
+
+def _signup_day(user: dict) -> str:
+    return (user.get("created_at") or datetime.utcnow()).strftime("%Y-%m-%d")
+
+
+class UserStats:
+    def __init__(self, db, session=None):
+        self.db = db
+        self.session = session
+
+    async def apply(self, before: Optional[dict], after: Optional[dict]) -> None:
+        """
+        Record a user write: ``before`` is None for a new user, ``after`` is
+        None for a deleted one. Failures are logged, the reconciler repairs them.
+        """
+        await self.apply_many([(before, after)])
+
+    async def apply_many(self, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> None:
+        """``apply`` for many writes at once (bulk deletes), in one bulk_write."""
+        delta, days = Counter(), Counter()
+        for before, after in changes:
+            delta.update(transition(before, after))
+            if before is None or after is None:
+                days[_signup_day(after if before is None else before)] += 1 if before is None else -1
+
+        ops = []
+        delta = {field: n for field, n in delta.items() if n}
+        if delta:
+            ops.append(UpdateOne({"_id": TOTALS_ID}, {"$inc": delta}, upsert=True))
+        for day, n in days.items():
+            if n:
+                ops.append(UpdateOne(
+                    {"_id": f"{SIGNUPS_PREFIX}{day}"},
+                    {"$inc": {"count": n}, "$set": {"date": day}},
+                    upsert=True
+                ))
+        if not ops:
+            return
+
+        try:
+            await self.db.user_stats.bulk_write(ops, ordered=False, session=self.session)
+        except Exception as e:
+            logger.error("Error updating user stats: %s", e)
+
+    async def get_totals(self) -> Optional[dict]:
+        return await self.db.user_stats.find_one({"_id": TOTALS_ID}, session=self.session)
+
+    async def get_signups(self, days: int) -> List[dict]:
+        """Signups per day for the last ``days`` days, oldest first, zero-filled."""
+        today = datetime.utcnow().date()
+        dates = [(today - timedelta(days=n)).isoformat() for n in range(days - 1, -1, -1)]
+        cursor = self.db.user_stats.find(
+            {"_id": {"$gte": f"{SIGNUPS_PREFIX}{dates[0]}", "$lte": f"{SIGNUPS_PREFIX}{dates[-1]}"}},
+            session=self.session
+        )
+        counts = {doc["date"]: doc.get("count", 0) async for doc in cursor}
+        return [{"date": date, "count": counts.get(date, 0)} for date in dates]
+
+    async def _snapshot(self) -> Tuple[Counter, Counter]:
+        """Current counters from the primary: (totals as dotted fields, signups by day)."""
+        totals, days = Counter(), Counter()
+        async for doc in self.db.user_stats.find({}, session=self.session):
+            if doc["_id"] == TOTALS_ID:
+                totals["total"] = doc.get("total", 0)
+                for section in _SECTIONS:
+                    for key, n in (doc.get(section) or {}).items():
+                        totals[f"{section}.{key}"] = n
+            elif doc["_id"].startswith(SIGNUPS_PREFIX):
+                days[doc["date"]] = doc.get("count", 0)
+        return totals, days
+
+    async def _count(self) -> Tuple[Counter, Counter]:
+        """Recount from the users collection on the primary, same shape as ``_snapshot``."""
+        totals, days = Counter(), Counter()
+        groups = self.db.users.aggregate([
+            {"$group": {
+                "_id": {
+                    "role": {"$ifNull": ["$role", "user"]},
+                    "is_active": {"$ifNull": ["$is_active", True]},
+                    "is_verified": {"$ifNull": ["$is_verified", False]},
+                    "auth_provider": {"$ifNull": ["$auth_provider", "email"]},
+                },
+                "n": {"$sum": 1},
+            }}
+        ], session=self.session)
+        async for group in groups:
+            for field in user_buckets(group["_id"]):
+                totals[field] += group["n"]
+
+        signups = self.db.users.aggregate([
+            {"$match": {"created_at": {"$type": "date"}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                "count": {"$sum": 1},
+            }}
+        ], session=self.session)
+        async for day in signups:
+            days[day["_id"]] = day["count"]
+        return totals, days
+
+    async def reconcile(self) -> Optional[dict]:
+        """
+        Recount on the primary and ``$inc`` the counters by the difference.
+
+        A secondary could lag by up to max-staleness, and replacing the
+        documents would drop every ``$inc`` applied while counting. Instead
+        the counters are read before and after the recount; if they moved,
+        a write raced the recount and it is retried. A write whose ``$inc``
+        is still in flight when the difference is applied is not detected
+        and counted twice (see the module docstring); the next run corrects
+        it. Returns the recounted totals, or None when writes kept racing
+        (the next run tries again).
+        """
+        for _ in range(_RECONCILE_ATTEMPTS):
+            before = await self._snapshot()
+            counted = await self._count()
+            if await self._snapshot() == before:
+                break
+        else:
+            logger.warning("User stats changed during every recount, not reconciled")
+            return None
+
+        (totals_before, days_before), (totals, days) = before, counted
+        drift = {field: totals[field] - totals_before[field] for field in {*totals, *totals_before}}
+        drift = {field: n for field, n in drift.items() if n}
+        now = datetime.utcnow()
+        ops = [UpdateOne({"_id": TOTALS_ID}, {"$inc": drift, "$set": {"reconciled_at": now}}, upsert=True)]
+        for day in {*days, *days_before}:
+            if days[day] != days_before[day]:
+                ops.append(UpdateOne(
+                    {"_id": f"{SIGNUPS_PREFIX}{day}"},
+                    {"$inc": {"count": days[day] - days_before[day]}, "$set": {"date": day}},
+                    upsert=True
+                ))
+        await self.db.user_stats.bulk_write(ops, ordered=False, session=self.session)
+        # Days whose users have all been deleted
+        await self.db.user_stats.delete_many(
+            {"_id": {"$regex": f"^{SIGNUPS_PREFIX}"}, "count": {"$lte": 0}}, session=self.session
+        )
+
+        logger.info("Reconciled user stats",
+                    extra={"total": totals["total"], "days": len(days), "drift": drift})
+        result = {"total": totals.pop("total", 0), "reconciled_at": now}
+        for field, n in totals.items():
+            section, key = field.split(".", 1)
+            result.setdefault(section, {})[key] = n
+        return result
+
+
+async def reconcile_user_stats(db) -> dict:
+    """Scheduled job (see crud/maintenance.py): correct counter drift."""
+    totals = await UserStats(db).reconcile()
+    return {"total": totals["total"] if totals else None}
@@ -0,0 +1,280 @@
+"""
+Type-ahead suggestions for usernames and names (``GET /users/suggest``).
+
+``search_users`` runs an unanchored, case-insensitive regex, which scans
+every document. Suggestions instead match an anchored prefix against two
+normalized fields (lowercased, accents stripped) stored on each user and
+indexed, so MongoDB only walks the index range of the prefix:
+
+    username_lower  "jane_doe"
+    name_terms      ["jane van doe", "van doe", "doe"]
+
+``name_terms`` holds the full name from each word on, so "doe" and
+"jane va" both match. Only active users are suggested, and only their id,
+username, full name and avatar are returned.
+
+With ``USER_SUGGEST_INDEX`` each instance also keeps the same terms in a
+sorted in-memory list, warmed at startup and kept current by this
+instance's writes and the users change stream (crud/user_changes.py); a
+lookup is then a binary search and no round trip. Until it is warmed, and
+when it is disabled, suggestions are read from MongoDB.
+
+Results are ranked exact username, username prefix, full name prefix, then
+later-word prefix, shorter usernames first, and capped at
+``USER_SUGGEST_MAX_RESULTS``.
+
+Configuration (environment):
+    USER_SUGGEST_INDEX        "true" keeps the in-memory index (default false)
+    USER_SUGGEST_MAX_RESULTS  largest ``limit`` a caller may ask for (default 20)
+"""
+import asyncio
+import heapq
+import logging
+import os
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from pymongo import UpdateOne
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+USER_SUGGEST_INDEX = os.getenv("USER_SUGGEST_INDEX", "false").lower() == "true"
+USER_SUGGEST_MAX_RESULTS = int(os.getenv("USER_SUGGEST_MAX_RESULTS", "20"))
+
+# Longest prefix considered; suggestions past this are not useful
+MAX_PREFIX_LENGTH = 64
+# Index entries examined per lookup before ranking; bounds short, common prefixes
+_SCAN_LIMIT = 500
+# Documents per backfill write
+_BACKFILL_BATCH = 500
+
+SUGGEST_PROJECTION = {"username": 1, "full_name": 1, "avatar_url": 1, "is_active": 1}
+
+suggestions_total = registry.counter("user_suggestions_total", "Suggestion lookups, by source (index, mongo)")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase, strip accents and collapse whitespace: "  Zoë  Ann" -> "zoe ann"."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.casefold().split())
+
+
+def name_terms(full_name: Optional[str]) -> List[str]:
+    words = normalize(full_name).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+def suggest_fields(username: Optional[str] = None, full_name: Optional[str] = None) -> dict:
+    """The stored suggestion fields for whichever of ``username`` / ``full_name`` is given."""
+    fields = {}
+    if username is not None:
+        fields["username_lower"] = normalize(username)
+    if full_name is not None:
+        fields["name_terms"] = name_terms(full_name)
+    return fields
+
+
+def to_suggestion(user_id: str, doc: dict) -> dict:
+    return {
+        "id": user_id,
+        "username": doc.get("username"),
+        "full_name": doc.get("full_name"),
+        "avatar_url": doc.get("avatar_url"),
+    }
+
+
+def rank(prefix: str, username: str, full_name: str) -> Tuple[int, int, str]:
+    """Sort key for normalized ``username`` / ``full_name``, lower is better."""
+    if username == prefix:
+        tier = 0
+    elif username.startswith(prefix):
+        tier = 1
+    elif full_name.startswith(prefix):
+        tier = 2
+    else:
+        tier = 3
+    return tier, len(username), username
+
+
+def ranked(prefix: str, candidates: Sequence[dict], limit: int) -> List[dict]:
+    return sorted(
+        candidates,
+        key=lambda suggestion: rank(prefix, normalize(suggestion["username"]), normalize(suggestion["full_name"]))
+    )[:limit]
+
+
+class _Entry(NamedTuple):
+    suggestion: dict
+    terms: Tuple[str, ...]
+    # Normalized once, for ranking
+    username: str
+    full_name: str
+
+
+def _entry(user_id: str, doc: dict) -> _Entry:
+    username, full_name = normalize(doc.get("username")), normalize(doc.get("full_name"))
+    terms = tuple(dict.fromkeys([username, *name_terms(full_name)]))
+    return _Entry(to_suggestion(user_id, doc), terms, username, full_name)
+
+
+class SuggestIndex:
+    def __init__(self):
+        # (term, user id), sorted; a prefix is a contiguous range
+        self._terms: List[Tuple[str, str]] = []
+        # user id -> _Entry
+        self._users: Dict[str, _Entry] = {}
+        self._ready = False
+        # Writes seen while warming, replayed over the loaded snapshot
+        self._replay: Optional[List[Tuple[str, Optional[dict]]]] = None
+        self._warming: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """False until warmed; callers fall back to MongoDB."""
+        return self._ready
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _tracking(self) -> bool:
+        return self._ready or self._replay is not None
+
+    def put(self, user_id: str, doc: dict) -> None:
+        """A user was created or changed; ``doc`` needs username, full_name, avatar_url, is_active."""
+        if self._replay is not None:
+            self._replay.append((user_id, doc))
+        if self._ready:
+            self._put(user_id, doc)
+
+    def remove(self, user_id: str) -> None:
+        if self._replay is not None:
+            self._replay.append((user_id, None))
+        if self._ready:
+            self._remove(user_id)
+
+    def _put(self, user_id: str, doc: dict) -> None:
+        self._remove(user_id)
+        if doc.get("is_active", True) is False:
+            return
+        entry = _entry(user_id, doc)
+        for term in entry.terms:
+            insort(self._terms, (term, user_id))
+        self._users[user_id] = entry
+
+    def _remove(self, user_id: str) -> None:
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            return
+        for term in entry.terms:
+            position = bisect_left(self._terms, (term, user_id))
+            if position < len(self._terms) and self._terms[position] == (term, user_id):
+                del self._terms[position]
+
+    def search(self, prefix: str, limit: int) -> List[dict]:
+        candidates: Dict[str, _Entry] = {}
+        position = bisect_left(self._terms, (prefix,))
+        end = min(position + _SCAN_LIMIT, len(self._terms))
+        while position < end:
+            term, user_id = self._terms[position]
+            if not term.startswith(prefix):
+                break
+            candidates.setdefault(user_id, self._users[user_id])
+            position += 1
+        best = heapq.nsmallest(
+            limit, candidates.values(), key=lambda entry: rank(prefix, entry.username, entry.full_name)
+        )
+        return [entry.suggestion for entry in best]
+
+    async def warm(self, db) -> int:
+        """Load every active user; writes made meanwhile are replayed on top."""
+        self._replay = []
+        try:
+            users: Dict[str, _Entry] = {}
+            terms: List[Tuple[str, str]] = []
+            async for doc in db.users.find({"is_active": {"$ne": False}}, SUGGEST_PROJECTION):
+                user_id = str(doc["_id"])
+                users[user_id] = entry = _entry(user_id, doc)
+                terms.extend((term, user_id) for term in entry.terms)
+            terms.sort()
+
+            self._users, self._terms = users, terms
+            for user_id, doc in self._replay:
+                if doc is None:
+                    self._remove(user_id)
+                else:
+                    self._put(user_id, doc)
+            self._ready = True
+        finally:
+            self._replay = None
+        logger.info("Suggestion index warmed with %d users", len(users))
+        return len(users)
+
+    def apply_change(self, change) -> None:
+        """user_changes subscriber: keep up with writes made by other instances."""
+        if not self._tracking():
+            return
+        if change.operation == "reset":
+            # Events were missed: serve from MongoDB until warmed again
+            self._ready = False
+            if self._warming is None or self._warming.done():
+                self._warming = asyncio.create_task(warm_suggest_index(), name="suggest-index")
+        elif change.operation == "delete":
+            self.remove(change.user_id)
+        elif change.document is not None and change.touches("username", "full_name", "avatar_url", "is_active"):
+            self.put(change.user_id, change.document)
+
+
+suggest_index = SuggestIndex()
+
+
+async def warm_suggest_index() -> None:
+    """Background task body: load the in-memory index."""
+    from database import get_database
+    try:
+        await suggest_index.warm(await get_database())
+    except Exception as e:
+        logger.warning("Could not warm the suggestion index: %s", e)
+
+
+async def backfill_suggest_fields(db) -> int:
+    """
+    Store username_lower / name_terms on users created before they existed.
+    Missing fields index as null, so the lookup uses the username_lower index.
+    """
+    filled = 0
+    while True:
+        docs = await db.users.find({"username_lower": None}, {"username": 1, "full_name": 1}) \
+            .limit(_BACKFILL_BATCH).to_list(length=_BACKFILL_BATCH)
+        if not docs:
+            break
+        # Matched on the values read, so a rename in between is not overwritten
+        result = await db.users.bulk_write([
+            UpdateOne(
+                {"_id": doc["_id"], "username": doc.get("username"), "full_name": doc.get("full_name")},
+                {"$set": suggest_fields(doc.get("username") or "", doc.get("full_name") or "")}
+            )
+            for doc in docs
+        ], ordered=False)
+        filled += result.modified_count
+        if len(docs) < _BACKFILL_BATCH or result.matched_count == 0:
+            break
+    if filled:
+        logger.info("Backfilled suggestion fields on %d users", filled)
+    return filled
+
+
+async def prepare_suggestions() -> None:
+    """Startup task body: backfill the stored fields, then warm the index if enabled."""
+    from database import get_database
+    try:
+        await backfill_suggest_fields(await get_database())
+    except Exception as e:
+        logger.warning("Could not backfill suggestion fields: %s", e)
+    if USER_SUGGEST_INDEX:
+        await warm_suggest_index()
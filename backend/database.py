@@ -1,52 +1,192 @@
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.monitoring import TopologyListener
+from pymongo.read_preferences import SecondaryPreferred
+import logging
 import os
-from typing import Optional
+from time import monotonic
+from typing import Optional, Tuple
 from dotenv import load_dotenv
 
+from utils.security import ACCESS_TOKEN_EXPIRE_DAYS
+
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "lms_db")
+# MongoDB rejects maxStalenessSeconds below 90
+ANALYTICS_MAX_STALENESS_SECONDS = max(int(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "90")), 90)
+
+# Admin listing, search and stats may lag the primary a little; auth reads
+# keep the client default (primary). Without secondaries this reads the primary.
+ANALYTICS_READ_PREFERENCE = SecondaryPreferred(max_staleness=ANALYTICS_MAX_STALENESS_SECONDS)
+
+# After a failed connection attempt, requests fail fast for this long
+DB_RETRY_SECONDS = float(os.getenv("DB_RETRY_SECONDS", "5"))
+
+class DatabaseUnavailable(Exception):
+    """MongoDB cannot be reached right now; answered with 503 by main.py."""
 
 class MongoDB:
     client: Optional[AsyncIOMotorClient] = None
     is_connected: bool = False
+    last_error: Optional[str] = None
+    retry_at: float = 0.0
+    connecting: Optional[asyncio.Task] = None
 
 mongodb = MongoDB()
 
-async def get_database():
-    """Get database connection with lazy initialization."""
+class _PrimaryMonitor(TopologyListener):
+    """
+    Driver topology events: losing the last writable server enters the
+    degraded state right away, so CRUD calls need no ping of their own.
+    Called on a driver monitor thread; it only sets flags.
+    """
+
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        if event.previous_description.has_writable_server() and not event.new_description.has_writable_server():
+            mark_unavailable(ConnectionError("no writable MongoDB server"))
+
+    def closed(self, event):
+        pass
+
+async def _connect():
+    """Create the one client for this process (once) and ping it."""
     if mongodb.client is None:
-        print(f"🔗 Connecting to MongoDB...")
-        
-        try:
-            mongodb.client = AsyncIOMotorClient(
-                MONGODB_URL,
-                serverSelectionTimeoutMS=15000,
-                connectTimeoutMS=15000,
-                maxPoolSize=10,
-                retryWrites=True
-            )
-            
-            # Test connection
-            await mongodb.client.admin.command('ping')
-            mongodb.is_connected = True
-            print("✅ Successfully connected to MongoDB!")
-            
-        except Exception as e:
-            print(f"❌ Connection failed: {e}")
-            mongodb.is_connected = False
-            # Still create the client for fallback operations
-            mongodb.client = AsyncIOMotorClient(MONGODB_URL)
-    
+        logger.info("Connecting to MongoDB")
+        mongodb.client = AsyncIOMotorClient(
+            MONGODB_URL,
+            serverSelectionTimeoutMS=15000,
+            connectTimeoutMS=15000,
+            maxPoolSize=10,
+            retryWrites=True,
+            event_listeners=[_PrimaryMonitor()]
+        )
+
+    try:
+        await mongodb.client.admin.command('ping')
+    except Exception as e:
+        mark_unavailable(e)
+        return
+
+    mongodb.is_connected = True
+    mongodb.last_error = None
+    logger.info("Connected to MongoDB")
+
+def _clear_connecting(task: asyncio.Task) -> None:
+    if mongodb.connecting is task:
+        mongodb.connecting = None
+
+def mark_unavailable(error: Exception) -> None:
+    """
+    Enter the degraded state: requests get DatabaseUnavailable until the next
+    reconnection attempt, DB_RETRY_SECONDS from now. The client is kept, its
+    pool reconnects on its own once MongoDB is back.
+    """
+    if mongodb.is_connected or mongodb.last_error is None:
+        logger.error("MongoDB connection failed: %s", error)
+    mongodb.is_connected = False
+    mongodb.last_error = str(error)
+    mongodb.retry_at = monotonic() + DB_RETRY_SECONDS
+
+async def get_database():
+    """
+    Get the database, connecting on first use.
+
+    Concurrent callers share a single connection attempt. While MongoDB is
+    unreachable this raises DatabaseUnavailable instead of handing out a
+    client that would hang every query until its timeout.
+    """
+    if not mongodb.is_connected:
+        if mongodb.connecting is None:
+            if mongodb.last_error is not None and monotonic() < mongodb.retry_at:
+                raise DatabaseUnavailable(mongodb.last_error)
+            mongodb.connecting = asyncio.create_task(_connect())
+            mongodb.connecting.add_done_callback(_clear_connecting)
+        # Shielded so a cancelled request does not abort the attempt for everyone else
+        await asyncio.shield(mongodb.connecting)
+        if not mongodb.is_connected:
+            raise DatabaseUnavailable(mongodb.last_error)
+
     return mongodb.client[DATABASE_NAME]
 
+def database_status() -> dict:
+    if mongodb.is_connected:
+        return {"status": "connected"}
+    if mongodb.client is None and mongodb.last_error is None:
+        return {"status": "not_connected"}
+    # The error itself is logged, not exposed on the public health endpoint
+    return {"status": "unavailable"}
+
+class CausalReadTracker:
+    """
+    Last write seen by each caller, so their next request can read it back
+    from a secondary.
+
+    A causally consistent session advanced to the caller's last operation time
+    makes secondaries wait until they have replicated that write. Entries are
+    dropped after ANALYTICS_MAX_STALENESS_SECONDS, by then any eligible
+    secondary has caught up anyway. The map is per process; a caller whose
+    next request lands on another instance gets the usual bounded staleness.
+    """
+
+    def __init__(self):
+        # Oldest first: every entry lives equally long, so expiry order is insertion order
+        self._times: "OrderedDict[str, Tuple[float, dict, object]]" = OrderedDict()
+
+    def remember(self, key: str, session) -> None:
+        if session.operation_time is None:
+            return
+        now = monotonic()
+        while self._times and next(iter(self._times.values()))[0] <= now:
+            self._times.popitem(last=False)
+        self._times.pop(key, None)
+        self._times[key] = (now + ANALYTICS_MAX_STALENESS_SECONDS, session.cluster_time, session.operation_time)
+
+    def advance(self, key: str, session) -> None:
+        entry = self._times.get(key)
+        if entry is None or entry[0] <= monotonic():
+            return
+        _, cluster_time, operation_time = entry
+        if cluster_time is not None:
+            session.advance_cluster_time(cluster_time)
+        session.advance_operation_time(operation_time)
+
+
+causal_reads = CausalReadTracker()
+
+
+@asynccontextmanager
+async def causal_session(key: Optional[str] = None):
+    """
+    Causally consistent session: reads in it see the writes made before them
+    in it, even on secondaries. With ``key``, the session also continues from
+    that caller's previous session and is remembered for the next one.
+    """
+    await get_database()
+    async with await mongodb.client.start_session(causal_consistency=True) as session:
+        if key:
+            causal_reads.advance(key, session)
+        yield session
+        if key:
+            causal_reads.remember(key, session)
+
 async def close_mongo_connection():
     """Close MongoDB connection."""
     if mongodb.client:
         mongodb.client.close()
-        print("🔌 MongoDB connection closed")
+        mongodb.client = None
+        mongodb.is_connected = False
+        logger.info("MongoDB connection closed")
 
 async def create_essential_indexes():
     """
@@ -59,13 +199,34 @@ async def create_essential_indexes():
         
         # Test connection first
         await db.command('ping')
-        print("📊 Creating essential indexes...")
+        logger.info("Creating essential indexes")
         
         # ONLY critical indexes for data integrity
         await db.users.create_index("email", unique=True)
         await db.users.create_index("username", unique=True)
+        # Type-ahead: anchored prefix queries on normalized values (crud/user_suggest.py)
+        await db.users.create_index("username_lower")
+        await db.users.create_index("name_terms")
+        # Filtered admin listings and their counts
+        await db.users.create_index([("role", 1), ("is_active", 1)])
+        # Incremental refresh of the token revocation map
+        await db.users.create_index("updated_at")
+        # Maintenance jobs (crud/maintenance.py): only the rows they are after are indexed
+        await db.users.create_index(
+            "created_at", name="unverified_created_at",
+            partialFilterExpression={"is_verified": False}
+        )
+        for field in ("otp_created_at", "otp_locked_until"):
+            await db.users.create_index(
+                field, name=f"pending_{field}",
+                partialFilterExpression={field: {"$gt": datetime(1970, 1, 1)}}
+            )
+        # Deleted users, kept until their last token has expired
+        await db.token_revocations.create_index(
+            "revoked_at", expireAfterSeconds=ACCESS_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+        )
         
-        print("✅ Essential indexes created successfully")
+        logger.info("Essential indexes created")
         
     except Exception as e:
-        print(f"⚠️  Could not create indexes: {e}")
\ No newline at end of file
+        logger.warning("Could not create indexes: %s", e)
\ No newline at end of file
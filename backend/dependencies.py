@@ -1,24 +1,28 @@
+from dataclasses import dataclass
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from typing import Optional
 
+from crud.token_versions import token_versions
 from database import get_database
 from utils.security import verify_token
 from models.user import User, RoleEnum
+from utils.timing import timed
 
 # OAuth2 scheme for token endpoint - use this consistently
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login", auto_error=False)
 
-async def get_current_user(
-    token: Optional[str] = Depends(oauth2_scheme),
-    db=Depends(get_database)
-):
-    """
-    Get current user from Authorization header only (cookies removed)
-    """
-    from crud.user import UserCRUD
-    crud = UserCRUD(db)
-    
+
+@dataclass
+class TokenUser:
+    """The caller as described by a verified, unrevoked access token"""
+    id: str
+    email: str
+    role: str
+    username: Optional[str] = None
+
+
+def _decode_token(token: Optional[str]) -> dict:
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -34,9 +38,36 @@ async def get_current_user(
             detail="Invalid or expired authentication token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+    return payload
+
+
+async def get_user_crud(db=Depends(get_database)):
+    """
+    The request's UserCRUD. FastAPI caches a dependency per request, so the
+    auth dependencies and the route share it, and with it its UserLoader.
+    """
+    from crud.user import UserCRUD
+    return UserCRUD(db)
+
+
+def _revoked():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Authentication token has been revoked",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+@timed("auth")
+async def get_current_user(
+    token: Optional[str] = Depends(oauth2_scheme),
+    crud=Depends(get_user_crud)
+):
+    """
+    Get current user from Authorization header only (cookies removed)
+    """
+    payload = _decode_token(token)
     email: str = payload.get("sub")
-    role: str = payload.get("role")
     
     if email is None:
         raise HTTPException(
@@ -44,8 +75,10 @@ async def get_current_user(
             detail="Invalid token payload - missing email",
         )
     
-    # Get user from database
-    user = await crud.get_user_by_email(email)
+    # Get user from database; by id through the request's loader when the
+    # token carries one, by email for tokens issued before it did
+    user_id = payload.get("uid")
+    user = await crud.get_user_by_id(user_id) if user_id else await crud.get_user_by_email(email)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -59,20 +92,59 @@ async def get_current_user(
             detail="Account deactivated. Please contact administrator."
         )
     
+    # Tokens issued before the last password/role/status change
+    token_version = payload.get("ver")
+    if token_version is not None and token_version < user.token_version:
+        raise _revoked()
+    
     return user
 
-async def require_admin(current_user: User = Depends(get_current_user)):
+@timed("auth")
+async def get_token_user(
+    token: Optional[str] = Depends(oauth2_scheme),
+    crud=Depends(get_user_crud)
+) -> TokenUser:
+    """
+    Authenticate from the token claims and the in-memory revocation map,
+    without reading the user from MongoDB.
+
+    Tokens issued before token versions existed (no ``uid``/``ver``), or a
+    revocation map that has not been loaded yet, fall back to get_current_user.
+    """
+    payload = _decode_token(token)
+    user_id, token_version = payload.get("uid"), payload.get("ver")
+
+    if user_id is None or token_version is None or not token_versions.ready:
+        user = await get_current_user(token, crud)
+        return TokenUser(id=str(user.id), email=user.email, role=user.role, username=user.username)
+
+    if not token_versions.is_valid(user_id, token_version):
+        if token_versions.is_deactivated(user_id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Account deactivated. Please contact administrator."
+            )
+        raise _revoked()
+
+    return TokenUser(
+        id=user_id,
+        email=payload.get("sub"),
+        role=payload.get("role"),
+        username=payload.get("username"),
+    )
+
+async def require_admin(current_user: TokenUser = Depends(get_token_user)):
     """Require admin role"""
     if current_user.role != RoleEnum.admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
-async def require_user(current_user: User = Depends(get_current_user)):
+async def require_user(current_user: TokenUser = Depends(get_token_user)):
     """Require regular user role (non-admin)"""
     if current_user.role != RoleEnum.user:
         raise HTTPException(status_code=403, detail="User access required")
     return current_user
 
-async def require_any(current_user: User = Depends(get_current_user)):
+async def require_any(current_user: TokenUser = Depends(get_token_user)):
     """Allow any authenticated user"""
     return current_user
\ No newline at end of file
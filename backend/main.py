@@ -1,17 +1,83 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import secrets
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
 
+# Logging must be configured before the routers are imported, they log at import time
+from utils.logger import configure_logging, shutdown_logging
+configure_logging()
+
 # Import routers
 from routers import users
 from routers import auth  # NEW: Import auth router
+from crud.last_login import last_logins
+from crud.token_versions import TOKEN_STATE_REFRESH_SECONDS, refresh_token_versions, token_versions
+from crud.user_changes import USER_CHANGE_STREAM, user_changes, watch_user_changes
+from crud.user_counts import on_user_change as invalidate_counts_on_change
+from crud.user_suggest import prepare_suggestions, suggest_index
+from crud.maintenance import maintenance_jobs
+from database import (
+    DB_RETRY_SECONDS, DatabaseUnavailable, close_mongo_connection, create_essential_indexes, database_status,
+    get_database
+)
+from utils.admission import Overloaded
+from utils.background import start_periodic, stop_tasks
+from utils.compression import CompressionMiddleware, PrecompressedStaticFiles
+from utils.metrics import METRICS_TOKEN, registry
+from utils.scheduler import SCHEDULER, Scheduler
+from utils.timing import ServerTimingMiddleware
+from utils.http_client import create_http_client
+from utils.security import bcrypt_rounds, key_ring
+from utils.capture import TRAFFIC_CAPTURE_FILE, TrafficCaptureMiddleware, start_capture, stop_capture
+
+logger = logging.getLogger(__name__)
+
+# Caches that must see user changes made by other instances
+user_changes.subscribe(token_versions.apply_change)
+user_changes.subscribe(invalidate_counts_on_change)
+user_changes.subscribe(suggest_index.apply_change)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    if TRAFFIC_CAPTURE_FILE:
+        start_capture(TRAFFIC_CAPTURE_FILE)
+    app.state.http_client = create_http_client()
+    # Calibrate the bcrypt cost now rather than on the first signup
+    await asyncio.to_thread(bcrypt_rounds)
+    app.state.background_tasks = [
+        asyncio.create_task(create_essential_indexes(), name="create-indexes"),
+        start_periodic("token-versions", TOKEN_STATE_REFRESH_SECONDS, refresh_token_versions),
+        last_logins.start(get_database),
+        asyncio.create_task(prepare_suggestions(), name="suggestions"),
+    ]
+    if SCHEDULER:
+        app.state.background_tasks.extend(Scheduler(maintenance_jobs(), get_database).start())
+    if USER_CHANGE_STREAM:
+        app.state.background_tasks.append(asyncio.create_task(watch_user_changes(), name="user-changes"))
+    yield
+    await stop_tasks(app.state.background_tasks)
+    try:
+        await last_logins.flush()
+    except Exception as e:
+        logger.warning("Could not flush %d last_login updates on shutdown: %s", len(last_logins), e)
+    await app.state.http_client.aclose()
+    stop_capture()
+    await close_mongo_connection()
+    shutdown_logging()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Static files
 os.makedirs("static/avatars", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 
 # CORS middleware - UPDATED to include more origins and cookie support
 app.add_middleware(
@@ -30,6 +96,32 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Inside ServerTimingMiddleware, so compression time is part of the reported total
+app.add_middleware(CompressionMiddleware)
+
+# Outermost, so the reported total covers CORS handling too
+app.add_middleware(ServerTimingMiddleware)
+
+# Opt-in: record sanitized request shapes for bench.replay
+if TRAFFIC_CAPTURE_FILE:
+    app.add_middleware(TrafficCaptureMiddleware)
+
+@app.exception_handler(DatabaseUnavailable)
+async def database_unavailable_handler(request: Request, exc: DatabaseUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporarily unavailable"},
+        headers={"Retry-After": str(max(int(DB_RETRY_SECONDS), 1))},
+    )
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, try again shortly"},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
 # Include routers
 app.include_router(users.router)
 app.include_router(auth.router)  # NEW: Include auth router
@@ -38,6 +130,25 @@ app.include_router(auth.router)  # NEW: Include auth router
 async def root():
     return {"message": "LMS API"}
 
+@app.get("/.well-known/jwks.json")
+async def jwks(response: Response):
+    """Public keys for verifying access tokens without calling this API"""
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return key_ring.jwks()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    # Fails closed: without a token configured the endpoint does not exist
+    if not METRICS_TOKEN:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    if not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        return JSONResponse(status_code=401, content={"detail": "Not authenticated"})
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
\ No newline at end of file
+    database = database_status()
+    return {
+        "status": "degraded" if database["status"] == "unavailable" else "ok",
+        "database": database,
+    }
\ No newline at end of file
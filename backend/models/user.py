@@ -26,8 +26,11 @@ class User(BaseModel):
     auth_provider: AuthProviderEnum = AuthProviderEnum.email  # NEW FIELD
     avatar_url: Optional[str] = None
     created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
     last_login: Optional[datetime] = None
     is_active: bool = True
+    # Incremented to revoke every token issued so far
+    token_version: int = 0
 
     # OTP fields
     otp_code: Optional[str] = None
@@ -1,6 +1,7 @@
 """
 Google OAuth authentication router - FRONTEND-FIRST VERSION
 """
+import logging
 import secrets
 from typing import Optional
 from urllib.parse import urlencode
@@ -10,8 +11,11 @@ from fastapi.responses import JSONResponse, RedirectResponse
 import httpx
 from pydantic import BaseModel
 
-from database import get_database
-from utils.security import create_access_token
+from dependencies import get_user_crud
+from utils.security import create_access_token, user_token_claims
+from utils.http_client import get_http_client
+from utils.google_tokens import GoogleIdTokenVerifier, GoogleKeysUnavailable, GoogleTokenError
+from utils.timing import span
 import os
 from dotenv import load_dotenv
 
@@ -19,10 +23,19 @@ load_dotenv()
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+logger = logging.getLogger(__name__)
+
 # Google OAuth Configuration
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 
+# Overridable so local runs (bench.fakes) can stand in for Google
+GOOGLE_OAUTH_BASE_URL = os.getenv("GOOGLE_OAUTH_BASE_URL", "https://oauth2.googleapis.com")
+GOOGLE_API_BASE_URL = os.getenv("GOOGLE_API_BASE_URL", "https://www.googleapis.com")
+
+# Signing keys for local ID token verification (cached, see utils.google_tokens)
+google_verifier = GoogleIdTokenVerifier(f"{GOOGLE_API_BASE_URL}/oauth2/v3/certs", GOOGLE_CLIENT_ID)
+
 # FRONTEND redirect URIs (Google talks to frontend only)
 IS_LOCAL = os.getenv("RENDER") != "true"
 
@@ -31,26 +44,32 @@ if IS_LOCAL:
     FRONTEND_REDIRECT_URI = "http://localhost:5500/frontend/oauth-callback.html"
     FRONTEND_URL = "http://127.0.0.1:5500/frontend"
     BACKEND_URL = "http://localhost:8000"
-    print("🖥️  Running in LOCAL development mode")
+    logger.info("Running in LOCAL development mode")
 else:
     # PRODUCTION - Frontend handles OAuth
     FRONTEND_REDIRECT_URI = "https://zyneth.shop/oauth-callback.html"
     FRONTEND_URL = "https://zyneth.shop"
     BACKEND_URL = "https://zyneth-backend.onrender.com"
-    print("🚀 Running in PRODUCTION mode")
+    logger.info("Running in PRODUCTION mode")
 
-print("🔧 OAuth Configuration (Frontend-First):")
-print(f"   Environment: {'LOCAL' if IS_LOCAL else 'PRODUCTION'}")
-print(f"   Google Client ID: {GOOGLE_CLIENT_ID[:10]}..." if GOOGLE_CLIENT_ID else "❌ MISSING")
-print(f"   Google Client Secret: {'✅ SET' if GOOGLE_CLIENT_SECRET else '❌ MISSING'}")
-print(f"   Frontend Redirect URI: {FRONTEND_REDIRECT_URI}")
-print(f"   Frontend URL: {FRONTEND_URL}")
-print(f"   Backend URL: {BACKEND_URL}")
+logger.info(
+    "OAuth configuration (frontend-first)",
+    extra={
+        "environment": "LOCAL" if IS_LOCAL else "PRODUCTION",
+        "google_client_id": f"{GOOGLE_CLIENT_ID[:10]}..." if GOOGLE_CLIENT_ID else None,
+        "google_client_secret_set": bool(GOOGLE_CLIENT_SECRET),
+        "frontend_redirect_uri": FRONTEND_REDIRECT_URI,
+        "frontend_url": FRONTEND_URL,
+        "backend_url": BACKEND_URL,
+    }
+)
 
 # Validate configuration
 if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
-    print("❌ CRITICAL ERROR: Google OAuth credentials missing!")
-    print("   Please set GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET in .env file")
+    logger.critical(
+        "Google OAuth credentials missing! "
+        "Please set GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET in .env file"
+    )
 
 class GoogleUserInfo(BaseModel):
     """Google user info from token validation"""
@@ -78,10 +97,6 @@ class GoogleAuthResponse(BaseModel):
     role: str
     is_new: bool
 
-async def get_user_crud(db=Depends(get_database)):
-    from crud.user import UserCRUD
-    return UserCRUD(db)
-
 @router.get("/google/url", response_model=AuthUrlResponse)
 async def get_google_auth_url():
     """
@@ -113,11 +128,10 @@ async def get_google_auth_url():
     # Build Google OAuth URL
     auth_url = f"https://accounts.google.com/o/oauth2/v2/auth?{urlencode(params)}"
     
-    print("=" * 60)
-    print("🔗 Generated Google OAuth URL for frontend:")
-    print(f"   Google will redirect to: {FRONTEND_REDIRECT_URI}")
-    print(f"   State parameter: {state[:10]}...")
-    print("=" * 60)
+    logger.debug(
+        "Generated Google OAuth URL for frontend",
+        extra={"redirect_uri": FRONTEND_REDIRECT_URI, "state_prefix": state[:10]}
+    )
     
     # Return JSON response with the auth URL
     return {"auth_url": auth_url}
@@ -125,15 +139,17 @@ async def get_google_auth_url():
 @router.post("/google/exchange", response_model=GoogleAuthResponse)
 async def exchange_google_code(
     request: GoogleAuthRequest,
-    crud=Depends(get_user_crud)
+    crud=Depends(get_user_crud),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
     """
     Exchange Google authorization code for backend tokens
     
     Frontend gets the code from Google and sends it here
-    Backend exchanges code for Google tokens, then creates JWT
+    Backend exchanges code for Google tokens, verifies the ID token
+    locally (falling back to the userinfo endpoint), then creates JWT
     """
-    print("🔄 Exchanging Google authorization code...")
+    logger.info("Exchanging Google authorization code")
     
     if not request.code:
         raise HTTPException(
@@ -143,7 +159,7 @@ async def exchange_google_code(
     
     try:
         # Exchange authorization code for tokens
-        token_url = "https://oauth2.googleapis.com/token"
+        token_url = f"{GOOGLE_OAUTH_BASE_URL}/token"
         token_data = {
             "client_id": GOOGLE_CLIENT_ID,
             "client_secret": GOOGLE_CLIENT_SECRET,
@@ -152,109 +168,136 @@ async def exchange_google_code(
             "redirect_uri": FRONTEND_REDIRECT_URI,  # Must match what frontend used
         }
         
-        print("🔄 Exchanging code for Google tokens...")
-        print(f"   Using frontend redirect_uri: {FRONTEND_REDIRECT_URI}")
+        logger.debug("Exchanging code for Google tokens", extra={"redirect_uri": FRONTEND_REDIRECT_URI})
         
-        async with httpx.AsyncClient() as client:
+        with span("google"):
             token_response = await client.post(token_url, data=token_data)
-            
-            if token_response.status_code != 200:
-                print(f"❌ Token exchange failed: {token_response.status_code}")
-                print(f"   Response: {token_response.text}")
+        
+        if token_response.status_code != 200:
+            logger.error(
+                "Token exchange failed: %s",
+                token_response.status_code,
+                extra={"response": token_response.text}
+            )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Failed to exchange authorization code: {token_response.text}"
+            )
+        
+        token_json = token_response.json()
+        userinfo = None
+
+        # Fast path: verify the OpenID Connect ID token locally, no extra round trip
+        id_token = token_json.get("id_token")
+        if id_token:
+            try:
+                with span("google"):
+                    userinfo = await google_verifier.verify(client, id_token)
+                logger.debug("ID token verified for: %s", userinfo.get("email", "No email"))
+            except GoogleKeysUnavailable as e:
+                logger.warning("Google signing keys unavailable, falling back to userinfo: %s", e)
+            except GoogleTokenError as e:
+                logger.error("Google ID token rejected: %s", e)
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Failed to exchange authorization code: {token_response.text}"
+                    detail="Invalid ID token received from Google"
                 )
-            
-            token_json = token_response.json()
+
+            if userinfo is not None and userinfo.get("email_verified") is False:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Google email address is not verified"
+                )
+
+        if userinfo is None:
             access_token = token_json.get("access_token")
-            
+
             if not access_token:
-                print("❌ No access token in response")
+                logger.error("No access token in response")
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="No access token received from Google"
                 )
-            
-            print("✅ Got Google access token, fetching user info...")
-            
+
+            logger.debug("Got Google access token, fetching user info")
+
             # Get user info from Google
-            userinfo_url = "https://www.googleapis.com/oauth2/v2/userinfo"
+            userinfo_url = f"{GOOGLE_API_BASE_URL}/oauth2/v2/userinfo"
             headers = {"Authorization": f"Bearer {access_token}"}
-            userinfo_response = await client.get(userinfo_url, headers=headers)
-            
+            with span("google"):
+                userinfo_response = await client.get(userinfo_url, headers=headers)
+
             if userinfo_response.status_code != 200:
-                print(f"❌ Userinfo fetch failed: {userinfo_response.status_code}")
+                logger.error("Userinfo fetch failed: %s", userinfo_response.status_code)
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Failed to fetch user info from Google"
                 )
-            
+
             userinfo = userinfo_response.json()
-            print(f"✅ User info received for: {userinfo.get('email', 'No email')}")
-            
-            # Validate email
-            if not userinfo.get("email"):
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="No email in Google user info"
-                )
-            
-            # Create user or get existing
-            email = userinfo["email"]
-            name = userinfo.get("name", email.split("@")[0])
-            picture = userinfo.get("picture")
-            
-            existing_user = await crud.get_user_by_email(email)
-            is_new = False
-            
-            if existing_user:
-                print(f"🔄 User exists: {email}")
-                user = existing_user
-            else:
-                print(f"🔄 Creating new user: {email}")
-                user = await crud.create_google_user(
-                    email=email,
-                    full_name=name,
-                    picture=picture,
-                    google_id=userinfo.get("sub")
-                )
-                
-                if not user:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="Failed to create user"
-                    )
-                is_new = True
-            
-            # Create JWT token
-            jwt_token = create_access_token(
-                data={"sub": user.email, "role": user.role}
+            logger.debug("User info received for: %s", userinfo.get("email", "No email"))
+        
+        # Validate email
+        if not userinfo.get("email"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No email in Google user info"
             )
-            
-            print(f"✅ Authentication successful for {email}")
-            print(f"   User ID: {user.id}")
-            print(f"   Is new user: {is_new}")
-            
-            return GoogleAuthResponse(
-                token=jwt_token,
-                user_id=str(user.id),
-                email=user.email,
-                role=user.role,
-                is_new=is_new
+        
+        # Create user or get existing
+        email = userinfo["email"]
+        name = userinfo.get("name", email.split("@")[0])
+        picture = userinfo.get("picture")
+        
+        # Single upsert: updates an existing account or provisions a new one
+        user, is_new = await crud.upsert_google_user(
+            email=email,
+            full_name=name,
+            picture=picture,
+            google_id=userinfo.get("sub")
+        )
+        
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to create user"
             )
+        
+        # Create JWT token
+        jwt_token = create_access_token(data=user_token_claims(user))
+        
+        logger.info(
+            "Google authentication successful",
+            extra={"email": email, "user_id": str(user.id), "is_new": is_new}
+        )
+        
+        return GoogleAuthResponse(
+            token=jwt_token,
+            user_id=str(user.id),
+            email=user.email,
+            role=user.role,
+            is_new=is_new
+        )
             
-    except httpx.HTTPStatusError as e:
-        print(f"❌ HTTP error during Google token exchange: {e}")
+    except HTTPException:
+        raise
+
+    except httpx.TimeoutException as e:
+        logger.error("Timed out talking to Google: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Timed out communicating with Google"
+        )
+
+    except httpx.HTTPError as e:
+        logger.error("HTTP error during Google token exchange: %s", e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Failed to communicate with Google: {str(e)}"
         )
     
     except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error during Google authentication: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error during authentication"
@@ -1,32 +1,77 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Form, File, UploadFile, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Form, File, UploadFile, BackgroundTasks, Request, Response, Query
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 import jwt
+import logging
 import os, uuid
 import requests
 from bson import ObjectId
 import resend
 from dotenv import load_dotenv
-from database import get_database
+from database import causal_session, get_database
 from models.user import RoleEnum, User
-from schemas.user import UserCreate, AdminUserCreate, UserOut, UserLogin
-from utils.security import hash_password, verify_password, create_access_token
-from dependencies import get_current_user, require_admin
+from schemas.user import (
+    UserCreate, AdminUserCreate, UserOut, UserLogin, PaginatedUsers, UserStats, UserBatch, UserBatchRequest,
+    UserSuggestion, partial_user_out
+)
+from crud.user_suggest import MAX_PREFIX_LENGTH, USER_SUGGEST_MAX_RESULTS
+from utils.etag import is_current, make_etag, not_modified, set_etag, user_version
+from utils.security import create_access_token, needs_rehash, user_token_claims, verify_password_async
+from dependencies import TokenUser, get_current_user, get_token_user, get_user_crud, require_admin
 
 
 # Load environment variables
 load_dotenv()
 
+# Render sets RENDER=true; anywhere else counts as local development
+IS_LOCAL = os.getenv("RENDER") != "true"
+
 # Create directory if not exists
 UPLOAD_DIR = "static/avatars"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-async def get_user_crud(db=Depends(get_database)):
+logger = logging.getLogger(__name__)
+
+async def get_admin_user_crud(
+    admin: TokenUser = Depends(require_admin),
+    db=Depends(get_database)
+):
+    """
+    UserCRUD for admin routes: listing and search read from secondaries,
+    inside a causal session that continues from this admin's last write.
+    """
     from crud.user import UserCRUD
-    return UserCRUD(db)
+    async with causal_session(key=admin.id) as session:
+        yield UserCRUD(db, session=session)
+
+def get_user_fields(
+    fields: Optional[str] = Query(
+        None, description="Comma separated UserOut fields to return, e.g. id,username,role,is_active"
+    )
+) -> Optional[Tuple[str, ...]]:
+    """Validate ``?fields=`` against UserOut; ``id`` is always included."""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(UserOut.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(field for field in UserOut.model_fields if field in requested)
+
+def partial_response(content, fields: Tuple[str, ...], etag: Optional[str] = None) -> Response:
+    """Serialize users (or one user) with only ``fields``, bypassing the full response model."""
+    adapter = partial_user_out(fields, many=isinstance(content, list))
+    response = Response(
+        content=adapter.dump_json(adapter.validate_python(content, from_attributes=True)),
+        media_type="application/json"
+    )
+    if etag:
+        set_etag(response, etag)
+    return response
 
 # ========== REAL EMAIL SERVICE WITH RESEND ==========
 class EmailService:
@@ -184,29 +229,28 @@ class EmailService:
                 
                 # Send email via Resend
                 response = resend.Emails.send(params)
-                print(f"✅ Email sent to {email} via Resend. Message ID: {response['id']}")
+                logger.info("Email sent via Resend", extra={"email": email, "message_id": response["id"]})
                 return True
                 
             except Exception as e:
-                print(f"❌ Resend failed for {email}: {e}")
+                logger.error("Resend failed: %s", e, extra={"email": email})
                 # Fall through to console logging
         
-        # Fallback to console logging for development
-        print("\n" + "="*60)
-        print(f"📧 OTP VERIFICATION CODE")
-        print(f"📧 To: {email}")
-        print(f"📧 From: Zyneth <no-reply@zyneth.shop>")
-        print(f"📧 OTP CODE: {otp_code}")
-        print(f"📧 (In production with RESEND_API_KEY, this would be sent via email)")
-        print("="*60 + "\n")
+        # The code itself never goes to the log pipeline
+        # (In production with RESEND_API_KEY, this would be sent via email)
+        logger.warning(
+            "OTP verification code not emailed",
+            extra={"email": email, "sender": "Zyneth <no-reply@zyneth.shop>"}
+        )
         
-        # Log to file for easy access during development
-        try:
-            with open("otp_logs.txt", "a") as f:
-                timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-                f.write(f"[{timestamp}] {email}: {otp_code}\n")
-        except:
-            pass
+        # Local development only: codes go to otp_logs.txt (git-ignored)
+        if IS_LOCAL:
+            try:
+                with open("otp_logs.txt", "a") as f:
+                    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+                    f.write(f"[{timestamp}] {email}: {otp_code}\n")
+            except:
+                pass
         
         return False  # Return False to indicate email wasn't really sent
 
@@ -379,8 +423,6 @@ async def signup(
     All new users are registered as regular 'user' role by default.
     User must verify email with OTP before being able to login.
     """
-    print("✅ SIGNUP ENDPOINT HIT!")
-    
     # Confirm password match
     if password != confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
@@ -442,7 +484,7 @@ async def signup(
     if not user:
         raise HTTPException(status_code=500, detail="Failed to create user")
     
-    print(f"✅ User Created Successfully: {user.username} ({user.email})")
+    logger.info("User created", extra={"username": user.username, "email": user.email})
     
     # Generate and send OTP
     otp_code = await crud.generate_and_store_otp(email)
@@ -452,7 +494,7 @@ async def signup(
         else:
             await EmailService.send_otp_email(email, otp_code)
     else:
-        print(f"❌ Failed to generate OTP for {email}")
+        logger.error("Failed to generate OTP", extra={"email": email})
     
     return user
 
@@ -460,31 +502,33 @@ async def signup(
 
 @router.post("/login")
 async def login(
+    background_tasks: BackgroundTasks,
     form_data: OAuth2PasswordRequestForm = Depends(),
     crud = Depends(get_user_crud)
 ):
     """
     User login endpoint.
     Users must verify email with OTP before being able to login.
+    Hashes stored below the current bcrypt cost are re-hashed after the response.
     """
     identifier = form_data.username.strip()
-    print(f"🔍 Login attempt with identifier: '{identifier}'")
+    logger.info("Login attempt with identifier: %r", identifier)
     
     # Find user by email OR username
     user = await crud.get_user_by_identifier(identifier)
     
     if not user:
-        print(f"❌ User not found for identifier: '{identifier}'")
+        logger.info("User not found for identifier: %r", identifier)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     
-    print(f"✅ User found: {user.username} ({user.email})")
+    logger.debug("User found: %s (%s)", user.username, user.email)
     
     # Verify password
-    if not verify_password(form_data.password, user.password_hash):
-        print(f"❌ Invalid password for user: {user.email}")
+    if not await verify_password_async(form_data.password, user.password_hash):
+        logger.info("Invalid password for user: %s", user.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
@@ -504,13 +548,14 @@ async def login(
             detail="Please verify your email address before logging in."
         )
     
+    if needs_rehash(user.password_hash):
+        background_tasks.add_task(crud.rehash_password, user.id, form_data.password, user.password_hash)
+
     # Update last login
     await crud.update_last_login(user.id)
     
     # Create token with 30-day expiration
-    access_token = create_access_token(
-        data={"sub": user.email, "role": user.role, "username": user.username}
-    )
+    access_token = create_access_token(data=user_token_claims(user))
     
     return {
         "access_token": access_token,
@@ -532,27 +577,143 @@ async def login(
 
 @router.get("/me", response_model=UserOut)
 async def get_current_user_profile(
+    request: Request,
+    response: Response,
+    fields: Optional[Tuple[str, ...]] = Depends(get_user_fields),
     current_user = Depends(get_current_user)
 ):
     """
     Get current user's profile.
+    Answers 304 when If-None-Match names the current version.
     """
+    etag = make_etag([user_version(current_user), ",".join(fields or ())])
+    if is_current(request, etag):
+        return not_modified(etag)
+    if fields:
+        return partial_response(current_user, fields, etag)
+    set_etag(response, etag)
     return current_user
 
 @router.get("/", response_model=List[UserOut], dependencies=[Depends(require_admin)])
 async def list_users(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     role: Optional[RoleEnum] = None,
     is_active: Optional[bool] = None,
-    crud = Depends(get_user_crud)
+    fields: Optional[Tuple[str, ...]] = Depends(get_user_fields),
+    crud = Depends(get_admin_user_crud)
 ):
     """
     Admin-only: List all users with optional filters.
+    ``fields`` limits what is read from MongoDB and returned.
+    Answers 304 when If-None-Match names the current version of the page.
+    """
+    users = await crud.get_users(skip=skip, limit=limit, role=role, is_active=is_active, fields=fields)
+    etag = make_etag([request.url.query, *map(user_version, users)])
+    if is_current(request, etag):
+        return not_modified(etag)
+    if fields:
+        return partial_response(users, fields, etag)
+    set_etag(response, etag)
+    return users
+
+@router.get("/paginated", response_model=PaginatedUsers, dependencies=[Depends(require_admin)])
+async def list_users_paginated(
+    request: Request,
+    response: Response,
+    page: int = Query(1, ge=1),
+    per_page: int = Query(50, ge=1, le=100),
+    role: Optional[RoleEnum] = None,
+    is_active: Optional[bool] = None,
+    exact: bool = False,
+    crud = Depends(get_admin_user_crud)
+):
+    """
+    Admin-only: One page of users with the total count.
+
+    Totals are estimated (no filter) or read from the maintained counters
+    (filtered), unless exact=true. X-Total-Source says which one was used.
+    Answers 304 when If-None-Match names the current version of the page.
     """
-    users = await crud.get_users(skip=skip, limit=limit, role=role, is_active=is_active)
+    users, total, source = await crud.get_users_page(
+        page=page, per_page=per_page, role=role, is_active=is_active, exact=exact
+    )
+    response.headers["X-Total-Source"] = source
+    etag = make_etag([request.url.query, str(total), *map(user_version, users)])
+    if is_current(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    return PaginatedUsers(
+        users=users,
+        total=total,
+        page=page,
+        per_page=per_page,
+        total_pages=(total + per_page - 1) // per_page,
+    )
+
+@router.get("/stats", response_model=UserStats, dependencies=[Depends(require_admin)])
+async def user_stats(
+    days: int = Query(30, ge=1, le=365),
+    crud = Depends(get_admin_user_crud)
+):
+    """
+    Admin-only: Totals by role, status, verification and provider, plus
+    signups per day. Read from maintained counters, independent of user count.
+    """
+    stats = await crud.get_stats(days=days)
+    if stats is None:
+        raise HTTPException(status_code=500, detail="Failed to load statistics")
+    return stats
+
+@router.post("/batch", response_model=UserBatch, dependencies=[Depends(require_admin)])
+async def get_users_batch(
+    lookup: UserBatchRequest,
+    crud = Depends(get_admin_user_crud)
+):
+    """
+    Admin-only: Resolve up to 100 each of ids, emails and usernames in a
+    single query. Users come back in request order without duplicates;
+    identifiers that matched nothing are listed under ``missing``.
+    """
+    result = await crud.get_users_batch(ids=lookup.ids, emails=lookup.emails, usernames=lookup.usernames)
+    if result is None:
+        raise HTTPException(status_code=500, detail="Failed to load users")
+    users, missing = result
+    return UserBatch(users=users, missing=missing)
+
+@router.get("/search", response_model=List[UserOut], dependencies=[Depends(require_admin)])
+async def search_users(
+    q: str,
+    skip: int = 0,
+    limit: int = 50,
+    fields: Optional[Tuple[str, ...]] = Depends(get_user_fields),
+    crud = Depends(get_admin_user_crud)
+):
+    """
+    Admin-only: Search users by full name, username or email.
+    ``fields`` limits what is read from MongoDB and returned.
+    """
+    users = await crud.search_users(q, skip=skip, limit=limit, fields=fields)
+    if fields:
+        return partial_response(users, fields)
     return users
 
+@router.get("/suggest", response_model=List[UserSuggestion])
+async def suggest_users(
+    q: str = Query(..., min_length=1, max_length=MAX_PREFIX_LENGTH),
+    limit: int = Query(10, ge=1, le=USER_SUGGEST_MAX_RESULTS),
+    current_user: TokenUser = Depends(get_token_user),
+    crud = Depends(get_user_crud)
+):
+    """
+    Type-ahead for mention, invite and admin pickers: active users whose
+    username or any word of whose full name starts with ``q`` (case and
+    accents ignored), best matches first.
+    """
+    return await crud.suggest_users(q, limit=limit)
+
 @router.put("/me", response_model=UserOut)
 async def update_profile(
     full_name: Optional[str] = Form(None),
@@ -615,7 +776,7 @@ async def logout():
 @router.put("/deactivate", dependencies=[Depends(require_admin)])
 async def deactivate_user(
     user_id: str,
-    crud = Depends(get_user_crud)
+    crud = Depends(get_admin_user_crud)
 ):
     """
     Admin-only: Deactivate a user account.
@@ -628,7 +789,7 @@ async def deactivate_user(
 @router.put("/activate", dependencies=[Depends(require_admin)])
 async def activate_user(
     user_id: str,
-    crud = Depends(get_user_crud)
+    crud = Depends(get_admin_user_crud)
 ):
     """
     Admin-only: Activate a deactivated user account.
@@ -642,7 +803,7 @@ async def activate_user(
 @router.post("/admin/create", response_model=UserOut, dependencies=[Depends(require_admin)])
 async def admin_create_user(
     user_data: AdminUserCreate,
-    crud = Depends(get_user_crud)
+    crud = Depends(get_admin_user_crud)
 ):
     """
     Admin-only endpoint to create users with any role.
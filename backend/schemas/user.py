@@ -1,6 +1,7 @@
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import date, datetime
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, TypeAdapter, create_model
 import enum
 
 class RoleEnum(str, enum.Enum):
@@ -58,6 +59,21 @@ class UserOut(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+@lru_cache(maxsize=128)
+def partial_user_out(fields: Tuple[str, ...], many: bool = False) -> TypeAdapter:
+    """
+    TypeAdapter for UserOut (or a list of it) restricted to ``fields``, for
+    sparse fieldsets (``?fields=id,username``). Cached per field set. Every
+    field is optional: a document missing one (legacy or projected) renders
+    it as null instead of failing the response.
+    """
+    model = create_model(
+        "UserOutPartial",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (Optional[info.annotation], None) for name, info in UserOut.model_fields.items() if name in fields}
+    )
+    return TypeAdapter(List[model] if many else model)
+
 class UserLogin(BaseModel):
     """Model for login credentials"""
     email: EmailStr
@@ -112,6 +128,47 @@ class PaginatedUsers(BaseModel):
     per_page: int
     total_pages: int
 
+class UserBatchRequest(BaseModel):
+    """Users to resolve in one lookup"""
+    ids: List[str] = Field(default_factory=list, max_length=100)
+    emails: List[EmailStr] = Field(default_factory=list, max_length=100)
+    usernames: List[str] = Field(default_factory=list, max_length=100)
+
+class UserBatchMissing(BaseModel):
+    """Requested identifiers that matched no user"""
+    ids: List[str]
+    emails: List[str]
+    usernames: List[str]
+
+class UserBatch(BaseModel):
+    """Response model for a batch lookup"""
+    users: List[UserOut]
+    missing: UserBatchMissing
+
+class UserSuggestion(BaseModel):
+    """Type-ahead entry: only what a picker displays"""
+    id: str
+    username: str
+    full_name: str
+    avatar_url: Optional[str] = None
+
+class DailySignups(BaseModel):
+    """Signups on one day (UTC)"""
+    date: str
+    count: int
+
+class UserStats(BaseModel):
+    """Response model for admin user statistics"""
+    total: int
+    by_role: Dict[str, int]
+    active: int
+    inactive: int
+    verified: int
+    unverified: int
+    by_provider: Dict[str, int]
+    signups_per_day: list[DailySignups]
+    reconciled_at: Optional[datetime] = None
+
 class OTPRequest(BaseModel):
     """Model for requesting OTP"""
     email: EmailStr
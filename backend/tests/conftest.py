@@ -0,0 +1,91 @@
+"""
+Tests run without a MongoDB server: ``db`` is an in-memory mongomock database.
+
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import mongomock_motor
+import pytest
+from bson import ObjectId
+
+import database
+
+
+@pytest.fixture
+def mongo():
+    return mongomock_motor.AsyncMongoMockClient()
+
+
+@pytest.fixture
+def db(mongo):
+    return mongo[database.DATABASE_NAME]
+
+
+@asynccontextmanager
+async def _no_session(key=None):
+    yield None
+
+
+@pytest.fixture
+async def client(mongo, monkeypatch):
+    """
+    The app on the mongomock database, without its lifespan (no background
+    tasks). mongomock has neither sessions nor read preferences.
+    """
+    import httpx
+
+    import main
+    import routers.users
+    from utils import security
+
+    monkeypatch.setattr(database.mongodb, "client", mongo)
+    monkeypatch.setattr(database.mongodb, "is_connected", True)
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "with_options", lambda self, **kwargs: self, raising=False)
+    monkeypatch.setattr(routers.users, "causal_session", _no_session)
+    monkeypatch.setattr(security, "BCRYPT_ROUNDS", "4")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+
+
+async def insert_user(db, **fields) -> dict:
+    """Insert a verified, active user; ``fields`` override the defaults."""
+    now = datetime.utcnow()
+    username = fields.get("username", f"user_{ObjectId()}")
+    doc = {
+        "_id": ObjectId(),
+        "full_name": "Jane Doe",
+        "username": username,
+        "email": f"{username}@example.com",
+        "password_hash": None,
+        "role": "user",
+        "auth_provider": "email",
+        "created_at": now,
+        "updated_at": now,
+        "last_login": None,
+        "is_active": True,
+        "is_verified": True,
+        "token_version": 0,
+        "otp_code": None,
+        "otp_created_at": None,
+        "otp_attempts": 0,
+        "otp_locked_until": None,
+        **fields,
+    }
+    await db.users.insert_one(doc)
+    return doc
+
+
+def auth_headers(user: dict) -> dict:
+    from utils.security import create_access_token
+
+    token = create_access_token({
+        "sub": user["email"],
+        "role": user["role"],
+        "username": user["username"],
+        "uid": str(user["_id"]),
+        "ver": user["token_version"],
+    })
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils.admission import AdmissionController, Overloaded
+
+
+@pytest.fixture
+def gate():
+    """Jobs block on the gate until the test opens it (opened at teardown in any case)."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def _controller(**kwargs):
+    options = {"concurrency": 1, "max_queue": 4, "max_wait": 1.0, "initial_service_seconds": 0.01, **kwargs}
+    return AdmissionController("test", **options)
+
+
+async def _until(predicate):
+    while not predicate():
+        await asyncio.sleep(0.001)
+
+
+async def test_free_slot_runs_the_job():
+    pool = _controller()
+    assert await pool.run(sum, [1, 2, 3]) == 6
+    assert pool._semaphore._value == 1
+
+
+async def test_full_queue_is_shed_at_once(gate):
+    pool = _controller(max_queue=1)
+    running = asyncio.create_task(pool.run(gate.wait, 5))
+    await _until(lambda: pool._running == 1)
+    queued = asyncio.create_task(pool.run(gate.wait, 5))
+    await _until(lambda: pool._waiting == 1)
+
+    with pytest.raises(Overloaded) as shed:
+        await pool.run(gate.wait, 5)
+    assert shed.value.retry_after >= 1
+
+    gate.set()
+    assert await asyncio.gather(running, queued) == [True, True]
+
+
+async def test_long_estimated_wait_is_shed_without_queueing(gate):
+    # Each job is expected to take 10s, far past max_wait
+    pool = _controller(initial_service_seconds=10.0)
+    running = asyncio.create_task(pool.run(gate.wait, 5))
+    await _until(lambda: pool._running == 1)
+
+    with pytest.raises(Overloaded) as shed:
+        await pool.run(gate.wait, 5)
+    assert pool._waiting == 0
+    assert shed.value.retry_after == 10
+
+    gate.set()
+    await running
+
+
+async def test_queued_job_is_shed_after_max_wait_and_the_permit_survives(gate):
+    pool = _controller(max_wait=0.05)
+    running = asyncio.create_task(pool.run(gate.wait, 5))
+    await _until(lambda: pool._running == 1)
+
+    with pytest.raises(Overloaded):
+        await pool.run(gate.wait, 5)
+    assert pool._waiting == 0
+
+    gate.set()
+    await running
+    await _until(lambda: pool._running == 0)
+    # Every permit is back: the pool still runs `concurrency` jobs
+    assert pool._semaphore._value == 1
+    assert await pool.run(sum, [1, 1]) == 2
+
+
+async def test_cancelled_caller_frees_the_slot_when_the_thread_finishes(gate):
+    pool = _controller()
+    caller = asyncio.create_task(pool.run(gate.wait, 5))
+    await _until(lambda: pool._running == 1)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    # The thread cannot be stopped, so its slot stays taken until it returns
+    assert pool._semaphore.locked()
+
+    gate.set()
+    await _until(lambda: pool._running == 0)
+    assert pool._semaphore._value == 1
+
+
+async def test_queued_jobs_run_in_turn_when_slots_free_up(gate):
+    pool = _controller(concurrency=2, max_queue=8, max_wait=5.0)
+    jobs = [asyncio.create_task(pool.run(gate.wait, 5)) for _ in range(6)]
+    await _until(lambda: pool._running == 2 and pool._waiting == 4)
+
+    gate.set()
+    assert await asyncio.gather(*jobs) == [True] * 6
+    assert pool._semaphore._value == 2
@@ -0,0 +1,20 @@
+import random
+from datetime import datetime
+
+from bench.seed import make_user
+from crud.user import UserCRUD
+from schemas.user import UserCreate
+
+
+async def test_seeded_users_have_the_shape_create_user_writes(db, monkeypatch):
+    monkeypatch.setattr("database.mongodb.is_connected", True)
+    monkeypatch.setattr("utils.security.BCRYPT_ROUNDS", "4")
+    await UserCRUD(db).create_user(UserCreate(
+        full_name="Jane Roe", username="jane", email="jane@example.com", password="Secret123!"
+    ))
+    created = await db.users.find_one({"username": "jane"}, {"_id": 0})
+
+    seeded = make_user(1, random.Random(0), "hash", datetime.utcnow())
+    assert set(seeded) == set(created)
+    assert seeded["updated_at"] == seeded["created_at"]
+    assert seeded["username_lower"] == "bench_user_1"
@@ -0,0 +1,121 @@
+import pytest
+
+import database
+from database import CausalReadTracker, causal_session
+
+
+class FakeSession:
+    """The parts of a causally consistent ClientSession the tracker uses."""
+
+    def __init__(self, operation_time=None, cluster_time=None):
+        self.operation_time = operation_time
+        self.cluster_time = cluster_time
+
+    def advance_operation_time(self, operation_time):
+        if self.operation_time is None or operation_time > self.operation_time:
+            self.operation_time = operation_time
+
+    def advance_cluster_time(self, cluster_time):
+        if self.cluster_time is None or cluster_time["clusterTime"] > self.cluster_time["clusterTime"]:
+            self.cluster_time = cluster_time
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeClient:
+    def __init__(self):
+        self.sessions = []
+
+    def __getitem__(self, name):
+        return object()
+
+    async def start_session(self, causal_consistency=False):
+        assert causal_consistency
+        self.sessions.append(FakeSession())
+        return self.sessions[-1]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(database, "monotonic", lambda: now[0])
+    return now
+
+
+def test_next_session_continues_from_the_last_write(clock):
+    tracker = CausalReadTracker()
+    tracker.remember("admin-1", FakeSession(operation_time=5, cluster_time={"clusterTime": 7}))
+
+    session = FakeSession()
+    tracker.advance("admin-1", session)
+    assert session.operation_time == 5
+    assert session.cluster_time == {"clusterTime": 7}
+
+
+def test_other_callers_are_not_advanced(clock):
+    tracker = CausalReadTracker()
+    tracker.remember("admin-1", FakeSession(operation_time=5))
+
+    session = FakeSession()
+    tracker.advance("admin-2", session)
+    assert session.operation_time is None
+
+
+def test_sessions_without_an_operation_are_not_remembered(clock):
+    tracker = CausalReadTracker()
+    tracker.remember("admin-1", FakeSession())
+    assert tracker._times == {}
+
+
+def test_entries_expire_after_the_staleness_bound(clock):
+    tracker = CausalReadTracker()
+    tracker.remember("admin-1", FakeSession(operation_time=5))
+    clock[0] += database.ANALYTICS_MAX_STALENESS_SECONDS + 1
+
+    session = FakeSession()
+    tracker.advance("admin-1", session)
+    assert session.operation_time is None
+    # Expired entries are dropped on the next remember
+    tracker.remember("admin-2", FakeSession(operation_time=6))
+    assert list(tracker._times) == ["admin-2"]
+
+
+async def test_causal_session_carries_a_callers_writes_to_their_next_request(clock, monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(database.mongodb, "client", client)
+    monkeypatch.setattr(database.mongodb, "is_connected", True)
+    monkeypatch.setattr(database, "causal_reads", CausalReadTracker())
+
+    async with causal_session(key="admin-1") as session:
+        # A write in this request
+        session.advance_operation_time(42)
+
+    async with causal_session(key="admin-1") as session:
+        assert session.operation_time == 42
+    async with causal_session(key="admin-2") as session:
+        assert session.operation_time is None
+    async with causal_session() as session:
+        assert session.operation_time is None
+
+
+def test_expiry_only_drops_entries_older_than_the_bound(clock):
+    tracker = CausalReadTracker()
+    tracker.remember("admin-1", FakeSession(operation_time=1))
+    clock[0] += 10
+    tracker.remember("admin-2", FakeSession(operation_time=2))
+    clock[0] += 10
+    # Remembering again moves admin-1 behind admin-2 with a fresh expiry
+    tracker.remember("admin-1", FakeSession(operation_time=3))
+    assert list(tracker._times) == ["admin-2", "admin-1"]
+
+    clock[0] += database.ANALYTICS_MAX_STALENESS_SECONDS - 5
+    tracker.remember("admin-3", FakeSession(operation_time=4))
+    assert list(tracker._times) == ["admin-1", "admin-3"]
+
+    session = FakeSession()
+    tracker.advance("admin-1", session)
+    assert session.operation_time == 3
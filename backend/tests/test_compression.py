@@ -0,0 +1,123 @@
+import gzip
+import json
+
+import brotli
+import pytest
+
+from conftest import auth_headers, insert_user
+from utils.compression import choose_encoding
+
+# Compressible, and larger than FileResponse's 64 KiB chunks, so it is streamed
+SCRIPT = b"".join(b"export const value%d = %d;\n" % (i, i) for i in range(8000))
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=0, gzip;q=0.5", "gzip"),
+    ("BR;q=0.1", "br"),
+    ("gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0", None),
+    ("gzip;q=bogus", None),
+])
+def test_encoding_negotiation(accept_encoding, expected):
+    assert choose_encoding(accept_encoding) == expected
+
+
+@pytest.fixture
+def static_dir(tmp_path, monkeypatch):
+    """The app's /static mount, served from an empty temporary directory."""
+    import main
+
+    static = next(route.app for route in main.app.routes if getattr(route, "name", None) == "static")
+    monkeypatch.setattr(static, "directory", str(tmp_path))
+    monkeypatch.setattr(static, "all_directories", [str(tmp_path)])
+    return tmp_path
+
+
+async def admin_with_users(db, count: int) -> dict:
+    admin = await insert_user(db, username="admin", role="admin")
+    for i in range(count):
+        await insert_user(db, username=f"user_{i}", full_name=f"User Number {i}")
+    return admin
+
+
+@pytest.mark.parametrize("encoding, decompress", [("br", brotli.decompress), ("gzip", gzip.decompress)])
+async def test_large_json_is_compressed(client, db, encoding, decompress):
+    admin = await admin_with_users(db, 20)
+    async with client.stream("GET", "/users/", headers={**auth_headers(admin), "Accept-Encoding": encoding}) as response:
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-length"] == str(len(raw))
+    assert len(json.loads(decompress(raw))) == 21
+
+
+async def test_identity_is_not_compressed(client, db):
+    admin = await admin_with_users(db, 20)
+    response = await client.get("/users/", headers={**auth_headers(admin), "Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == 21
+
+
+async def test_small_body_is_sent_as_is_but_varies(client, db):
+    jane = await insert_user(db)
+    response = await client.get("/users/me", headers={**auth_headers(jane), "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json()["id"] == str(jane["_id"])
+
+
+async def test_incompressible_content_type_is_passed_through(client, static_dir):
+    (static_dir / "avatar.png").write_bytes(b"\x89PNG" + bytes(4096))
+    response = await client.get("/static/avatar.png", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert len(response.content) == 4100
+
+
+async def test_stream_is_compressed_chunk_by_chunk_with_a_weak_etag(client, static_dir):
+    (static_dir / "app.js").write_bytes(SCRIPT)
+    identity = await client.get("/static/app.js", headers={"Accept-Encoding": "identity"})
+    assert not identity.headers["etag"].startswith("W/")
+
+    async with client.stream("GET", "/static/app.js", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.headers["etag"] == f"W/{identity.headers['etag']}"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert gzip.decompress(raw) == SCRIPT
+
+
+async def test_precompressed_sidecar_is_served_once_encoded(client, static_dir):
+    (static_dir / "app.js").write_bytes(SCRIPT)
+    (static_dir / "app.js.gz").write_bytes(gzip.compress(SCRIPT, mtime=0))
+
+    async with client.stream("GET", "/static/app.js", headers={"Accept-Encoding": "br;q=0, gzip"}) as response:
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"].startswith("text/javascript")
+    # The middleware passed it through: one layer of gzip, the sidecar's bytes
+    assert raw == (static_dir / "app.js.gz").read_bytes()
+
+    revalidated = await client.get(
+        "/static/app.js", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]}
+    )
+    assert revalidated.status_code == 304
+
+
+async def test_sidecar_the_client_does_not_accept_is_ignored(client, static_dir):
+    (static_dir / "app.js").write_bytes(SCRIPT)
+    (static_dir / "app.js.br").write_bytes(brotli.compress(SCRIPT))
+
+    response = await client.get("/static/app.js", headers={"Accept-Encoding": "gzip"})
+    # Compressed on the fly instead
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == SCRIPT
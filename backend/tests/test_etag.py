@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import bcrypt
+import pytest
+from starlette.requests import Request
+
+from conftest import auth_headers, insert_user
+from crud.maintenance import clear_expired_otp
+from crud.user import UserCRUD
+from utils import security
+from utils.etag import is_current
+
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('W/"abc"', True),
+    ('"abc"', True),
+    ('W/"other", W/"abc"', True),
+    ("*", True),
+    ('W/"other"', False),
+])
+def test_is_current(header, expected):
+    assert is_current(_request(header), 'W/"abc"') is expected
+
+
+async def test_me_answers_304_for_the_current_version(client, db):
+    user = await insert_user(db)
+    headers = auth_headers(user)
+
+    response = await client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    revalidated = await client.get("/users/me", headers={**headers, "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == etag
+
+    # A sparse fieldset is another representation
+    projected = await client.get("/users/me", params={"fields": "email"}, headers={**headers, "If-None-Match": etag})
+    assert projected.status_code == 200
+    assert projected.headers["etag"] != etag
+
+
+async def test_profile_update_changes_the_etag(client, db):
+    user = await insert_user(db)
+    headers = auth_headers(user)
+    etag = (await client.get("/users/me", headers=headers)).headers["etag"]
+
+    updated = await client.put("/users/me", data={"full_name": "Jane Q. Doe"}, headers=headers)
+    assert updated.status_code == 200
+
+    response = await client.get("/users/me", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["full_name"] == "Jane Q. Doe"
+    assert response.headers["etag"] != etag
+
+
+async def test_password_rehash_bumps_updated_at(db, monkeypatch):
+    monkeypatch.setattr(security, "BCRYPT_ROUNDS", "5")
+    old_hash = bcrypt.hashpw(b"correct horse", bcrypt.gensalt(4)).decode()
+    user = await insert_user(db, password_hash=old_hash, updated_at=datetime.utcnow() - timedelta(days=1))
+
+    assert await UserCRUD(db).rehash_password(str(user["_id"]), "correct horse", old_hash)
+    stored = await db.users.find_one({"_id": user["_id"]})
+    assert stored["updated_at"] > user["updated_at"]
+
+
+async def test_expired_otp_cleanup_bumps_updated_at(db):
+    stale = datetime.utcnow() - timedelta(hours=1)
+    user = await insert_user(db, otp_code="123456", otp_created_at=stale, updated_at=stale)
+
+    assert (await clear_expired_otp(db))["cleared"] == 1
+    stored = await db.users.find_one({"_id": user["_id"]})
+    assert stored["otp_code"] is None
+    assert stored["updated_at"] > stale
+
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from utils import google_tokens
+from utils.google_tokens import GoogleIdTokenVerifier, GoogleKeysUnavailable, GoogleTokenError
+
+CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+CLIENT_ID = "client-id.apps.googleusercontent.com"
+
+
+class FakeGoogle:
+    """Serves a JWKS from keys generated for the test and signs ID tokens with them."""
+
+    def __init__(self, *kids):
+        self.keys = {}
+        self.fetches = 0
+        self.fail = False
+        for kid in kids:
+            self.add_key(kid)
+
+    def add_key(self, kid):
+        self.keys[kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def jwks(self):
+        keys = []
+        for kid, key in self.keys.items():
+            jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+            keys.append({**jwk, "kid": kid, "alg": "RS256", "use": "sig"})
+        return {"keys": keys}
+
+    def handler(self, request):
+        self.fetches += 1
+        if self.fail:
+            return httpx.Response(503)
+        return httpx.Response(200, json=self.jwks(), headers={"Cache-Control": "public, max-age=600"})
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+    def id_token(self, kid, **claims):
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": CLIENT_ID,
+            "sub": "1234567890",
+            "email": "jane@example.com",
+            "iat": now,
+            "exp": now + 3600,
+            **claims,
+        }
+        return jwt.encode(payload, self.keys[kid], algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture
+def google():
+    return FakeGoogle("key-1")
+
+
+@pytest.fixture
+def verifier():
+    return GoogleIdTokenVerifier(CERTS_URL, CLIENT_ID)
+
+
+async def test_valid_token_returns_claims(google, verifier):
+    async with google.client() as client:
+        claims = await verifier.verify(client, google.id_token("key-1"))
+    assert claims["email"] == "jane@example.com"
+    assert claims["sub"] == "1234567890"
+
+
+async def test_keys_are_cached(google, verifier):
+    async with google.client() as client:
+        await verifier.verify(client, google.id_token("key-1"))
+        await verifier.verify(client, google.id_token("key-1"))
+    assert google.fetches == 1
+
+
+async def test_concurrent_cold_verifications_share_one_fetch(google, verifier):
+    async with google.client() as client:
+        results = await asyncio.gather(*(verifier.verify(client, google.id_token("key-1")) for _ in range(10)))
+    assert len(results) == 10
+    assert google.fetches == 1
+
+
+@pytest.mark.parametrize("claims", [
+    {"aud": "someone-else.apps.googleusercontent.com"},
+    {"iss": "https://evil.example.com"},
+    {"exp": int(time.time()) - 3600, "iat": int(time.time()) - 7200},
+])
+async def test_rejected_claims(google, verifier, claims):
+    async with google.client() as client:
+        with pytest.raises(GoogleTokenError):
+            await verifier.verify(client, google.id_token("key-1", **claims))
+
+
+async def test_token_signed_by_another_key_is_rejected(google, verifier):
+    impostor = FakeGoogle("key-1")
+    async with google.client() as client:
+        with pytest.raises(GoogleTokenError):
+            await verifier.verify(client, impostor.id_token("key-1"))
+
+
+async def test_malformed_token_is_rejected(google, verifier):
+    async with google.client() as client:
+        with pytest.raises(GoogleTokenError):
+            await verifier.verify(client, "not-a-jwt")
+    assert google.fetches == 0
+
+
+async def test_unknown_kid_refreshes_at_most_once_per_interval(google, verifier):
+    async with google.client() as client:
+        await verifier.verify(client, google.id_token("key-1"))
+        google.add_key("key-2")
+        # Fetched moments ago: an unknown kid does not force another fetch yet
+        with pytest.raises(GoogleTokenError):
+            await verifier.verify(client, google.id_token("key-2"))
+        assert google.fetches == 1
+
+        verifier._fetched_at -= google_tokens.MIN_REFRESH_INTERVAL
+        claims = await verifier.verify(client, google.id_token("key-2"))
+    assert claims["email"] == "jane@example.com"
+    assert google.fetches == 2
+
+
+async def test_failed_refresh_keeps_the_old_keys(google, verifier):
+    async with google.client() as client:
+        await verifier.verify(client, google.id_token("key-1"))
+        google.fail = True
+        verifier._expires_at = 0
+        claims = await verifier.verify(client, google.id_token("key-1"))
+    assert claims["sub"] == "1234567890"
+    assert google.fetches == 2
+
+
+async def test_no_keys_at_all_is_unavailable(google, verifier):
+    google.fail = True
+    async with google.client() as client:
+        with pytest.raises(GoogleKeysUnavailable):
+            await verifier.verify(client, google.id_token("key-1"))
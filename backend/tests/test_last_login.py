@@ -0,0 +1,164 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import mongomock_motor
+import pytest
+from bson import ObjectId
+from pymongo import UpdateOne
+
+import database
+from conftest import insert_user
+from crud import last_login
+from crud.last_login import LastLoginBuffer
+
+T0 = datetime(2026, 1, 1)
+
+
+class FakeUsers:
+    """Records what flush sends; fails while ``error`` is set."""
+
+    def __init__(self):
+        self.options = []
+        self.writes = []
+        self.error = None
+
+    def with_options(self, **kwargs):
+        self.options.append(kwargs)
+        return self
+
+    async def bulk_write(self, requests, ordered=True):
+        if self.error:
+            raise self.error
+        self.writes.append((requests, ordered))
+
+
+@pytest.fixture
+def users():
+    return FakeUsers()
+
+
+@pytest.fixture
+def buffer(users):
+    buffer = LastLoginBuffer()
+
+    async def get_db():
+        return type("Db", (), {"users": users})
+
+    buffer._get_db = get_db
+    return buffer
+
+
+def test_record_keeps_the_latest_time_per_user():
+    buffer, user_id = LastLoginBuffer(), str(ObjectId())
+    buffer.record(user_id, T0 + timedelta(minutes=5))
+    buffer.record(user_id, T0)
+    buffer.record("not-an-id", T0)
+
+    assert len(buffer) == 1
+    assert buffer._pending[user_id] == T0 + timedelta(minutes=5)
+
+
+async def test_flush_is_one_unordered_max_update_at_w1(buffer, users):
+    first, second = str(ObjectId()), str(ObjectId())
+    buffer.record(first, T0)
+    buffer.record(second, T0 + timedelta(hours=1))
+
+    assert await buffer.flush() == 2
+    assert len(buffer) == 0
+    assert users.options == [{"write_concern": last_login._WRITE_CONCERN}]
+    assert last_login._WRITE_CONCERN.document == {"w": 1, "j": False}
+    requests, ordered = users.writes[0]
+    assert ordered is False
+    assert requests == [
+        UpdateOne({"_id": ObjectId(first)}, {"$max": {"last_login": T0}}),
+        UpdateOne({"_id": ObjectId(second)}, {"$max": {"last_login": T0 + timedelta(hours=1)}}),
+    ]
+
+
+async def test_failed_flush_keeps_the_batch(buffer, users):
+    user_id = str(ObjectId())
+    buffer.record(user_id, T0)
+    users.error = RuntimeError("primary stepped down")
+
+    with pytest.raises(RuntimeError):
+        await buffer.flush()
+    assert buffer._pending == {user_id: T0}
+
+    # A newer login recorded meanwhile wins over the re-buffered one
+    buffer.record(user_id, T0 + timedelta(minutes=1))
+    users.error = None
+    assert await buffer.flush() == 1
+    assert users.writes[0][0] == [
+        UpdateOne({"_id": ObjectId(user_id)}, {"$max": {"last_login": T0 + timedelta(minutes=1)}})
+    ]
+
+
+async def test_cancelled_flush_keeps_the_batch(buffer, users):
+    user_id = str(ObjectId())
+    buffer.record(user_id, T0)
+    gate = asyncio.Event()
+
+    async def slow_bulk_write(requests, ordered=True):
+        await gate.wait()
+
+    users.bulk_write = slow_bulk_write
+    flush = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0)
+    flush.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flush
+    assert buffer._pending == {user_id: T0}
+
+
+async def test_full_buffer_flushes_without_waiting_for_the_interval(buffer, users, monkeypatch):
+    monkeypatch.setattr(last_login, "LAST_LOGIN_FLUSH_SIZE", 2)
+    buffer.record(str(ObjectId()), T0)
+    assert buffer._flushing is None
+
+    buffer.record(str(ObjectId()), T0)
+    await buffer._flushing
+    assert len(buffer) == 0
+    assert len(users.writes[0][0]) == 2
+
+
+async def test_max_never_moves_last_login_back(db):
+    # mongomock cannot compare a date with null under $max, so both start with a date
+    earlier = await insert_user(db, last_login=T0)
+    later = await insert_user(db, last_login=T0 + timedelta(days=1))
+    buffer = LastLoginBuffer()
+
+    async def get_db():
+        return db
+
+    buffer._get_db = get_db
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(mongomock_motor.AsyncMongoMockCollection, "with_options", lambda self, **kwargs: self, raising=False)
+        buffer.record(str(earlier["_id"]), T0 + timedelta(hours=1))
+        buffer.record(str(later["_id"]), T0 + timedelta(hours=1))
+        await buffer.flush()
+
+    assert (await db.users.find_one({"_id": earlier["_id"]}))["last_login"] == T0 + timedelta(hours=1)
+    assert (await db.users.find_one({"_id": later["_id"]}))["last_login"] == T0 + timedelta(days=1)
+
+
+async def test_shutdown_flushes_the_buffer(mongo, db, monkeypatch):
+    import main
+    from utils import security
+
+    monkeypatch.setattr(database.mongodb, "client", mongo)
+    monkeypatch.setattr(database.mongodb, "is_connected", True)
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "with_options", lambda self, **kwargs: self, raising=False)
+    monkeypatch.setattr(mongo, "close", lambda: None, raising=False)
+    monkeypatch.setattr(security, "BCRYPT_ROUNDS", "4")
+    for name in ("configure_logging", "shutdown_logging"):
+        monkeypatch.setattr(main, name, lambda: None)
+    monkeypatch.setattr(main, "SCHEDULER", False)
+    monkeypatch.setattr(main, "USER_CHANGE_STREAM", False)
+    monkeypatch.setattr(main, "last_logins", LastLoginBuffer())
+    user = await insert_user(db, last_login=T0)
+
+    async with main.lifespan(main.app):
+        main.last_logins.record(str(user["_id"]), T0 + timedelta(hours=1))
+
+    assert len(main.last_logins) == 0
+    assert (await db.users.find_one({"_id": user["_id"]}))["last_login"] == T0 + timedelta(hours=1)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from conftest import insert_user
+from crud import maintenance
+from crud.maintenance import purge_unverified_users
+from crud.user import UserCRUD
+from schemas.user import AdminUserCreate
+
+STALE = datetime.utcnow() - timedelta(days=maintenance.UNVERIFIED_RETENTION_DAYS + 1)
+
+
+async def _stale_signup(db, **fields):
+    return await insert_user(db, **{"is_verified": False, "created_at": STALE, "updated_at": STALE, **fields})
+
+
+async def _remaining(db):
+    return sorted([doc["username"] async for doc in db.users.find({}, {"username": 1})])
+
+
+async def test_purges_only_stale_unverified_email_signups(db):
+    await _stale_signup(db, username="stale")
+    await _stale_signup(db, username="recent", created_at=datetime.utcnow())
+    await _stale_signup(db, username="verified", is_verified=True)
+    await _stale_signup(db, username="logged_in", last_login=STALE)
+    await _stale_signup(db, username="admin", role="admin")
+    await _stale_signup(db, username="google", auth_provider="google")
+
+    report = await purge_unverified_users(db)
+
+    assert report == {"deleted": 1, "batches": 1}
+    assert await _remaining(db) == ["admin", "google", "logged_in", "recent", "verified"]
+
+
+async def test_admin_created_accounts_stay_unverified_and_are_kept(db, monkeypatch):
+    monkeypatch.setattr("database.mongodb.is_connected", True)
+    monkeypatch.setattr("utils.security.BCRYPT_ROUNDS", "4")
+    # Not the first user, so the new account keeps its role
+    await insert_user(db, username="first_admin", role="admin")
+    user = await UserCRUD(db).create_user(AdminUserCreate(
+        full_name="Handed Over", username="handed_over", email="handed_over@example.com",
+        password="Passw0rd!x", role="user",
+    ))
+    assert not user.is_verified
+    await db.users.update_one({"username": "handed_over"}, {"$set": {"created_at": STALE}})
+
+    assert (await purge_unverified_users(db))["deleted"] == 0
+    assert "handed_over" in await _remaining(db)
+
+
+async def test_user_who_verifies_between_find_and_delete_is_kept(db, monkeypatch):
+    await _stale_signup(db, username="racer")
+    await _stale_signup(db, username="stale")
+    collection_type = type(db.users)
+    original_delete_many = collection_type.delete_many
+
+    async def verify_then_delete(self, query, *args, **kwargs):
+        # The OTP is confirmed just after the batch was selected
+        await self.update_one({"username": "racer"}, {"$set": {"is_verified": True}})
+        return await original_delete_many(self, query, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, "delete_many", verify_then_delete)
+    report = await purge_unverified_users(db)
+
+    assert report["deleted"] == 1
+    assert await _remaining(db) == ["racer"]
+    # Only the user actually deleted leaves the counters
+    assert (await db.user_stats.find_one({"_id": "totals"}) or {}).get("total", 0) == -1
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+from utils import scheduler
+from utils.scheduler import Job, Scheduler
+
+
+def _job(runs, interval=60.0, fail=False):
+    async def func(db):
+        runs.append(db)
+        if fail:
+            raise RuntimeError("boom")
+        return {"done": len(runs)}
+    return Job("test-job", interval, func)
+
+
+def _scheduler(db, job):
+    async def get_db():
+        return db
+    return Scheduler([job], get_db)
+
+
+async def test_one_instance_takes_a_due_job(db):
+    runs = []
+    job = _job(runs)
+    first, second = _scheduler(db, job), _scheduler(db, job)
+    now = datetime.utcnow()
+
+    assert await first._acquire(db, job, now)
+    # Held by the first instance
+    assert not await second._acquire(db, job, now)
+    assert not await first._acquire(db, job, now)
+
+
+async def test_held_lease_is_taken_over_once_expired(db):
+    job = _job([])
+    crashed, survivor = _scheduler(db, job), _scheduler(db, job)
+    now = datetime.utcnow()
+    # The holder dies mid-run and never releases the lock
+    assert await crashed._acquire(db, job, now)
+
+    lease = timedelta(seconds=scheduler.SCHEDULER_LEASE_SECONDS)
+    assert not await survivor._acquire(db, job, now + lease - timedelta(seconds=1))
+    assert await survivor._acquire(db, job, now + lease + timedelta(seconds=1))
+    lock = await db.scheduler_locks.find_one({"_id": job.name})
+    assert lock["owner"] == survivor.owner
+
+
+async def test_run_releases_the_lock_and_waits_for_the_interval(db):
+    runs = []
+    job = _job(runs)
+    first, second = _scheduler(db, job), _scheduler(db, job)
+
+    await first.run_if_due(job)
+    await second.run_if_due(job)
+    assert len(runs) == 1
+
+    lock = await db.scheduler_locks.find_one({"_id": job.name})
+    assert lock["last_result"] == "ok"
+    assert lock["last_report"] == {"done": 1}
+    assert lock["locked_until"] <= datetime.utcnow()
+
+    # Due again one interval after the last run, on whichever instance asks first
+    later = lock["last_run_at"] + timedelta(seconds=job.interval)
+    assert await second._acquire(db, job, later)
+
+
+async def test_failed_run_is_recorded_and_not_retried_at_once(db):
+    runs = []
+    job = _job(runs, fail=True)
+    instance = _scheduler(db, job)
+
+    await instance.run_if_due(job)
+    await instance.run_if_due(job)
+
+    assert len(runs) == 1
+    lock = await db.scheduler_locks.find_one({"_id": job.name})
+    assert lock["last_result"] == "error"
+    assert lock["last_report"] == {"error": "boom"}
@@ -0,0 +1,87 @@
+import bcrypt
+import pytest
+
+from conftest import insert_user
+from crud.user import UserCRUD
+from utils import security
+
+
+@pytest.fixture
+def rounds(monkeypatch):
+    """Pin the current bcrypt cost; bcrypt_rounds() is cached per process."""
+    def pin(value):
+        monkeypatch.setattr(security, "BCRYPT_ROUNDS", str(value))
+        security.bcrypt_rounds.cache_clear()
+
+    yield pin
+    security.bcrypt_rounds.cache_clear()
+
+
+def hashed(password: str, cost: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(cost)).decode()
+
+
+@pytest.mark.parametrize("base_ms, expected", [
+    (1000.0, security.BCRYPT_MIN_ROUNDS),    # slow host: would pick 6, never below the minimum
+    (0.001, security.BCRYPT_MAX_ROUNDS),     # fast host: would pick ~26, capped
+    (250 / 2 ** 5, 13),                      # 2**5 times the base cost hits the target exactly
+])
+def test_calibration_is_clamped(monkeypatch, base_ms, expected):
+    monkeypatch.setattr(security, "_time_hash_ms", lambda rounds, samples: base_ms)
+    calibration = security.calibrate_bcrypt(target_ms=250)
+    assert calibration["rounds"] == expected
+    assert security.BCRYPT_MIN_ROUNDS <= calibration["rounds"] <= security.BCRYPT_MAX_ROUNDS
+
+
+@pytest.mark.parametrize("cost, rehash", [(4, True), (5, False), (6, False)])
+def test_only_hashes_below_the_current_cost_are_rehashed(rounds, cost, rehash):
+    rounds(5)
+    assert security.needs_rehash(hashed("secret", cost)) is rehash
+
+
+@pytest.mark.parametrize("stored", [None, "", security.UNUSABLE_PASSWORD, "plaintext"])
+def test_non_bcrypt_values_are_never_rehashed(rounds, stored):
+    rounds(5)
+    assert not security.needs_rehash(stored)
+
+
+async def test_rehash_replaces_the_hash_it_verified(db, rounds):
+    rounds(5)
+    old_hash = hashed("secret", 4)
+    user = await insert_user(db, password_hash=old_hash)
+
+    assert await UserCRUD(db).rehash_password(str(user["_id"]), "secret", old_hash)
+    stored = (await db.users.find_one({"_id": user["_id"]}))["password_hash"]
+    assert security.bcrypt_cost(stored) == 5
+    assert bcrypt.checkpw(b"secret", stored.encode())
+
+
+async def test_rehash_keeps_a_hash_changed_concurrently(db, rounds):
+    rounds(5)
+    old_hash = hashed("secret", 4)
+    # The password was changed between the login that verified old_hash and the rehash
+    changed = hashed("new secret", 5)
+    user = await insert_user(db, password_hash=changed)
+
+    assert not await UserCRUD(db).rehash_password(str(user["_id"]), "secret", old_hash)
+    assert (await db.users.find_one({"_id": user["_id"]}))["password_hash"] == changed
+
+
+async def test_login_rehashes_a_weaker_hash(client, db, rounds):
+    user = await insert_user(db, username="jane", password_hash=hashed("secret", 4))
+    rounds(5)
+
+    response = await client.post("/users/login", data={"username": "jane", "password": "secret"})
+    assert response.status_code == 200
+    stored = (await db.users.find_one({"_id": user["_id"]}))["password_hash"]
+    assert security.bcrypt_cost(stored) == 5
+
+
+async def test_login_never_downgrades_a_stronger_hash(client, db, rounds):
+    strong = hashed("secret", 6)
+    user = await insert_user(db, username="jane", password_hash=strong)
+    rounds(5)
+
+    response = await client.post("/users/login", data={"username": "jane", "password": "secret"})
+    assert response.status_code == 200
+    assert (await db.users.find_one({"_id": user["_id"]}))["password_hash"] == strong
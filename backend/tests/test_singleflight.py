@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+from conftest import insert_user
+from crud import user as user_crud
+from crud.user import UserCRUD
+from utils.singleflight import SingleFlight
+
+
+class Gated:
+    """An async call that counts its runs and returns once the gate opens."""
+
+    def __init__(self, result="value"):
+        self.gate = asyncio.Event()
+        self.calls = 0
+        self.result = result
+
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+async def test_concurrent_callers_share_one_call():
+    flight, call = SingleFlight(), Gated()
+    callers = [asyncio.create_task(flight.do("key", call)) for _ in range(5)]
+    await asyncio.sleep(0)
+    call.gate.set()
+
+    results = await asyncio.gather(*callers)
+    assert call.calls == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert {value for value, _ in results} == {"value"}
+
+
+async def test_different_keys_do_not_share():
+    flight, first, second = SingleFlight(), Gated("a"), Gated("b")
+    first.gate.set()
+    second.gate.set()
+    assert await asyncio.gather(flight.do("a", first), flight.do("b", second)) == [("a", False), ("b", False)]
+
+
+async def test_results_are_not_cached():
+    flight, call = SingleFlight(), Gated()
+    call.gate.set()
+    await flight.do("key", call)
+    assert await flight.do("key", call) == ("value", False)
+    assert call.calls == 2
+
+
+async def test_exception_reaches_every_waiter():
+    flight, call = SingleFlight(), Gated(RuntimeError("db down"))
+    callers = [asyncio.create_task(flight.do("key", call)) for _ in range(3)]
+    await asyncio.sleep(0)
+    call.gate.set()
+
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert call.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+async def test_cancelled_leader_does_not_cancel_the_call():
+    flight, call = SingleFlight(), Gated()
+    leader = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("key", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+    call.gate.set()
+
+    assert await follower == ("value", True)
+    assert leader.cancelled()
+
+
+async def test_forget_only_detaches_that_key():
+    flight, a, b = SingleFlight(), Gated("a"), Gated("b")
+    in_flight = [asyncio.create_task(flight.do("a", a)), asyncio.create_task(flight.do("b", b))]
+    await asyncio.sleep(0)
+
+    flight.forget("a")
+    after_a, after_b = asyncio.create_task(flight.do("a", a)), asyncio.create_task(flight.do("b", b))
+    await asyncio.sleep(0)
+    a.gate.set()
+    b.gate.set()
+
+    assert await after_a == ("a", False)
+    assert await after_b == ("b", True)
+    await asyncio.gather(*in_flight)
+    assert (a.calls, b.calls) == (2, 1)
+
+
+@pytest.fixture
+def slow_reads(db, monkeypatch):
+    """find_one blocks until the returned event is set, and counts its calls."""
+    monkeypatch.setattr("database.mongodb.is_connected", True)
+    monkeypatch.setattr(user_crud, "user_reads", SingleFlight())
+    gate, calls = asyncio.Event(), []
+    collection_type = type(db.users)
+    original_find_one = collection_type.find_one
+
+    async def gated_find_one(self, *args, **kwargs):
+        calls.append(args[0] if args else None)
+        await gate.wait()
+        return await original_find_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, "find_one", gated_find_one)
+    return gate, calls
+
+
+async def test_write_detaches_only_the_written_users_lookups(db, slow_reads):
+    gate, calls = slow_reads
+    await insert_user(db, username="jane", otp_code="123456")
+    await insert_user(db, username="john")
+    crud = UserCRUD(db)
+
+    before = [asyncio.create_task(UserCRUD(db).get_user_by_email(f"{name}@example.com")) for name in ("jane", "john")]
+    await asyncio.sleep(0)
+    assert await crud.clear_otp_data("jane@example.com")
+
+    after = [asyncio.create_task(UserCRUD(db).get_user_by_email(f"{name}@example.com")) for name in ("jane", "john")]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*before, *after)
+
+    # jane@ was queried again after the write; john@ still joined the flight in progress
+    assert [query["email"] for query in calls] == ["jane@example.com", "john@example.com", "jane@example.com"]
+    assert (await after[0]).otp_code is None
+
+
+async def test_rehash_detaches_lookups_of_that_user(db, slow_reads, monkeypatch):
+    import bcrypt
+    monkeypatch.setattr("utils.security.BCRYPT_ROUNDS", "5")
+    gate, calls = slow_reads
+    old_hash = bcrypt.hashpw(b"secret", bcrypt.gensalt(4)).decode()
+    user = await insert_user(db, username="jane", password_hash=old_hash)
+
+    in_flight = asyncio.create_task(UserCRUD(db).get_user_by_email("jane@example.com"))
+    await asyncio.sleep(0)
+    assert await UserCRUD(db).rehash_password(str(user["_id"]), "secret", old_hash)
+    reread = asyncio.create_task(UserCRUD(db).get_user_by_email("jane@example.com"))
+    await asyncio.sleep(0)
+    gate.set()
+    await in_flight
+
+    assert len(calls) == 2
+    assert (await reread).password_hash != old_hash
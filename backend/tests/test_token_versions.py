@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from crud.token_versions import TokenVersionCache
+from crud.user_changes import UserChange
+
+
+def test_unknown_user_is_valid():
+    cache = TokenVersionCache()
+    assert cache.is_valid("u1", 0)
+
+
+def test_bumped_version_revokes_older_tokens():
+    cache = TokenVersionCache()
+    cache.record("u1", 2, True)
+    assert not cache.is_valid("u1", 1)
+    assert cache.is_valid("u1", 2)
+    # Issued after a change this instance has not seen yet
+    assert cache.is_valid("u1", 3)
+
+
+def test_versions_never_move_backwards():
+    cache = TokenVersionCache()
+    cache.record("u1", 3, True)
+    cache.record("u1", 1, True)
+    assert not cache.is_valid("u1", 2)
+
+
+def test_deactivated_and_deleted_users():
+    cache = TokenVersionCache()
+    cache.record("u1", 1, False)
+    cache.record_deleted("u2")
+    assert not cache.is_valid("u1", 1)
+    assert cache.is_deactivated("u1")
+    assert not cache.is_valid("u2", 5)
+    assert not cache.is_deactivated("u2")
+
+
+def test_apply_change_records_other_instances_writes():
+    cache = TokenVersionCache()
+    cache.apply_change(UserChange("update", "u1", frozenset({"token_version"}), {"token_version": 1, "is_active": True}))
+    cache.apply_change(UserChange("update", "u2", frozenset({"full_name"}), {"token_version": 4, "is_active": True}))
+    cache.apply_change(UserChange("delete", "u3"))
+    assert not cache.is_valid("u1", 0)
+    # A change that does not touch the auth state is ignored
+    assert cache.is_valid("u2", 0)
+    assert not cache.is_valid("u3", 0)
+
+
+async def test_refresh_loads_revoked_users_then_follows_updates(db):
+    revoked, fresh = ObjectId(), ObjectId()
+    now = datetime.utcnow()
+    await db.users.insert_many([
+        {"_id": revoked, "token_version": 2, "is_active": True, "updated_at": now},
+        {"_id": fresh, "token_version": 0, "is_active": True, "updated_at": now},
+    ])
+    cache = TokenVersionCache()
+    assert not cache.ready
+
+    await cache.refresh(db)
+    assert cache.ready
+    assert not cache.is_valid(str(revoked), 1)
+    assert cache.is_valid(str(fresh), 0)
+
+    await db.users.update_one({"_id": fresh}, {"$set": {"is_active": False, "updated_at": datetime.utcnow()}})
+    deleted = ObjectId()
+    await db.token_revocations.insert_one({"_id": deleted, "revoked_at": datetime.utcnow()})
+    await cache.refresh(db)
+    assert cache.is_deactivated(str(fresh))
+    assert not cache.is_valid(str(deleted), 0)
+
+
+async def test_refresh_started_before_a_reset_does_not_mark_ready(db, monkeypatch):
+    await db.users.insert_one({"_id": ObjectId(), "token_version": 1, "is_active": True})
+    cache = TokenVersionCache()
+    collection_type = type(db.users)
+    original_find = collection_type.find
+
+    def find_then_reset(self, *args, **kwargs):
+        # The stream reports missed events while this refresh is reading
+        cache.reset()
+        return original_find(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, "find", find_then_reset)
+    await cache.refresh(db)
+    assert not cache.ready
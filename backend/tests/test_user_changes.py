@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from crud import user_changes
+from crud.user_changes import UserChangeWatcher
+
+
+class FakeStream:
+    """Replays ``steps``: an event dict, None for an empty batch, or an exception to raise."""
+
+    def __init__(self, steps):
+        self._steps = list(steps)
+        self._position = 0
+        self.alive = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def try_next(self):
+        step = self._steps.pop(0)
+        self._position += 1
+        self.resume_token = {"_data": f"{id(self)}-{self._position}"}
+        if isinstance(step, BaseException):
+            raise step
+        return step
+
+
+class FakeDatabase:
+    """``users.watch`` hands out the given streams in order and records how each was opened."""
+
+    def __init__(self, *streams):
+        self._streams = list(streams)
+        self.resumed_after = []
+        self.users = self
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.resumed_after.append(resume_after)
+        if not self._streams:
+            # Ends the test: the watcher re-raises cancellation
+            raise asyncio.CancelledError
+        stream = self._streams.pop(0)
+        if isinstance(stream, BaseException):
+            raise stream
+        return stream
+
+
+def _update(user_id, **fields):
+    return {
+        "operationType": "update",
+        "documentKey": {"_id": user_id},
+        "fullDocument": {"token_version": 1, "is_active": True},
+        "changed": list(fields),
+    }
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(user_changes, "USER_CHANGE_STREAM_RETRY_SECONDS", 0)
+
+
+def _getter(db):
+    async def get_db():
+        return db
+    return get_db
+
+
+async def _run(watcher, db):
+    with pytest.raises(asyncio.CancelledError):
+        await watcher.run(_getter(db))
+
+
+async def test_resumes_from_the_last_token_after_an_error():
+    user_id = ObjectId()
+    first = FakeStream([_update(user_id, token_version=1), None, AutoReconnect("primary stepped down")])
+    second = FakeStream([_update(user_id, is_active=1), asyncio.CancelledError()])
+    db = FakeDatabase(first, second)
+    watcher = UserChangeWatcher()
+    seen = []
+    watcher.subscribe(seen.append)
+
+    await _run(watcher, db)
+
+    # Reopened after the last token seen, including the one of the empty batch
+    assert db.resumed_after == [None, {"_data": f"{id(first)}-2"}]
+    assert [(change.operation, change.user_id, change.fields) for change in seen] == [
+        ("update", str(user_id), frozenset({"token_version"})),
+        ("update", str(user_id), frozenset({"is_active"})),
+    ]
+
+
+async def test_saved_token_is_used_on_the_first_open():
+    db = FakeDatabase(FakeStream([asyncio.CancelledError()]))
+    watcher = UserChangeWatcher()
+    watcher.resume_token = {"_data": "saved"}
+
+    await _run(watcher, db)
+
+    assert db.resumed_after == [{"_data": "saved"}]
+
+
+async def test_lost_history_resets_subscribers_and_starts_over():
+    db = FakeDatabase(
+        FakeStream([None, OperationFailure("resume point no longer in the oplog", code=286)]),
+        FakeStream([asyncio.CancelledError()]),
+    )
+    watcher = UserChangeWatcher()
+    seen = []
+    watcher.subscribe(seen.append)
+
+    await _run(watcher, db)
+
+    assert [change.operation for change in seen] == ["reset"]
+    assert db.resumed_after[1] is None
+
+
+async def test_standalone_server_stops_the_watcher():
+    db = FakeDatabase(OperationFailure("The $changeStream stage is only supported on replica sets", code=40573))
+    watcher = UserChangeWatcher()
+
+    await watcher.run(_getter(db))
+
+    assert not watcher.live
+    assert db.resumed_after == [None]
+
+
+async def test_failing_subscriber_does_not_stop_the_others():
+    watcher = UserChangeWatcher()
+    seen = []
+
+    def broken(change):
+        raise RuntimeError("boom")
+
+    watcher.subscribe(broken)
+    watcher.subscribe(seen.append)
+    watcher.publish(user_changes.UserChange(operation="delete", user_id="u1"))
+
+    assert [change.user_id for change in seen] == ["u1"]
@@ -0,0 +1,140 @@
+import pytest
+
+from conftest import auth_headers, insert_user
+from crud import user_counts
+from crud.user_changes import UserChange
+from crud.user_counts import UserCounter, invalidate_counts, on_user_change
+from crud.user_stats import UserStats
+from models.user import RoleEnum
+
+TOTALS = {
+    "total": 10,
+    "role": {"admin": 2, "user": 8},
+    "status": {"active": 7, "inactive": 3},
+    "role_status": {"admin_active": 2, "user_active": 5, "user_inactive": 3},
+}
+
+
+class FakeCollection:
+    def __init__(self, count=42, estimate=40):
+        self.count, self.estimate = count, estimate
+        self.counted = []
+        self.estimated = 0
+
+    async def count_documents(self, query, session=None):
+        self.counted.append(query)
+        return self.count
+
+    async def estimated_document_count(self):
+        self.estimated += 1
+        return self.estimate
+
+
+class FakeStats:
+    def __init__(self, totals=TOTALS):
+        self.totals = totals
+
+    async def get_totals(self):
+        return self.totals
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    invalidate_counts()
+    yield
+    invalidate_counts()
+
+
+async def test_no_filter_is_estimated():
+    users = FakeCollection()
+    assert await UserCounter(users, FakeStats()).total({}) == (40, "estimated")
+    assert users.counted == []
+
+
+async def test_exact_always_counts():
+    users = FakeCollection()
+    counter = UserCounter(users, FakeStats())
+    assert await counter.total({}, exact=True) == (42, "exact")
+    assert await counter.total({"role": RoleEnum.admin}, exact=True) == (42, "exact")
+    assert users.counted == [{}, {"role": RoleEnum.admin}]
+    assert users.estimated == 0
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({"role": RoleEnum.admin}, 2),
+    ({"role": "user"}, 8),
+    ({"is_active": False}, 3),
+    ({"role": RoleEnum.user, "is_active": True}, 5),
+    ({"role": RoleEnum.admin, "is_active": False}, 0),
+])
+async def test_role_and_status_filters_read_the_counters(query, expected):
+    users = FakeCollection()
+    assert await UserCounter(users, FakeStats()).total(query) == (expected, "counter")
+    assert users.counted == []
+
+
+@pytest.mark.parametrize("stats, query", [
+    (FakeStats(), {"is_verified": False}),                  # no counter for this filter
+    (FakeStats(), {"role": "user", "auth_provider": "google"}),
+    (FakeStats(totals=None), {"role": "user"}),             # counters not built yet
+    (None, {"is_active": True}),                            # counter without stats
+])
+async def test_other_filters_fall_back_to_count_documents(stats, query):
+    users = FakeCollection()
+    counter = UserCounter(users, stats)
+    assert await counter.total(query) == (42, "exact")
+    assert await counter.total(query) == (42, "cached")
+    assert users.counted == [query]
+
+
+async def test_cached_counts_expire(monkeypatch):
+    users, now = FakeCollection(), [1000.0]
+    monkeypatch.setattr(user_counts, "monotonic", lambda: now[0])
+    counter = UserCounter(users)
+    await counter.total({"is_active": True})
+
+    now[0] += user_counts.COUNT_CACHE_TTL_SECONDS + 1
+    assert await counter.total({"is_active": True}) == (42, "exact")
+    assert len(users.counted) == 2
+
+
+@pytest.mark.parametrize("change, invalidates", [
+    (UserChange("insert", "u1"), True),
+    (UserChange("delete", "u1"), True),
+    (UserChange("update", "u1", frozenset({"role"})), True),
+    (UserChange("update", "u1", frozenset({"is_active", "updated_at"})), True),
+    (UserChange("update", "u1"), True),                      # replaced: anything may have changed
+    (UserChange("update", "u1", frozenset({"full_name", "updated_at"})), False),
+])
+async def test_user_changes_drop_the_cached_counts(change, invalidates):
+    users = FakeCollection()
+    counter = UserCounter(users)
+    await counter.total({"role": "user"})
+
+    on_user_change(change)
+    await counter.total({"role": "user"})
+    assert len(users.counted) == (2 if invalidates else 1)
+
+
+async def test_paginated_endpoint_reports_the_total_source(client, db):
+    admin = await insert_user(db, role="admin")
+    for _ in range(3):
+        await insert_user(db)
+    await insert_user(db, is_active=False)
+    await UserStats(db).reconcile()
+    headers = auth_headers(admin)
+
+    for query, total, source in [
+        ("per_page=2", 5, "estimated"),
+        ("is_active=true", 4, "counter"),
+        ("role=user&is_active=false", 1, "counter"),
+        ("is_active=true&exact=true", 4, "exact"),
+    ]:
+        response = await client.get(f"/users/paginated?{query}", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["x-total-source"] == source, query
+        assert response.json()["total"] == total, query
+
+    response = await client.get("/users/paginated?per_page=2&page=3", headers=headers)
+    assert response.json()["total_pages"] == 3
+    assert len(response.json()["users"]) == 1
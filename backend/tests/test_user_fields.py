@@ -0,0 +1,52 @@
+from conftest import auth_headers, insert_user
+from crud.user import UserCRUD
+
+
+def test_projection_keeps_the_etag_inputs(db):
+    crud = UserCRUD(db)
+    assert crud._projection(None) is None
+    assert crud._projection(("id", "username")) == {"username": 1, "updated_at": 1, "last_login": 1}
+
+
+async def test_unknown_fields_are_rejected(client, db):
+    admin = await insert_user(db, role="admin")
+    response = await client.get("/users/?fields=username,password_hash,otp_code", headers=auth_headers(admin))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown fields: otp_code, password_hash"
+
+
+async def test_listing_returns_only_the_requested_fields(client, db):
+    admin = await insert_user(db, username="admin", role="admin")
+    await insert_user(db, username="jane")
+
+    response = await client.get("/users/?fields= role ,username", headers=auth_headers(admin))
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": str(admin["_id"]), "username": "admin", "role": "admin"},
+        {"id": response.json()[1]["id"], "username": "jane", "role": "user"},
+    ]
+    assert response.headers["etag"]
+
+
+async def test_me_with_fields(client, db):
+    jane = await insert_user(db, username="jane")
+    response = await client.get("/users/me?fields=username", headers=auth_headers(jane))
+    assert response.status_code == 200
+    assert response.json() == {"id": str(jane["_id"]), "username": "jane"}
+
+    full = await client.get("/users/me", headers=auth_headers(jane))
+    assert full.headers["etag"] != response.headers["etag"]
+
+
+async def test_documents_missing_required_fields_render_null(client, db):
+    admin = await insert_user(db, role="admin")
+    legacy = await insert_user(db, username="legacy")
+    await db.users.update_one({"_id": legacy["_id"]}, {"$unset": {"full_name": "", "is_active": ""}})
+
+    response = await client.get(
+        "/users/search?q=legacy&fields=full_name,username,is_active", headers=auth_headers(admin)
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": str(legacy["_id"]), "full_name": None, "username": "legacy", "is_active": None}
+    ]
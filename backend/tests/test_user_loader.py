@@ -0,0 +1,109 @@
+import asyncio
+
+from conftest import insert_user
+from crud.user import UserCRUD
+from crud.user_loader import UserLoader
+
+
+async def test_loads_in_one_iteration_share_one_query(db):
+    jane = await insert_user(db, username="jane")
+    john = await insert_user(db, username="john")
+    loader = UserLoader(db.users)
+
+    by_id, by_email, by_username, nobody = await asyncio.gather(
+        loader.load("_id", str(jane["_id"])),
+        loader.load("email", "JOHN@example.com"),
+        loader.load("username", "jane"),
+        loader.load("username", "nobody"),
+    )
+
+    assert loader.queries == 1
+    assert by_id["_id"] == by_username["_id"] == jane["_id"]
+    assert by_email["_id"] == john["_id"]
+    assert nobody is None
+
+
+async def test_load_many_keeps_order_and_gaps(db):
+    jane = await insert_user(db, username="jane")
+    john = await insert_user(db, username="john")
+    loader = UserLoader(db.users)
+
+    docs = await loader.load_many("username", ["john", "ghost", "jane"])
+    assert [doc and doc["_id"] for doc in docs] == [john["_id"], None, jane["_id"]]
+    assert loader.queries == 1
+
+
+async def test_repeated_keys_are_deduplicated_and_memoized(db):
+    jane = await insert_user(db, username="jane")
+    loader = UserLoader(db.users)
+
+    first = loader.load("_id", str(jane["_id"]))
+    assert loader.load("_id", jane["_id"]) is first
+    assert loader.load("email", "jane@example.com") is loader.load("email", "Jane@Example.com")
+    await asyncio.gather(first, loader.load("email", "jane@example.com"))
+
+    await loader.load("_id", str(jane["_id"]))
+    assert loader.queries == 1
+
+
+async def test_invalid_id_resolves_to_none_without_a_query(db):
+    loader = UserLoader(db.users)
+    assert await loader.load("_id", "not-an-id") is None
+    assert loader.queries == 0
+
+
+async def test_failed_query_reaches_every_waiter_and_is_not_memoized(db, monkeypatch):
+    jane = await insert_user(db, username="jane")
+    loader = UserLoader(db.users)
+
+    def broken_find(self, *args, **kwargs):
+        raise RuntimeError("db down")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(type(db.users), "find", broken_find)
+        results = await asyncio.gather(
+            loader.load("username", "jane"), loader.load("email", "jane@example.com"), return_exceptions=True
+        )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    assert (await loader.load("username", "jane"))["_id"] == jane["_id"]
+    assert loader.queries == 2
+
+
+async def test_clear_makes_the_next_load_read_again(db):
+    jane = await insert_user(db, username="jane")
+    loader = UserLoader(db.users)
+    await loader.load("username", "jane")
+
+    await db.users.update_one({"_id": jane["_id"]}, {"$set": {"full_name": "Jane Roe"}})
+    assert (await loader.load("username", "jane"))["full_name"] != "Jane Roe"
+
+    loader.clear()
+    assert (await loader.load("username", "jane"))["full_name"] == "Jane Roe"
+    assert loader.queries == 2
+
+
+async def test_write_clears_the_requests_loader(db, monkeypatch):
+    monkeypatch.setattr("database.mongodb.is_connected", True)
+    jane = await insert_user(db, username="jane")
+    crud = UserCRUD(db)
+
+    assert (await crud.get_user_by_id(str(jane["_id"]))).full_name != "Jane Roe"
+    await crud.update_user(str(jane["_id"]), {"full_name": "Jane Roe"})
+
+    assert (await crud.get_user_by_id(str(jane["_id"]))).full_name == "Jane Roe"
+    assert crud.loader.queries == 2
+
+
+async def test_batch_lookup_through_crud_is_one_query(db, monkeypatch):
+    monkeypatch.setattr("database.mongodb.is_connected", True)
+    jane = await insert_user(db, username="jane")
+    john = await insert_user(db, username="john")
+    crud = UserCRUD(db)
+
+    users, missing = await crud.get_users_batch(
+        ids=[str(jane["_id"])], emails=["john@example.com", "jane@example.com"], usernames=["ghost"]
+    )
+    assert [user.username for user in users] == ["jane", "john"]
+    assert missing == {"ids": [], "emails": [], "usernames": ["ghost"]}
+    assert crud.loader.queries == 1
@@ -0,0 +1,141 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import insert_user
+from crud import user_stats
+from crud.user import UserCRUD
+from crud.user_stats import UserStats
+
+
+async def _signup(db, stats, **fields):
+    """A user written through the CRUD path: document, then counters."""
+    user = await insert_user(db, **fields)
+    await stats.apply(None, user)
+    return user
+
+
+async def _total(stats):
+    return ((await stats.get_totals()) or {}).get("total", 0)
+
+
+async def test_apply_tracks_signups_changes_and_deletes(db):
+    stats = UserStats(db)
+    user = await _signup(db, stats, is_verified=False)
+    await _signup(db, stats, auth_provider="google")
+
+    verified = {**user, "is_verified": True}
+    await stats.apply(user, verified)
+    await stats.apply_many([(verified, None)])
+
+    totals = await stats.get_totals()
+    assert totals["total"] == 1
+    assert totals["verification"] == {"verified": 1, "unverified": 0}
+    assert totals["provider"] == {"email": 0, "google": 1}
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    assert (await stats.get_signups(1)) == [{"date": today, "count": 1}]
+
+
+async def test_reconcile_corrects_drift_and_keeps_later_increments(db):
+    stats = UserStats(db)
+    await _signup(db, stats)
+    # Written around the CRUD: drift
+    await insert_user(db, role="admin")
+    await insert_user(db, is_active=False)
+
+    result = await stats.reconcile()
+
+    assert result["total"] == 3
+    assert result["role"] == {"admin": 1, "user": 2}
+    assert result["status"] == {"active": 2, "inactive": 1}
+    assert await _total(stats) == 3
+    # Counters keep following $inc after a reconcile
+    await _signup(db, stats)
+    assert await _total(stats) == 4
+
+
+async def test_write_racing_the_recount_is_retried_not_double_counted(db, monkeypatch):
+    stats = UserStats(db)
+    await _signup(db, stats)
+    original_count = UserStats._count
+    attempts = []
+
+    async def count_with_a_racing_signup(self):
+        attempts.append(1)
+        counted = await original_count(self)
+        if len(attempts) == 1:
+            # A whole signup (document and $inc) lands while the first recount runs
+            await _signup(db, stats)
+        return counted
+
+    monkeypatch.setattr(UserStats, "_count", count_with_a_racing_signup)
+    result = await stats.reconcile()
+
+    assert len(attempts) == 2
+    assert result["total"] == 2
+    assert await _total(stats) == 2
+
+
+async def test_reconcile_gives_up_when_every_recount_is_raced(db, monkeypatch):
+    stats = UserStats(db)
+    await insert_user(db)
+    original_count = UserStats._count
+    attempts = []
+
+    async def always_raced(self):
+        attempts.append(1)
+        counted = await original_count(self)
+        await _signup(db, stats)
+        return counted
+
+    monkeypatch.setattr(UserStats, "_count", always_raced)
+    assert await stats.reconcile() is None
+
+    assert len(attempts) == user_stats._RECONCILE_ATTEMPTS
+    totals = await stats.get_totals()
+    # Only the racing signups' own increments: no correction was applied
+    assert totals["total"] == user_stats._RECONCILE_ATTEMPTS
+    assert "reconciled_at" not in totals
+
+
+async def test_increment_landing_after_the_recount_is_corrected_next_run(db):
+    stats = UserStats(db)
+    # The documented residual race: the document is counted, its $inc lands late
+    user = await insert_user(db)
+    await stats.reconcile()
+    await stats.apply(None, user)
+    assert await _total(stats) == 2
+
+    await stats.reconcile()
+    assert await _total(stats) == 1
+
+
+@pytest.fixture
+def connected(monkeypatch):
+    monkeypatch.setattr("database.mongodb.is_connected", True)
+
+
+async def test_get_stats_reconciles_when_there_are_no_counters(db, connected):
+    await insert_user(db, role="admin")
+    await insert_user(db, is_verified=False)
+
+    stats = await UserCRUD(db).get_stats(days=7)
+
+    assert stats["total"] == 2
+    assert stats["by_role"] == {"admin": 1, "user": 1}
+    assert stats["unverified"] == 1
+    assert stats["reconciled_at"] is not None
+    assert (await UserStats(db).get_totals())["total"] == 2
+
+
+async def test_get_stats_reads_the_counters_when_the_first_reconcile_gives_up(db, connected, monkeypatch):
+    async def raced(self):
+        return None
+
+    await _signup(db, UserStats(db))
+    await db.user_stats.delete_many({})
+    monkeypatch.setattr(UserStats, "reconcile", raced)
+
+    stats = await UserCRUD(db).get_stats(days=7)
+    assert stats is not None
+    assert stats["total"] == 0
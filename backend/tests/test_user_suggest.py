@@ -0,0 +1,106 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from conftest import auth_headers, insert_user
+from crud import user_suggest
+from crud.token_versions import token_versions
+from crud.user_changes import UserChange
+from crud.user_suggest import SuggestIndex, normalize, suggest_fields
+
+
+def _doc(username, full_name, is_active=True):
+    return {"username": username, "full_name": full_name, "avatar_url": None, "is_active": is_active}
+
+
+def _usernames(index, prefix, limit=10):
+    return [suggestion["username"] for suggestion in index.search(normalize(prefix), limit)]
+
+
+async def _warm_index(db, *docs):
+    for doc in docs:
+        await db.users.insert_one({"_id": ObjectId(), **doc})
+    index = SuggestIndex()
+    await index.warm(db)
+    return index
+
+
+def test_normalized_terms():
+    assert normalize("  Zoë  Ann ") == "zoe ann"
+    assert suggest_fields("Jane_Doe", "Jane van Doe") == {
+        "username_lower": "jane_doe",
+        "name_terms": ["jane van doe", "van doe", "doe"],
+    }
+
+
+async def test_warm_index_ranks_matches(db):
+    index = await _warm_index(
+        db,
+        _doc("jan", "Jan Kowalski"),
+        _doc("jane_doe", "Jane van Doe"),
+        _doc("kowal", "Janina Kowal"),
+        _doc("janek", "Ex Member", is_active=False),
+    )
+    assert index.ready
+    # Exact username, then username prefix, then full name prefix; inactive users never
+    assert _usernames(index, "jan") == ["jan", "jane_doe", "kowal"]
+    assert _usernames(index, "van d") == ["jane_doe"]
+    assert _usernames(index, "jan", limit=1) == ["jan"]
+
+
+async def test_apply_change_follows_other_instances(db):
+    index = await _warm_index(db, _doc("jane_doe", "Jane Doe"))
+    user_id = str(ObjectId())
+
+    index.apply_change(UserChange("insert", user_id, None, _doc("zoe", "Zoë Ann")))
+    assert _usernames(index, "zoe") == ["zoe"]
+
+    index.apply_change(UserChange("update", user_id, frozenset({"username"}), _doc("zoey", "Zoë Ann")))
+    assert _usernames(index, "zoe") == ["zoey"]
+    assert _usernames(index, "zoey") == ["zoey"]
+
+    # Writes that do not touch suggestion fields are ignored
+    index.apply_change(UserChange("update", user_id, frozenset({"last_login"}), _doc("stale", "Stale")))
+    assert _usernames(index, "stale") == []
+
+    index.apply_change(UserChange("update", user_id, frozenset({"is_active"}), _doc("zoey", "Zoë Ann", is_active=False)))
+    assert _usernames(index, "zoe") == []
+
+    index.apply_change(UserChange("insert", user_id, None, _doc("zoey", "Zoë Ann")))
+    index.apply_change(UserChange("delete", user_id))
+    assert _usernames(index, "zoe") == []
+    assert len(index) == 1
+
+
+def test_changes_before_warming_are_ignored():
+    index = SuggestIndex()
+    index.apply_change(UserChange("insert", str(ObjectId()), None, _doc("zoe", "Zoë Ann")))
+    assert not index.ready
+    assert len(index) == 0
+
+
+async def test_reset_falls_back_to_mongo_and_rewarms(db, monkeypatch):
+    index = await _warm_index(db, _doc("jane_doe", "Jane Doe"))
+    rewarmed = []
+
+    async def fake_warm():
+        rewarmed.append(True)
+
+    monkeypatch.setattr(user_suggest, "warm_suggest_index", fake_warm)
+    index.apply_change(UserChange(operation="reset"))
+    assert not index.ready
+    await index._warming
+    assert rewarmed == [True]
+
+
+async def test_suggest_endpoint_authenticates_from_the_token(client, db, monkeypatch):
+    await insert_user(db, username="jane_doe", **suggest_fields("jane_doe", "Jane Doe"))
+    # The caller's document is never read: the revocation map is enough
+    caller = {"_id": ObjectId(), "email": "ghost@example.com", "role": "user", "username": "ghost", "token_version": 0}
+    monkeypatch.setattr(token_versions, "_synced_until", datetime.utcnow())
+
+    assert (await client.get("/users/suggest", params={"q": "jan"})).status_code == 401
+
+    response = await client.get("/users/suggest", params={"q": "jan"}, headers=auth_headers(caller))
+    assert response.status_code == 200
+    assert [suggestion["username"] for suggestion in response.json()] == ["jane_doe"]
@@ -0,0 +1,137 @@
+"""
+Admission control for CPU-heavy work (password hashing).
+
+bcrypt burns a core for about BCRYPT_TARGET_MS per hash. Run inline on the
+event loop, a login storm stalls every other request behind it; run in an
+unbounded pool, all logins slow down together. ``AdmissionController`` runs
+the work in a dedicated thread pool (bcrypt releases the GIL) with at most
+``concurrency`` jobs at a time and a bounded queue in front:
+
+- a job is admitted immediately while a slot is free;
+- otherwise it queues, unless the queue is full or the estimated wait
+  (queue position x average service time / concurrency) exceeds
+  ``max_wait`` — then ``Overloaded`` is raised at once;
+- a queued job that still has not started after ``max_wait`` is shed too.
+
+main.py turns ``Overloaded`` into 503 with ``Retry-After``, so excess logins
+fail fast while ``/users/me`` and the rest keep their latency.
+
+Queue depth, jobs in progress, waits and sheds are exported by pool name
+(``admission_*`` metrics).
+
+Configuration (environment):
+    PASSWORD_HASH_CONCURRENCY     parallel hashes (default: CPU count)
+    PASSWORD_HASH_MAX_QUEUE       waiting hashes before shedding (default 16 x concurrency)
+    PASSWORD_HASH_MAX_WAIT_SECONDS  longest acceptable wait for a slot (default 2)
+"""
+import asyncio
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Callable
+
+from utils.metrics import registry
+
+_CPUS = os.cpu_count() or 1
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(_CPUS)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", str(16 * PASSWORD_HASH_CONCURRENCY)))
+PASSWORD_HASH_MAX_WAIT_SECONDS = float(os.getenv("PASSWORD_HASH_MAX_WAIT_SECONDS", "2"))
+
+# Weight of the latest job in the service time average
+_EWMA_ALPHA = 0.2
+
+admission_total = registry.counter(
+    "admission_total", "Jobs offered to an admission pool, by pool and result (admitted, shed_queue, shed_wait)")
+queue_depth = registry.gauge("admission_queue_depth", "Jobs waiting for a slot, by pool")
+in_progress = registry.gauge("admission_in_progress", "Jobs running, by pool")
+wait_seconds = registry.histogram(
+    "admission_wait_seconds", "Time admitted jobs waited for a slot, by pool",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+)
+
+
+class Overloaded(Exception):
+    """The pool cannot start the job within its deadline; retry after ``retry_after`` seconds."""
+
+    def __init__(self, pool: str, retry_after: float):
+        super().__init__(f"{pool} is overloaded")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float,
+                 initial_service_seconds: float = 0.25):
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.service_seconds = initial_service_seconds
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=name)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._running = 0
+        self._waiting = 0
+
+    def _must_queue(self) -> bool:
+        return self._semaphore.locked() or self._waiting > 0
+
+    def estimated_wait(self) -> float:
+        """Seconds a job offered now would wait for a slot."""
+        if not self._must_queue():
+            return 0.0
+        return (self._waiting + 1) * self.service_seconds / self.concurrency
+
+    def retry_after(self) -> int:
+        return max(math.ceil(self.estimated_wait()), 1)
+
+    def _shed(self, reason: str) -> Overloaded:
+        admission_total.inc(pool=self.name, result=reason)
+        return Overloaded(self.name, self.retry_after())
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """``func(*args)`` in the pool's threads, or ``Overloaded``."""
+        if not self._must_queue():
+            # A slot is free: taken without suspending
+            await self._semaphore.acquire()
+            wait_seconds.observe(0.0, pool=self.name)
+        else:
+            if self._waiting >= self.max_queue:
+                raise self._shed("shed_queue")
+            if self.estimated_wait() > self.max_wait:
+                raise self._shed("shed_wait")
+
+            self._waiting += 1
+            queue_depth.set(self._waiting, pool=self.name)
+            queued = perf_counter()
+            acquired = False
+            try:
+                # Not wait_for: its inner task can be granted the permit just as
+                # the timeout cancels it, and the permit is then never released.
+                # Here the acquire runs in this task, and Semaphore.acquire hands
+                # a permit granted at the same time as a cancellation back itself.
+                async with asyncio.timeout(self.max_wait):
+                    acquired = await self._semaphore.acquire()
+            except TimeoutError:
+                pass
+            finally:
+                self._waiting -= 1
+                queue_depth.set(self._waiting, pool=self.name)
+            if not acquired:
+                raise self._shed("shed_wait")
+            wait_seconds.observe(perf_counter() - queued, pool=self.name)
+        admission_total.inc(pool=self.name, result="admitted")
+
+        self._running += 1
+        in_progress.set(self._running, pool=self.name)
+        started = perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        future.add_done_callback(lambda _: self._finished(started))
+        # Shielded: a cancelled caller cannot stop the thread, the slot is freed when it is done
+        return await asyncio.shield(future)
+
+    def _finished(self, started: float) -> None:
+        self.service_seconds += _EWMA_ALPHA * (perf_counter() - started - self.service_seconds)
+        self._running -= 1
+        in_progress.set(self._running, pool=self.name)
+        self._semaphore.release()
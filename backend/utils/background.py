@@ -0,0 +1,31 @@
+"""
+Per-instance background loops started from the app lifespan.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+def start_periodic(name: str, interval: float, func: Callable[[], Awaitable[None]]) -> asyncio.Task:
+    """Run ``func`` now and then every ``interval`` seconds until cancelled."""
+    async def loop():
+        while True:
+            try:
+                await func()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Background task %s failed: %s", name, e)
+            await asyncio.sleep(interval)
+
+    return asyncio.create_task(loop(), name=name)
+
+
+async def stop_tasks(tasks: Iterable[asyncio.Task]) -> None:
+    """Cancel background tasks and wait for them to finish."""
+    tasks = list(tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,148 @@
+"""
+Opt-in traffic capture for replay-based performance testing.
+
+When ``TRAFFIC_CAPTURE_FILE`` is set, ``TrafficCaptureMiddleware`` appends one
+JSON line per HTTP request describing its *shape* and timing:
+
+    {"t": 12.503, "method": "GET", "route": "/users/me", "query": [],
+     "status": 200, "duration_ms": 7.4, "request_bytes": 0,
+     "content_type": null, "subject": "3f9c1a0b"}
+
+Nothing identifying is recorded: paths are reduced to their route template
+(``/users/otp-status/{email}``), only query parameter *names* are kept, bodies
+and headers are dropped, and ``subject`` is a salted hash of the bearer token
+or path parameters. The salt is random per process, so subjects only say
+"these requests came from the same caller" within one capture, which lets the
+replay tool (``python -m bench.replay``) reproduce per-user patterns such as
+repeated ``/users/me`` polling or OTP resend storms.
+
+Lines are written by a background thread through the same non-blocking queue
+handler the application logger uses.
+"""
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import secrets
+from time import monotonic, perf_counter
+from typing import Optional
+
+from utils.logger import NonBlockingQueueHandler
+
+TRAFFIC_CAPTURE_FILE = os.getenv("TRAFFIC_CAPTURE_FILE")
+
+_SALT = secrets.token_bytes(16)
+
+
+class _CaptureFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.capture, separators=(",", ":"))
+
+
+def _subject(scope) -> Optional[str]:
+    """Salted short hash of whatever identifies the caller, if anything."""
+    material = b""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            material = value
+            break
+    if not material and scope.get("path_params"):
+        material = repr(sorted(scope["path_params"].items())).encode()
+    if not material:
+        return None
+    return hashlib.blake2b(material, key=_SALT, digest_size=4).hexdigest()
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    root_path = scope.get("root_path", "")
+    if root_path:
+        # Mounted sub-application (static files); the file name is not personal data
+        path = scope["path"]
+        return path if path.startswith(root_path) else root_path + path
+    return "<unmatched>"
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_started = monotonic()
+capture_logger = logging.getLogger("traffic.capture")
+
+
+def start_capture(path: str) -> None:
+    """Open the capture file and start its background writer."""
+    global _listener, _started
+    if _listener is not None:
+        return
+
+    writer = logging.FileHandler(path)
+    writer.setFormatter(_CaptureFormatter())
+    capture_queue: queue.Queue = queue.Queue(maxsize=50_000)
+
+    capture_logger.propagate = False
+    capture_logger.setLevel(logging.INFO)
+    capture_logger.handlers = [NonBlockingQueueHandler(capture_queue)]
+    _listener = logging.handlers.QueueListener(capture_queue, writer)
+    _listener.start()
+    _started = monotonic()
+
+
+def stop_capture() -> None:
+    """Flush pending lines to disk and stop the writer."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    capture_logger.handlers = []
+
+
+class TrafficCaptureMiddleware:
+    """ASGI middleware that records sanitized request shapes and timings."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _listener is None:
+            await self.app(scope, receive, send)
+            return
+
+        offset = monotonic() - _started
+        start = perf_counter()
+        status_code = 500
+        content_type = None
+        request_bytes = 0
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                request_bytes = int(value or 0)
+            elif name == b"content-type":
+                content_type = value.decode("latin-1").split(";")[0]
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            query = sorted({
+                pair.split(b"=", 1)[0].decode("latin-1")
+                for pair in scope.get("query_string", b"").split(b"&") if pair
+            })
+            capture_logger.info("capture", extra={"capture": {
+                "t": round(offset, 3),
+                "method": scope["method"],
+                "route": _route_template(scope),
+                "query": query,
+                "status": status_code,
+                "duration_ms": round((perf_counter() - start) * 1000, 2),
+                "request_bytes": request_bytes,
+                "content_type": content_type,
+                "subject": _subject(scope),
+            }})
@@ -0,0 +1,281 @@
+"""
+Response compression.
+
+``CompressionMiddleware`` negotiates brotli or gzip from ``Accept-Encoding``
+for dynamic responses:
+
+- a complete body smaller than ``COMPRESSION_MIN_SIZE`` is sent as is, the
+  saving would not pay for the CPU;
+- a streaming body (``more_body``) is compressed chunk by chunk and flushed
+  after each one, so exports start arriving before they are complete;
+- images, archives and anything already carrying ``Content-Encoding`` are
+  passed through.
+
+``PrecompressedStaticFiles`` serves ``<file>.br`` / ``<file>.gz`` sidecars
+next to static assets when the client accepts them, so static files are
+compressed once at build time instead of per request:
+
+    python -m utils.compression static
+
+Bytes in/out and the CPU time spent compressing go to ``utils.metrics``.
+
+Configuration (environment):
+    COMPRESSION               "false" disables dynamic compression (default true)
+    COMPRESSION_MIN_SIZE      smallest body worth compressing, bytes (default 1024)
+    COMPRESSION_GZIP_LEVEL    zlib level (default 6)
+    COMPRESSION_BROTLI_QUALITY  brotli quality for dynamic responses (default 4;
+                              sidecars use 11)
+"""
+import gzip
+import logging
+import os
+import sys
+import zlib
+from pathlib import Path
+from time import thread_time
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from utils.metrics import registry
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION = os.getenv("COMPRESSION", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Already compressed, or not worth it
+_INCOMPRESSIBLE_PREFIXES = ("image/", "video/", "audio/", "application/zip", "application/gzip",
+                            "application/x-gzip", "font/woff")
+
+responses_total = registry.counter(
+    "http_compressed_responses_total", "Responses compressed, by encoding and mode (buffered/streaming)")
+bytes_in_total = registry.counter(
+    "http_compression_bytes_in_total", "Uncompressed bytes fed to the compressor, by encoding")
+bytes_out_total = registry.counter(
+    "http_compression_bytes_out_total", "Compressed bytes produced, by encoding")
+cpu_seconds_total = registry.counter(
+    "http_compression_cpu_seconds_total", "CPU time spent compressing, by encoding")
+skipped_total = registry.counter(
+    "http_compression_skipped_total", "Responses not compressed, by reason")
+static_precompressed_total = registry.counter(
+    "http_static_precompressed_total", "Static files served from a precompressed sidecar, by encoding")
+
+
+def accepts(accept_encoding: str, encoding: str) -> bool:
+    """Whether ``Accept-Encoding`` allows ``encoding`` (q > 0, or via ``*``)."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported encoding the client accepts, brotli first."""
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepts(accept_encoding, encoding):
+            return encoding
+    return None
+
+
+class _Compressor:
+    """Streaming compressor with per-encoding metrics."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits=31: gzip container
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False, finish: bool = False) -> bytes:
+        started = thread_time()
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            if finish:
+                out += self._compressor.finish()
+            elif flush:
+                out += self._compressor.flush()
+        else:
+            out = self._compressor.compress(data)
+            if finish:
+                out += self._compressor.flush(zlib.Z_FINISH)
+            elif flush:
+                out += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        cpu_seconds_total.inc(thread_time() - started, encoding=self.encoding)
+        bytes_in_total.inc(len(data), encoding=self.encoding)
+        bytes_out_total.inc(len(out), encoding=self.encoding)
+        return out
+
+
+class CompressionMiddleware:
+    """Pure ASGI, so streaming responses stay streaming."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if message["status"] < 200 or message["status"] in (204, 304):
+                    reason = "status"
+                elif "content-encoding" in headers:
+                    reason = "encoded"
+                elif content_type.startswith(_INCOMPRESSIBLE_PREFIXES):
+                    reason = "content_type"
+                else:
+                    reason = None
+                if reason:
+                    passthrough = True
+                    skipped_total.inc(reason=reason)
+                    await send(message)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    # Whole body known and small: not worth compressing
+                    passthrough = True
+                    skipped_total.inc(reason="small")
+                    MutableHeaders(raw=start_message["headers"]).add_vary_header("Accept-Encoding")
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # A different representation must not share a strong ETag
+                    headers["ETag"] = f"W/{etag}"
+                if more_body:
+                    del headers["Content-Length"]
+                responses_total.inc(encoding=encoding, mode="streaming" if more_body else "buffered")
+
+                if not more_body:
+                    compressed = compressor.compress(body, finish=True)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send(start_message)
+
+            # Flush per chunk: each chunk of a stream reaches the client promptly
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, flush=more_body, finish=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_compressed)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that prefers ``.br`` / ``.gz`` sidecars the client accepts."""
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+
+        request_headers = Headers(scope=scope)
+        accept = request_headers.get("accept-encoding", "")
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if not accepts(accept, encoding):
+                continue
+            sidecar = f"{response.path}{suffix}"
+            try:
+                stat_result = os.stat(sidecar)
+            except OSError:
+                continue
+            static_precompressed_total.inc(encoding=encoding)
+            # The sidecar's own stat gives it a distinct ETag
+            sidecar_response = FileResponse(
+                sidecar,
+                stat_result=stat_result,
+                method=scope["method"],
+                media_type=response.media_type,
+                headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+            )
+            if self.is_not_modified(sidecar_response.headers, request_headers):
+                return NotModifiedResponse(sidecar_response.headers)
+            return sidecar_response
+
+        response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+
+# ========== BUILD-TIME SIDECARS ==========
+
+_PRECOMPRESS_SUFFIXES = {".js", ".css", ".html", ".svg", ".json", ".txt", ".xml", ".map", ".ico"}
+
+
+def precompress_directory(root: str, min_size: int = COMPRESSION_MIN_SIZE) -> int:
+    """Write .gz (and .br when brotli is installed) next to compressible files."""
+    written = 0
+    for path in Path(root).rglob("*"):
+        if not path.is_file() or path.suffix not in _PRECOMPRESS_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        if len(data) < min_size:
+            continue
+        sidecars = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            sidecars[".br"] = brotli.compress(data, quality=11)
+        for suffix, compressed in sidecars.items():
+            if len(compressed) < len(data):
+                Path(f"{path}{suffix}").write_bytes(compressed)
+                written += 1
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for directory in sys.argv[1:] or ["static"]:
+        logger.info("%s: %d sidecar files written", directory, precompress_directory(directory))
@@ -0,0 +1,58 @@
+"""
+Version-derived ETags for conditional GETs.
+
+ETags are computed from what identifies a version of the data (ids,
+``updated_at``, ``last_login``), never from the serialized body, so a
+matching ``If-None-Match`` is answered with 304 before any serialization.
+This relies on every write to a user setting ``updated_at`` (``last_login``
+is part of the version, so the buffered login flush need not).
+Responses carry ``Cache-Control: private, no-cache``: browsers keep the body
+but revalidate on every use, which is what makes them send ``If-None-Match``.
+"""
+from hashlib import blake2b
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def user_version(user) -> str:
+    """What changes whenever a user's public representation can change."""
+    if isinstance(user, dict):
+        # Projected users (sparse fieldsets)
+        return f"{user.get('id')}:{user.get('updated_at')}:{user.get('last_login')}"
+    return f"{user.id}:{user.updated_at}:{user.last_login}"
+
+
+def make_etag(parts: Iterable[str]) -> str:
+    digest = blake2b(digest_size=12)
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"|")
+    # Weak: the same version may be encoded differently (e.g. compressed)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_current(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names ``etag`` (weak comparison)."""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(",")}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
@@ -0,0 +1,121 @@
+"""
+Local verification of Google ID tokens.
+
+The ``openid`` scope makes Google's token endpoint return a signed
+``id_token`` next to the access token. Verifying it against Google's published
+signing keys gives us the same email/name/picture as the userinfo endpoint
+without a second round trip.
+
+Signing keys (JWKS) are cached in-process for as long as Google's
+``Cache-Control: max-age`` allows. Concurrent logins that find the cache
+stale share a single fetch, and an unknown ``kid`` (Google rotated keys)
+triggers at most one early refresh per ``MIN_REFRESH_INTERVAL``.
+"""
+import asyncio
+import logging
+import re
+from time import monotonic
+from typing import Dict, Optional
+
+import httpx
+import jwt
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+DEFAULT_KEYS_TTL = 3600  # seconds, when Google sends no usable max-age
+MIN_REFRESH_INTERVAL = 60  # seconds between refreshes forced by an unknown kid
+CLOCK_SKEW = 60  # seconds of leeway for exp / iat
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class GoogleTokenError(Exception):
+    """The ID token is malformed, expired, or not signed by Google for us."""
+
+
+class GoogleKeysUnavailable(Exception):
+    """Google's signing keys could not be fetched."""
+
+
+class GoogleIdTokenVerifier:
+    """Verifies Google ID tokens against a cached JWKS."""
+
+    def __init__(self, certs_url: str, audience: Optional[str]):
+        self.certs_url = certs_url
+        self.audience = audience
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def verify(self, client: httpx.AsyncClient, id_token: str) -> dict:
+        """Return the token's claims, or raise ``GoogleTokenError``."""
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError as e:
+            raise GoogleTokenError(f"Malformed ID token: {e}") from e
+
+        key = await self._get_key(client, header.get("kid"))
+        try:
+            claims = jwt.decode(
+                id_token,
+                key.key,
+                algorithms=["RS256"],
+                audience=self.audience,
+                leeway=CLOCK_SKEW,
+                options={"require": ["exp", "iat", "iss", "aud", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            raise GoogleTokenError(f"Invalid ID token: {e}") from e
+
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            raise GoogleTokenError(f"Unexpected issuer: {claims.get('iss')}")
+        return claims
+
+    async def _get_key(self, client: httpx.AsyncClient, kid: Optional[str]) -> jwt.PyJWK:
+        if monotonic() >= self._expires_at:
+            await self._refresh(client)
+        elif kid not in self._keys and monotonic() - self._fetched_at >= MIN_REFRESH_INTERVAL:
+            await self._refresh(client)
+
+        key = self._keys.get(kid)
+        if key is None:
+            raise GoogleTokenError(f"Unknown signing key: {kid}")
+        return key
+
+    async def _refresh(self, client: httpx.AsyncClient) -> None:
+        """Fetch the JWKS once, however many callers are waiting for it."""
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._fetch(client))
+            self._inflight.add_done_callback(self._clear_inflight)
+        # Shielded so a cancelled login does not abort the fetch for everyone else
+        await asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, task: asyncio.Task) -> None:
+        if self._inflight is task:
+            self._inflight = None
+
+    async def _fetch(self, client: httpx.AsyncClient) -> None:
+        try:
+            response = await client.get(self.certs_url)
+            response.raise_for_status()
+            key_set = jwt.PyJWKSet.from_dict(response.json())
+        except (httpx.HTTPError, ValueError, jwt.PyJWTError) as e:
+            if self._keys:
+                # Keep serving the old keys, retry after the minimum interval
+                logger.warning("Could not refresh Google signing keys: %s", e)
+                self._fetched_at = monotonic()
+                self._expires_at = self._fetched_at + MIN_REFRESH_INTERVAL
+                return
+            raise GoogleKeysUnavailable(str(e)) from e
+
+        ttl = DEFAULT_KEYS_TTL
+        match = _MAX_AGE.search(response.headers.get("cache-control", ""))
+        if match:
+            ttl = max(int(match.group(1)) - int(response.headers.get("age", "0") or 0), 0)
+
+        self._keys = {key.key_id: key for key in key_set.keys if key.key_id}
+        self._fetched_at = monotonic()
+        self._expires_at = self._fetched_at + ttl
+        logger.info("Fetched Google signing keys", extra={"kids": sorted(self._keys), "ttl_seconds": ttl})
@@ -0,0 +1,55 @@
+"""
+Shared outbound HTTP client.
+
+One ``httpx.AsyncClient`` is created in the app lifespan and reused by every
+request, so calls to Google reuse pooled keep-alive connections instead of
+paying for a new TCP + TLS handshake each time.
+
+Configuration (environment):
+    HTTP_CLIENT_HTTP2             "true" to negotiate HTTP/2 (needs the ``h2`` package)
+    HTTP_CLIENT_CONNECT_TIMEOUT   seconds to establish a connection (default 3)
+    HTTP_CLIENT_READ_TIMEOUT      seconds to wait for response data (default 10)
+    HTTP_CLIENT_MAX_CONNECTIONS   pool size (default 50)
+    HTTP_CLIENT_KEEPALIVE         idle connections kept open (default 20)
+"""
+import logging
+import os
+
+import httpx
+from fastapi import Request
+
+HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "false").lower() == "true"
+HTTP_CLIENT_CONNECT_TIMEOUT = float(os.getenv("HTTP_CLIENT_CONNECT_TIMEOUT", "3"))
+HTTP_CLIENT_READ_TIMEOUT = float(os.getenv("HTTP_CLIENT_READ_TIMEOUT", "10"))
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "50"))
+HTTP_CLIENT_KEEPALIVE = int(os.getenv("HTTP_CLIENT_KEEPALIVE", "20"))
+
+logger = logging.getLogger(__name__)
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build the pooled client used for all outbound calls."""
+    http2 = HTTP_CLIENT_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP_CLIENT_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(
+            HTTP_CLIENT_READ_TIMEOUT,
+            connect=HTTP_CLIENT_CONNECT_TIMEOUT,
+        ),
+        limits=httpx.Limits(
+            max_connections=HTTP_CLIENT_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_CLIENT_KEEPALIVE,
+        ),
+    )
+
+
+async def get_http_client(request: Request) -> httpx.AsyncClient:
+    """Dependency returning the app-scoped client created in the lifespan."""
+    return request.app.state.http_client
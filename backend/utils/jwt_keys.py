@@ -0,0 +1,99 @@
+"""
+Signing keys for access tokens.
+
+Keys are PEM files in ``JWT_KEYS_DIR`` named ``<kid>.pem``. Ed25519 keys sign
+with EdDSA, RSA keys with RS256. Private keys can sign and verify; public keys
+only verify, which is how a retired key stays valid until the tokens it signed
+expire. ``JWT_ACTIVE_KID`` picks the signing key, by default the last private
+key in name order, so date-prefixed file names rotate on their own:
+
+    openssl genpkey -algorithm ed25519 -out keys/2026-10.pem
+
+A single key can also be passed inline with ``JWT_PRIVATE_KEY`` (PEM) and
+``JWT_KEY_ID``, for hosts where mounting files is awkward.
+
+Every token carries its ``kid`` header and the public keys are published at
+``/.well-known/jwks.json``, so other services verify tokens locally. Without
+any configured key, tokens are signed HS256 with ``SECRET_KEY`` as before.
+"""
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+logger = logging.getLogger(__name__)
+
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+JWT_PRIVATE_KEY = os.getenv("JWT_PRIVATE_KEY")
+JWT_KEY_ID = os.getenv("JWT_KEY_ID", "default")
+
+
+class SigningKey:
+    def __init__(self, kid: str, key):
+        self.kid = kid
+        if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+            self.algorithm = "EdDSA"
+            self._jwk_algorithm = jwt.algorithms.OKPAlgorithm
+        elif isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+            self.algorithm = "RS256"
+            self._jwk_algorithm = jwt.algorithms.RSAAlgorithm
+        else:
+            raise ValueError(f"Unsupported key type for {kid}: {type(key).__name__}")
+
+        if hasattr(key, "public_key"):
+            self.private_key = key
+            self.public_key = key.public_key()
+        else:
+            self.private_key = None
+            self.public_key = key
+
+    @classmethod
+    def from_pem(cls, kid: str, pem: bytes) -> "SigningKey":
+        try:
+            key = serialization.load_pem_private_key(pem, password=None)
+        except ValueError:
+            key = serialization.load_pem_public_key(pem)
+        return cls(kid, key)
+
+    def jwk(self) -> dict:
+        jwk = json.loads(self._jwk_algorithm.to_jwk(self.public_key))
+        jwk.update({"kid": self.kid, "alg": self.algorithm, "use": "sig"})
+        return jwk
+
+
+class KeyRing:
+    def __init__(self, keys: Dict[str, SigningKey], active_kid: Optional[str] = None):
+        self.keys = keys
+        signers = sorted(kid for kid, key in keys.items() if key.private_key is not None)
+        self.active_kid = active_kid or (signers[-1] if signers else None)
+        if self.active_kid is not None and self.active_kid not in signers:
+            raise ValueError(f"No private key for active kid {self.active_kid!r}")
+
+    @classmethod
+    def from_env(cls) -> "KeyRing":
+        keys: Dict[str, SigningKey] = {}
+        if JWT_KEYS_DIR:
+            for path in sorted(Path(JWT_KEYS_DIR).glob("*.pem")):
+                keys[path.stem] = SigningKey.from_pem(path.stem, path.read_bytes())
+        if JWT_PRIVATE_KEY:
+            keys[JWT_KEY_ID] = SigningKey.from_pem(JWT_KEY_ID, JWT_PRIVATE_KEY.encode())
+
+        ring = cls(keys, JWT_ACTIVE_KID)
+        if ring.active_kid:
+            logger.info("Loaded JWT signing keys", extra={"kids": sorted(keys), "active_kid": ring.active_kid})
+        else:
+            logger.warning("No JWT signing keys configured, falling back to HS256 with SECRET_KEY")
+        return ring
+
+    @property
+    def active(self) -> Optional[SigningKey]:
+        return self.keys.get(self.active_kid) if self.active_kid else None
+
+    def jwks(self) -> dict:
+        return {"keys": [key.jwk() for key in self.keys.values()]}
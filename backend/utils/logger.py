@@ -0,0 +1,172 @@
+"""
+Structured, non-blocking logging.
+
+Application code logs through the standard ``logging`` module
+(``logger = logging.getLogger(__name__)``). ``configure_logging`` installs a
+single ``QueueHandler`` on the root logger, so a log call only builds a record
+and puts it on an in-memory queue; a background ``QueueListener`` thread does
+the JSON formatting and the actual write to stdout.
+
+Configuration (environment):
+    LOG_LEVEL       default level for the root logger (default INFO)
+    LOG_LEVELS      per-logger levels, e.g. "crud.user=WARNING,routers.auth=DEBUG"
+    LOG_SAMPLING    keep 1 in N records whose message starts with a prefix,
+                    e.g. "Login attempt=10"
+    LOG_FORMAT      "json" (default) or "text" for local development
+    LOG_QUEUE_SIZE  max queued records before new ones are dropped (default 10000)
+"""
+import atexit
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING")
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "Login attempt=10")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Attributes every LogRecord has; anything else was passed via ``extra=``
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _parse_pairs(spec: str) -> List[Tuple[str, str]]:
+    """Parse "a=1,b=2" into [("a", "1"), ("b", "2")], ignoring malformed entries."""
+    pairs = []
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.rsplit("=", 1)
+        if key.strip() and value.strip():
+            pairs.append((key.strip(), value.strip()))
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as one JSON object per line, including ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only 1 in N records for high-volume messages.
+
+    Matching is done on the unformatted message template (``record.msg``), so
+    "Login attempt with identifier: %r" matches the prefix "Login attempt"
+    regardless of the identifier. Sampled records carry ``sample_rate`` so the
+    original volume can be reconstructed downstream.
+    """
+
+    def __init__(self, rules: List[Tuple[str, int]]):
+        super().__init__()
+        self.rules = [(prefix, rate, itertools.count()) for prefix, rate in rules if rate > 1]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rules or not isinstance(record.msg, str):
+            return True
+        for prefix, rate, counter in self.rules:
+            if record.msg.startswith(prefix):
+                if next(counter) % rate:
+                    return False
+                record.sample_rate = rate
+                return True
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller.
+
+    Only the message interpolation happens on the calling thread; when the
+    queue is full the record is dropped and counted instead of waiting.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging() -> None:
+    """Install the queue handler on the root logger and start the writer thread."""
+    global _listener
+    if _listener is not None:
+        return
+
+    if LOG_FORMAT == "text":
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    else:
+        formatter = JsonFormatter()
+
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    sampling_rules = []
+    for prefix, rate in _parse_pairs(LOG_SAMPLING):
+        try:
+            sampling_rules.append((prefix, int(rate)))
+        except ValueError:
+            continue
+    handler.addFilter(SamplingFilter(sampling_rules))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+
+    levels: Dict[str, str] = dict(_parse_pairs(LOG_LEVELS))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+
+
+atexit.register(shutdown_logging)
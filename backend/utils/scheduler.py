@@ -0,0 +1,127 @@
+"""
+In-process job scheduler with a leader lock per job.
+
+Every instance runs the scheduler, and each job is polled every
+``SCHEDULER_POLL_SECONDS``. A job runs on whichever instance first takes its
+lock document in ``scheduler_locks`` once the job is due, so the fleet runs
+each job about once per interval however many instances there are:
+
+    {"_id": "purge-unverified-users", "owner": "host:1234:9f2c1a0b",
+     "locked_until": ..., "last_run_at": ..., "last_duration_ms": 812.4,
+     "last_result": "ok", "last_report": {"deleted": 1500, "batches": 3}}
+
+The lock is a lease (``SCHEDULER_LEASE_SECONDS``): if its holder dies
+mid-run, another instance takes the job over once the lease has expired.
+Jobs must therefore finish well within the lease, or be safe to run twice.
+
+Durations go to the ``scheduler_job_duration_seconds`` histogram, to the
+lock document and to the log.
+
+Configuration (environment):
+    SCHEDULER                 "false" disables all jobs on this instance (default true)
+    SCHEDULER_POLL_SECONDS    how often each job checks whether it is due (default 30)
+    SCHEDULER_LEASE_SECONDS   how long a lock is held before others may take over (default 600)
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.background import start_periodic
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER = os.getenv("SCHEDULER", "true").lower() == "true"
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", "30"))
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", "600"))
+
+job_duration_seconds = registry.histogram(
+    "scheduler_job_duration_seconds", "Scheduled job run time, by job",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 600)
+)
+job_runs_total = registry.counter("scheduler_job_runs_total", "Scheduled job runs on this instance, by job and result")
+
+
+@dataclass(frozen=True)
+class Job:
+    name: str
+    interval: float  # seconds between runs, fleet-wide
+    # Receives the database; may return a small report, stored with the lock and logged
+    func: Callable[..., Awaitable[Optional[dict]]]
+
+
+class Scheduler:
+    def __init__(self, jobs: List[Job], get_db: Callable[[], Awaitable]):
+        self.jobs = jobs
+        self.get_db = get_db
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def start(self) -> List[asyncio.Task]:
+        """One polling task per job; stop them with utils.background.stop_tasks."""
+        return [
+            start_periodic(f"job:{job.name}", min(SCHEDULER_POLL_SECONDS, job.interval),
+                           lambda job=job: self.run_if_due(job))
+            for job in self.jobs
+        ]
+
+    async def _acquire(self, db, job: Job, now: datetime) -> bool:
+        """Take the job's lock if it is due and nobody else holds it."""
+        try:
+            lock = await db.scheduler_locks.find_one_and_update(
+                {
+                    "_id": job.name,
+                    "locked_until": {"$lt": now},
+                    "$or": [
+                        {"last_run_at": None},
+                        {"last_run_at": {"$lte": now - timedelta(seconds=job.interval)}},
+                    ],
+                },
+                {"$set": {"owner": self.owner, "locked_until": now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The lock exists but is held, or the job is not due yet
+            return False
+        return lock is not None and lock.get("owner") == self.owner
+
+    async def run_if_due(self, job: Job) -> None:
+        db = await self.get_db()
+        started_at = datetime.utcnow()
+        if not await self._acquire(db, job, started_at):
+            return
+
+        started = perf_counter()
+        result, report = "ok", None
+        try:
+            report = await job.func(db)
+        except Exception as e:
+            result, report = "error", {"error": str(e)}
+            logger.error("Job %s failed: %s", job.name, e)
+        duration = perf_counter() - started
+
+        job_duration_seconds.observe(duration, job=job.name)
+        job_runs_total.inc(job=job.name, result=result)
+        logger.info("Job %s finished", job.name,
+                    extra={"result": result, "duration_ms": round(duration * 1000, 1), "report": report})
+
+        # Release; last_run_at is set on failures too, so a failing job is not retried in a tight loop
+        await db.scheduler_locks.update_one(
+            {"_id": job.name, "owner": self.owner},
+            {"$set": {
+                "locked_until": datetime.utcnow(),
+                "last_run_at": started_at,
+                "last_duration_ms": round(duration * 1000, 1),
+                "last_result": result,
+                "last_report": report,
+            }}
+        )
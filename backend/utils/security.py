@@ -1,15 +1,113 @@
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
+from functools import lru_cache
+from math import log2
+from time import perf_counter
+from typing import Optional
 import bcrypt  # Use bcrypt directly instead of passlib
+import jwt
+import logging
 import os
 
+from utils.admission import (
+    PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_MAX_QUEUE, PASSWORD_HASH_MAX_WAIT_SECONDS, AdmissionController
+)
+from utils.jwt_keys import KeyRing
+from utils.timing import timed
+
+logger = logging.getLogger(__name__)
+
 # Secret key for JWT - change this in production!
 SECRET_KEY = os.getenv("SECRET_KEY", "fhu5a0PfLz0zCKHk4Xg14Lk9jKMG2E5ybywuhwaaZp3NfE6d6shbw2")
 ALGORITHM = "HS256"
+# Accept HS256 tokens signed with SECRET_KEY. Keep this on after configuring
+# signing keys until the last HS256 token has expired, then turn it off.
+JWT_ACCEPT_HS256 = os.getenv("JWT_ACCEPT_HS256", "true").lower() == "true"
 # CHANGED: From 12000 minutes to 30 days (43,200 minutes)
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 ACCESS_TOKEN_EXPIRE_MINUTES = ACCESS_TOKEN_EXPIRE_DAYS * 24 * 60
 
+# Asymmetric signing keys, see utils/jwt_keys.py
+key_ring = KeyRing.from_env()
+
+# bcrypt work factor. Unless pinned with BCRYPT_ROUNDS it is calibrated at
+# startup so one hash takes about BCRYPT_TARGET_MS on this host, never below
+# the library default of 12: a fast host must not weaken existing hashes.
+# Hashes are only ever upgraded, so instances on different hardware do not
+# rehash back and forth; pin it to keep their costs equal.
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS")
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = 12
+BCRYPT_MAX_ROUNDS = 16
+# Cheap cost timed during calibration; each extra round doubles the time
+_CALIBRATION_ROUNDS = 8
+
+# bcrypt runs here, off the event loop and behind admission control (utils/admission.py)
+password_hashing = AdmissionController(
+    "password_hash",
+    concurrency=PASSWORD_HASH_CONCURRENCY,
+    max_queue=PASSWORD_HASH_MAX_QUEUE,
+    max_wait=PASSWORD_HASH_MAX_WAIT_SECONDS,
+    initial_service_seconds=BCRYPT_TARGET_MS / 1000,
+)
+
+# Stored as password_hash for accounts that sign in through Google only.
+# It is not a valid bcrypt hash, so no password can ever match it.
+UNUSABLE_PASSWORD = "!"
+
+def has_usable_password(hashed_password: str) -> bool:
+    """Whether the stored hash can be checked against a password at all"""
+    return bool(hashed_password) and hashed_password != UNUSABLE_PASSWORD
+
+def _time_hash_ms(rounds: int, samples: int) -> float:
+    """Fastest of ``samples`` hashes at ``rounds``, in milliseconds."""
+    salt = bcrypt.gensalt(rounds=rounds)
+    best = float("inf")
+    for _ in range(samples):
+        started = perf_counter()
+        bcrypt.hashpw(b"calibration password", salt)
+        best = min(best, (perf_counter() - started) * 1000)
+    return best
+
+def calibrate_bcrypt(target_ms: float = BCRYPT_TARGET_MS, samples: int = 3) -> dict:
+    """
+    Pick the bcrypt cost whose hash time on this host is closest to
+    ``target_ms``, within [BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS].
+    Returns the cost and the measured times (ms) by cost.
+    """
+    base_ms = _time_hash_ms(_CALIBRATION_ROUNDS, samples)
+    ideal = _CALIBRATION_ROUNDS + log2(target_ms / base_ms)
+    rounds = min(max(round(ideal), BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS)
+    return {
+        "rounds": rounds,
+        "target_ms": target_ms,
+        "measured_ms": {
+            _CALIBRATION_ROUNDS: round(base_ms, 2),
+            rounds: round(_time_hash_ms(rounds, 1), 2),
+        },
+    }
+
+@lru_cache(maxsize=1)
+def bcrypt_rounds() -> int:
+    """Cost for new hashes: BCRYPT_ROUNDS, or calibrated once per process."""
+    if BCRYPT_ROUNDS:
+        return int(BCRYPT_ROUNDS)
+    calibration = calibrate_bcrypt()
+    logger.info("Calibrated bcrypt cost", extra=calibration)
+    return calibration["rounds"]
+
+def bcrypt_cost(hashed_password: str) -> Optional[int]:
+    """Cost stored in a bcrypt hash ("$2b$12$..." -> 12), None if it is not one."""
+    parts = (hashed_password or "").split("$")
+    if len(parts) != 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a verified password is stored below the current cost and should be hashed again."""
+    cost = bcrypt_cost(hashed_password)
+    return cost is not None and cost < bcrypt_rounds()
+
+@timed("bcrypt")
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt with length handling"""
     # Convert to bytes and truncate if too long
@@ -17,13 +115,16 @@ def hash_password(password: str) -> str:
     if len(password_bytes) > 72:
         password_bytes = password_bytes[:72]
     
-    # Hash using bcrypt directly
-    salt = bcrypt.gensalt()
+    # Hash using bcrypt directly; the cost is stored in the hash itself
+    salt = bcrypt.gensalt(rounds=bcrypt_rounds())
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
+@timed("bcrypt")
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash using bcrypt with length handling"""
+    if not has_usable_password(hashed_password):
+        return False
     try:
         # Convert to bytes and truncate if too long
         password_bytes = plain_password.encode('utf-8')
@@ -36,9 +137,22 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         # Verify using bcrypt directly
         return bcrypt.checkpw(password_bytes, hash_bytes)
     except Exception as e:
-        print(f"❌ Password verification error: {e}")
+        logger.warning("Password verification error: %s", e)
         return False
 
+@timed("bcrypt")
+async def hash_password_async(password: str) -> str:
+    """``hash_password`` in the password hashing pool; raises ``Overloaded`` when it is saturated"""
+    return await password_hashing.run(hash_password, password)
+
+@timed("bcrypt")
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """``verify_password`` in the password hashing pool; raises ``Overloaded`` when it is saturated"""
+    if not has_usable_password(hashed_password):
+        return False
+    return await password_hashing.run(verify_password, plain_password, hashed_password)
+
+@timed("jwt")
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
@@ -48,12 +162,38 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
         expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    signer = key_ring.active
+    if signer is None:
+        return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, signer.private_key, algorithm=signer.algorithm, headers={"kid": signer.kid})
+
+def user_token_claims(user) -> dict:
+    """
+    Claims for a user's access token.
 
+    ``uid`` and ``ver`` (the user's token_version) let dependencies authorize
+    from the token alone; bumping token_version revokes every older token.
+    """
+    return {
+        "sub": user.email,
+        "role": user.role,
+        "username": user.username,
+        "uid": str(user.id),
+        "ver": user.token_version,
+    }
+
+@timed("jwt")
 def verify_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            if not JWT_ACCEPT_HS256:
+                return None
+            return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+        key = key_ring.keys.get(kid)
+        if key is None:
+            return None
+        return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+    except jwt.PyJWTError:
         return None
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Single-flight: concurrent callers asking for the same key share one call.
+
+The first caller (the leader) starts the call as a task, later callers with
+the same key await that task instead of starting their own. The task is
+shielded, so a caller that is cancelled (client disconnected) neither cancels
+the call for the others nor leaves them waiting on a cancelled task. The key
+is released as soon as the call finishes: results are not cached.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Result of ``func()``, and whether it was shared with an earlier caller."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.create_task(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._release(key, done))
+        return await asyncio.shield(task), shared
+
+    def _release(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieved even when every caller was cancelled, so it is not logged as lost
+            task.exception()
+
+    def forget(self, key: Hashable) -> None:
+        """Make later callers for ``key`` start a new call instead of joining the one in flight."""
+        self._calls.pop(key, None)
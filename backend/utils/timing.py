@@ -0,0 +1,191 @@
+"""
+Per-request phase timings.
+
+``ServerTimingMiddleware`` attaches a fresh ``RequestTimings`` to the request
+context; code on the request path wraps its expensive phases in ``span(name)``
+(or decorates them with ``@timed(name)``) and the accumulated durations are
+sent back as a ``Server-Timing`` header, which browser devtools display in the
+network panel's Timing tab:
+
+    Server-Timing: mongo;dur=4.1, bcrypt;dur=231.7, jwt;dur=0.3, app;dur=2.8, total;dur=238.9
+
+Spans record self time: the time spent in nested spans of another name
+(e.g. ``bcrypt`` inside ``create_user``'s ``mongo`` span) is subtracted from
+the outer one. Whatever is left over is reported as ``app`` (routing,
+validation and response serialization). Spans are re-entrant per name, so
+``create_user`` calling ``get_user_by_email`` is one ``mongo`` span. The open
+span is an immutable parent chain held in a ContextVar, so spans opened by
+concurrent tasks (``asyncio.gather``) nest under the span that started them
+without seeing each other; a parent is paused while any child is open, and
+concurrent children may add up to more than the wall time. Outside a request, spans are no-ops.
+
+The header is off by default: per-phase times such as ``bcrypt`` on /login
+tell a caller whether an account exists, so enable it for development and
+benchmarks only.
+
+Configuration (environment):
+    SERVER_TIMING             "true" sends the header (default false)
+    SERVER_TIMING_ACCESS_LOG  "true" logs one access record per request with
+                              the phase timings attached (default false)
+"""
+import asyncio
+import functools
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional
+
+from starlette.datastructures import MutableHeaders
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+SERVER_TIMING_ACCESS_LOG = os.getenv("SERVER_TIMING_ACCESS_LOG", "false").lower() == "true"
+
+access_logger = logging.getLogger("access")
+
+
+class RequestTimings:
+    """Accumulated span self times (milliseconds) for one request."""
+
+    __slots__ = ("durations",)
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+
+    def add(self, name: str, duration_ms: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + duration_ms
+
+    def header_value(self, total_ms: float) -> str:
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.durations.items()]
+        app_ms = max(total_ms - sum(self.durations.values()), 0.0)
+        parts.append(f"app;dur={app_ms:.1f}")
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+
+class _Span:
+    __slots__ = ("name", "parent", "children_ms", "_open_children", "_children_since")
+
+    def __init__(self, name: str, parent: Optional["_Span"]):
+        self.name = name
+        self.parent = parent
+        # Time during which at least one direct child span was open,
+        # subtracted from this span's own; overlapping children count once
+        self.children_ms = 0.0
+        self._open_children = 0
+        self._children_since = 0.0
+
+    def child_opened(self, now: float) -> None:
+        if self._open_children == 0:
+            self._children_since = now
+        self._open_children += 1
+
+    def child_closed(self, now: float) -> None:
+        self._open_children -= 1
+        if self._open_children == 0:
+            self.children_ms += (now - self._children_since) * 1000
+
+    def within(self, name: str) -> bool:
+        span = self
+        while span is not None:
+            if span.name == name:
+                return True
+            span = span.parent
+        return False
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+_open_span: ContextVar[Optional[_Span]] = ContextVar("open_span", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """Return the timings of the request being handled, if any."""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block and add it to the current request under ``name``."""
+    timings = _current.get()
+    parent = _open_span.get()
+    if timings is None or (parent is not None and parent.within(name)):
+        yield
+        return
+
+    frame = _Span(name, parent)
+    token = _open_span.set(frame)
+    start = perf_counter()
+    if parent is not None:
+        parent.child_opened(start)
+    try:
+        yield
+    finally:
+        now = perf_counter()
+        _open_span.reset(token)
+        timings.add(name, max((now - start) * 1000 - frame.children_ms, 0.0))
+        if parent is not None:
+            parent.child_closed(now)
+
+
+def timed(name: str):
+    """Decorator form of ``span`` for sync and async functions."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that collects spans and emits the ``Server-Timing`` header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (SERVER_TIMING or SERVER_TIMING_ACCESS_LOG):
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SERVER_TIMING:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", timings.header_value((perf_counter() - start) * 1000))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if SERVER_TIMING_ACCESS_LOG:
+                access_logger.info(
+                    "%s %s %s",
+                    scope["method"],
+                    scope["path"],
+                    status_code,
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status_code,
+                        "duration_ms": round((perf_counter() - start) * 1000, 1),
+                        "timings": {name: round(ms, 1) for name, ms in timings.durations.items()},
+                    }
+                )